@@ -1,19 +1,37 @@
 import dash
 from dash import dcc, html, dash_table, Input, Output
+from dash.exceptions import PreventUpdate
 import plotly.express as px
+import plotly.graph_objects as go
 import pandas as pd
+import numpy as np
 import os
+import sys
+from functools import lru_cache
 import folium
-from folium.plugins import HeatMap, MarkerCluster
+from folium.plugins import FastMarkerCluster, HeatMap
 from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from outils.arrets_scan import scan_arrets
+from outils.export_stream import arrow_path, read_result
+from outils.html_cache import cached_html
+from outils.resume_env_arrets import CO2_SERIES_COLLECTION, co2_trend_pipeline, has_stop_summaries
+from outils.result_cache import mongo_version, query_key
+from outils.ttl_cache import TTLCache
+from outils.tuiles_co2 import HEAT_TILES_COLLECTION, heat_cells
 
 # --- CONFIGURATION DES CHEMINS ---
 DATA_DIR = "requetes_mongodb/resultat_requetes_mongodb"
 
+@lru_cache(maxsize=None)
 def load(file):
+    """Résultat d'une requête MongoDB, lu une seule fois (ne pas modifier le DataFrame renvoyé)."""
     path = os.path.join(DATA_DIR, file)
-    if os.path.exists(path):
-        return pd.read_csv(path)
+    # Fichier Arrow (--arrow) en mémoire projetée, sinon CSV ou export compressé (--gzip)
+    if any(os.path.exists(p) for p in (path, path + ".gz", arrow_path(path))):
+        return read_result(path)
     else:
         print(f"⚠️ Fichier introuvable : {path}")
     return pd.DataFrame()
@@ -22,45 +40,84 @@ def load(file):
 MONGO_URI = "mongodb://localhost:27017/"
 DB_NAME = "Paris2055"
 
-try:
-    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=2000)
+# Le client ne se connecte qu'à la première requête : le serveur Dash démarre sans attendre MongoDB
+client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=2000)
+
+@lru_cache(maxsize=None)
+def get_db():
+    """Base MongoDB, ou None si le serveur est injoignable (testé une seule fois, au premier besoin)."""
+    try:
+        client.server_info()
+    except Exception:
+        print("⚠️ Attention : Impossible de se connecter à MongoDB.")
+        return None
     db = client[DB_NAME]
-    client.server_info()
-except:
-    db = None
-    print("⚠️ Attention : Impossible de se connecter à MongoDB.")
+    # Base chargée avant l'ajout des moyennes et séries CO2 par arrêt : le tableau de bord
+    # ne modifie pas la base, le calcul se lance à part (et enregistre une version des données)
+    if not has_stop_summaries(db):
+        print("⚠️ Moyennes et séries CO2 par arrêt absentes : lancer python outils/resume_env_arrets.py")
+    return db
 
 # =============================================================================
-# PRÉ-CHARGEMENT ET OPTIMISATIONS
+# PRÉ-CALCULS (à la première utilisation, puis à chaque nouvelle version des données)
 # =============================================================================
-
-LINE_VEHICLE_MAP = {}
-STOP_COUNTS_MAP = {}
-
-if db is not None:
-    # 1. Map Ligne -> Véhicule
-    vehs = list(db.Vehicules.find({}, {"id_ligne": 1, "type_vehicule": 1}))
-    for v in vehs:
-        if v["id_ligne"] not in LINE_VEHICLE_MAP:
-            LINE_VEHICLE_MAP[v["id_ligne"]] = v["type_vehicule"]
-
-    # 2. Map Hubs (Correspondances)
-    print("Pré-calcul des correspondances...")
+SUPERVISION_INPUTS = ["Arrets", "Vehicules"]
+
+def supervision_data_version():
+    """Dernier chargement MongoDB et nombre de documents lus par l'onglet Supervision."""
+    db = get_db()
+    if db is None: return None
+    return query_key(mongo_version(db, SUPERVISION_INPUTS), None)
+
+ENVIRONNEMENT_INPUTS = ["Arrets", "Quartiers", HEAT_TILES_COLLECTION]
+
+def environnement_data_version():
+    """Dernier chargement MongoDB et nombre de documents lus par l'onglet Environnement."""
+    db = get_db()
+    if db is None: return None
+    return query_key(mongo_version(db, ENVIRONNEMENT_INPUTS), None)
+
+def get_line_vehicle_map():
+    """Map Ligne -> Véhicule (version courante des données)"""
+    return load_line_vehicle_map(supervision_data_version())
+
+def get_stop_counts_map():
+    """Map Hubs (version courante des données)"""
+    return load_stop_counts_map(supervision_data_version())
+
+# `version` ne sert qu'à la clé du cache : un rechargement MongoDB provoque un nouveau calcul
+@lru_cache(maxsize=2)
+def load_line_vehicle_map(version):
+    """Map Ligne -> Véhicule"""
+    db = get_db()
+    line_vehicle_map = {}
+    if db is None: return line_vehicle_map
+    for v in db.Vehicules.find({}, {"id_ligne": 1, "type_vehicule": 1}):
+        if v["id_ligne"] not in line_vehicle_map:
+            line_vehicle_map[v["id_ligne"]] = v["type_vehicule"]
+    return line_vehicle_map
+
+@lru_cache(maxsize=2)
+def load_stop_counts_map(version):
+    """Map Hubs (Correspondances) : nombre de lignes desservant chaque nom d'arrêt"""
+    db = get_db()
+    if db is None: return {}
     pipeline_global_count = [
         {"$group": {"_id": "$nom", "lignes_ids": {"$addToSet": "$id_ligne"}}},
         {"$project": {"nom": "$_id", "nb_lignes": {"$size": "$lignes_ids"}}}
     ]
     counts = list(db.Arrets.aggregate(pipeline_global_count))
-    STOP_COUNTS_MAP = {c["nom"]: c["nb_lignes"] for c in counts}
-    print("Terminé.")
+    return {c["nom"]: c["nb_lignes"] for c in counts}
 
 def get_vehicle_options():
-    if not LINE_VEHICLE_MAP: return []
-    types = sorted(list(set(LINE_VEHICLE_MAP.values())))
+    line_vehicle_map = get_line_vehicle_map()
+    if not line_vehicle_map: return []
+    types = sorted(list(set(line_vehicle_map.values())))
     return [{"label": t, "value": t} for t in types]
 
 # --- FONCTIONS DE RÉCUPÉRATION DES DONNÉES MONGODB ---
 def get_liste_lignes():
+    db = get_db()
     if db is None: return []
     try:
         lignes = list(db.Lignes.find({}, {"id_ligne": 1, "nom_ligne": 1, "_id": 0}).sort("nom_ligne", 1))
@@ -68,96 +125,231 @@ def get_liste_lignes():
     except:
         return []
 
-def get_filtered_data(id_ligne=None, vehicle_type=None, co2_level='all'):
-    """Récupère les données filtrées pour la carte et le tableau"""
-    if db is None: return pd.DataFrame()
+# Filtre du menu "Niveau de CO₂" : plages sur co2_avg (index), un arrêt sans capteur CO2 compte pour 0
+CO2_LEVELS = {
+    "low": {"$or": [{"co2_avg": {"$lte": 400}}, {"co2_avg": None}]},
+    "medium": {"co2_avg": {"$gte": 400, "$lte": 480}},
+    "high": {"co2_avg": {"$gt": 480}},
+}
 
+def supervision_match(id_ligne=None, vehicle_type=None, co2_level='all'):
+    """Filtre Arrets des menus Ligne / Véhicule / Niveau de CO₂ (None si la combinaison est vide)."""
     match_stage = {}
     
     # Filtres Ligne & Véhicule
     target_lignes = []
     if vehicle_type:
-        target_lignes = [lid for lid, vtype in LINE_VEHICLE_MAP.items() if vtype == vehicle_type]
+        target_lignes = [lid for lid, vtype in get_line_vehicle_map().items() if vtype == vehicle_type]
         if id_ligne:
             if id_ligne in target_lignes:
                 match_stage["id_ligne"] = id_ligne
             else:
-                return pd.DataFrame() 
+                return None
         else:
             match_stage["id_ligne"] = {"$in": target_lignes}
     elif id_ligne:
         match_stage["id_ligne"] = id_ligne
 
+    if co2_level in CO2_LEVELS:
+        match_stage = {"$and": [match_stage, CO2_LEVELS[co2_level]]}
+    return match_stage
+
+def get_filtered_data(id_ligne=None, vehicle_type=None, co2_level='all'):
+    """Récupère les données filtrées pour la carte et le tableau"""
+    db = get_db()
+    if db is None: return pd.DataFrame()
+
+    match_stage = supervision_match(id_ligne, vehicle_type, co2_level)
+    if match_stage is None: return pd.DataFrame()
+
+    # Moyennes stockées sur chaque arrêt (outils/resume_env_arrets.py) : seule une ligne par arrêt est renvoyée
     pipeline = [
         {"$match": match_stage},
-        {"$project": {"nom": 1, "location": 1, "quartiers": 1, "capteurs": 1, "id_ligne": 1}}
+        {"$project": {
+            "_id": 0, "id_arret": 1, "nom": 1, "id_ligne": 1, "location": 1,
+            "quartier": {"$ifNull": [{"$arrayElemAt": ["$quartiers.nom", 0]}, "Inconnu"]},
+            "co2": {"$ifNull": ["$co2_avg", 0]},
+            "bruit": "$bruit_avg",
+            "temp": "$temp_avg",
+        }},
     ]
-    
+
     data = list(db.Arrets.aggregate(pipeline))
     if not data: return pd.DataFrame()
 
+    # Une seule lecture des maps par appel (et non par arrêt)
+    stop_counts_map, line_vehicle_map = get_stop_counts_map(), get_line_vehicle_map()
     formatted = []
     for d in data:
-        co2, bruit, temp = 0, None, None
-        
-        if "capteurs" in d:
-            for c in d["capteurs"]:
-                mesures = c.get("mesures", [])
-                if mesures:
-                    avg = sum(m["valeur"] for m in mesures) / len(mesures)
-                    ctype = c.get("type_capteur", "")
-                    if "CO2" in ctype: co2 = avg
-                    elif "Bruit" in ctype or "db" in ctype.lower(): bruit = avg
-                    elif "Temp" in ctype: temp = avg
-        
-        # Filtre CO2 Python
-        keep = True
-        if co2_level != 'all' and co2_level is not None:
-            if co2_level == "low" and co2 > 400: keep = False
-            elif co2_level == "medium" and not (400 <= co2 <= 480): keep = False
-            elif co2_level == "high" and co2 <= 480: keep = False
-        
-        if keep:
-            quartier = d["quartiers"][0]["nom"] if d.get("quartiers") else "Inconnu"
-            nb_lines = STOP_COUNTS_MAP.get(d.get("nom"), 1)
-            v_type = LINE_VEHICLE_MAP.get(d["id_ligne"], "Inconnu")
-
-            formatted.append({
-                "Arrêt": d.get("nom", "Inconnu"),
-                "Quartier": quartier,
-                "Type Véhicule": v_type,
-                "Nb Lignes": nb_lines,
-                "Latitude": d["location"]["coordinates"][1],
-                "Longitude": d["location"]["coordinates"][0],
-                "CO2 (ppm)": round(co2, 1),
-                "Bruit (dB)": round(bruit, 1) if bruit else None,
-                "Temp (°C)": round(temp, 1) if temp else None
-            })
+        co2, bruit, temp = d["co2"], d.get("bruit"), d.get("temp")
+        nb_lines = stop_counts_map.get(d.get("nom"), 1)
+        v_type = line_vehicle_map.get(d["id_ligne"], "Inconnu")
+
+        formatted.append({
+            "id_arret": d["id_arret"],
+            "Arrêt": d.get("nom", "Inconnu"),
+            "Quartier": d["quartier"],
+            "Type Véhicule": v_type,
+            "Nb Lignes": nb_lines,
+            "Latitude": d["location"]["coordinates"][1],
+            "Longitude": d["location"]["coordinates"][0],
+            "CO2 (ppm)": round(co2, 1),
+            "Bruit (dB)": round(bruit, 1) if bruit else None,
+            "Temp (°C)": round(temp, 1) if temp else None
+        })
         
     return pd.DataFrame(formatted)
 
-def get_trend_for_stops(stop_names=None):
-    """Récupère la tendance CO2 uniquement pour une liste d'arrêts donnée."""
-    if db is None: return pd.DataFrame()
-    
-    match_stage = {}
-    if stop_names is not None:
-        match_stage = {"nom": {"$in": stop_names}}
+# --- CARTE DYNAMIQUE : seuls les arrêts de la zone visible sont chargés ---
+# Vue initiale : Paris ; coins [lon, lat] dans l'ordre haut-gauche, haut-droit, bas-droit, bas-gauche
+VIEWPORT_DEFAULT = {"zoom": 11, "coordinates": [[2.22, 48.92], [2.47, 48.92], [2.47, 48.80], [2.22, 48.80]]}
+MAX_VIEWPORT_STOPS = 500  # au-delà, les arrêts sont regroupés par cellule côté serveur
+CLUSTER_CELLS_PER_TILE = 8  # cellules par tuile de carte (256 px) sur chaque axe
+
+def viewport_from_relayout(relayout):
+    """Zoom et coins de la zone visible d'après relayoutData de la carte (None si absents)."""
+    if not relayout or "map._derived" not in relayout or "map.zoom" not in relayout:
+        return None
+    return {"zoom": relayout["map.zoom"], "coordinates": relayout["map._derived"]["coordinates"]}
+
+def viewport_bounds(viewport):
+    """
+    (lon_min, lat_min, lon_max, lat_max) de la zone visible, ramenés dans [-180, 180] x [-90, 90] :
+    les coins calculés par plotly ne sont pas normalisés (zoom arrière, passage de l'antiméridien).
+    None si la zone couvre 180° de longitude ou plus : les côtés d'un polygone $geoWithin
+    y sont des géodésiques, la zone n'est alors plus filtrée.
+    """
+    lons, lats = zip(*viewport["coordinates"])
+    lon_min, lon_max = max(min(lons), -180), min(max(lons), 180)
+    lat_min, lat_max = max(min(lats), -90), min(max(lats), 90)
+    if lon_max - lon_min >= 180:
+        return None
+    return lon_min, lat_min, lon_max, lat_max
+
+def get_viewport_stops(viewport, id_ligne=None, vehicle_type=None, co2_level='all'):
+    """
+    Arrêts filtrés de la zone visible ($geoWithin sur l'index 2dsphere de location).
+    Renvoie (DataFrame, nombre d'arrêts dans la zone) ; au-delà de MAX_VIEWPORT_STOPS,
+    une ligne par cellule de grille (taille fonction du zoom) avec le nombre d'arrêts.
+    """
+    db = get_db()
+    match_stage = supervision_match(id_ligne, vehicle_type, co2_level) if db is not None else None
+    if match_stage is None: return pd.DataFrame(), 0
+
+    bounds = viewport_bounds(viewport)
+    if bounds is not None:
+        lon_min, lat_min, lon_max, lat_max = bounds
+        ring = [[lon_min, lat_max], [lon_max, lat_max], [lon_max, lat_min], [lon_min, lat_min], [lon_min, lat_max]]
+        match_stage = {"$and": [match_stage, {"location": {"$geoWithin": {"$geometry": {"type": "Polygon", "coordinates": [ring]}}}}]}
+    n_stops = db.Arrets.count_documents(match_stage)
+
+    if n_stops <= MAX_VIEWPORT_STOPS:
+        pipeline = [
+            {"$match": match_stage},
+            {"$project": {"_id": 0, "nom": 1, "lat": "$latitude", "lon": "$longitude",
+                          "co2": {"$ifNull": ["$co2_avg", 0]}, "nb_arrets": {"$literal": 1}}},
+        ]
+    else:
+        cell = 360 / 2 ** viewport["zoom"] / CLUSTER_CELLS_PER_TILE
+        pipeline = [
+            {"$match": match_stage},
+            {"$group": {
+                "_id": {"x": {"$floor": {"$divide": ["$longitude", cell]}}, "y": {"$floor": {"$divide": ["$latitude", cell]}}},
+                "nb_arrets": {"$sum": 1},
+                "lat": {"$avg": "$latitude"},
+                "lon": {"$avg": "$longitude"},
+                "co2": {"$avg": {"$ifNull": ["$co2_avg", 0]}},
+            }},
+            {"$project": {"_id": 0, "nom": {"$concat": [{"$toString": "$nb_arrets"}, " arrêt(s)"]},
+                          "lat": 1, "lon": 1, "co2": 1, "nb_arrets": 1}},
+        ]
+    return pd.DataFrame(list(db.Arrets.aggregate(pipeline))), n_stops
+
+def create_viewport_figure(df, n_stops, heat=None):
+    """Arrêts (ou groupes) de la zone visible, sur la couche de chaleur des cellules `heat`."""
+    columns = ["nom", "lat", "lon", "co2", "nb_arrets"]
+    clustered = n_stops > MAX_VIEWPORT_STOPS
+    fig = px.scatter_map(
+        df if not df.empty else pd.DataFrame(columns=columns),
+        lat="lat", lon="lon", color="co2", size="nb_arrets", hover_name="nom",
+        hover_data={"co2": ":.1f", "nb_arrets": True, "lat": False, "lon": False},
+        color_continuous_scale=["green", "orange", "red", "darkred"], range_color=[350, 550],
+        size_max=30 if clustered else 8,
+        labels={"co2": "CO₂ moyen (ppm)", "nb_arrets": "Arrêts"},
+        title=f"{n_stops} arrêt(s) dans la zone visible" + (" (regroupés)" if clustered else ""),
+    )
+    if heat:
+        lat, lon, poids = zip(*heat)
+        # Chaleur sous les marqueurs : première trace
+        fig.add_trace(go.Densitymap(lat=lat, lon=lon, z=poids, radius=25, opacity=0.5, showscale=False,
+                                    hoverinfo="skip", colorscale="YlOrRd", name="Densité CO₂"))
+        fig.data = fig.data[-1:] + fig.data[:-1]
+    # uirevision : la vue (centre, zoom) choisie par l'utilisateur est conservée entre deux mises à jour
+    fig.update_layout(
+        map_style="carto-positron", map_zoom=VIEWPORT_DEFAULT["zoom"], map_center={"lat": 48.8566, "lon": 2.3522},
+        uirevision="viewport", margin=dict(l=0, r=0, t=40, b=0),
+    )
+    return fig
 
-    pipeline = [
-        {"$match": match_stage},
-        {"$unwind": "$capteurs"},
-        {"$match": {"capteurs.type_capteur": "CO2"}},
-        {"$unwind": "$capteurs.mesures"},
-        {"$group": {
-            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$capteurs.mesures.horodatage"}}, 
-            "avg_co2": {"$avg": "$capteurs.mesures.valeur"}
-        }},
-        {"$sort": {"_id": 1}}
-    ]
-    data = list(db.Arrets.aggregate(pipeline))
+def get_trend_for_stops(id_arrets=None):
+    """Tendance CO2 journalière d'une sélection d'arrêts (None : tout le réseau), sur les séries précalculées."""
+    db = get_db()
+    if db is None: return pd.DataFrame()
+    data = list(db[CO2_SERIES_COLLECTION].aggregate(co2_trend_pipeline(id_arrets)))
     return pd.DataFrame(data).rename(columns={"_id": "Date", "avg_co2": "Moyenne CO2"})
 
+# --- MARQUEURS RENDUS PAR LE NAVIGATEUR ---
+# Les arrêts sont envoyés une seule fois sous forme de tableau JSON (FastMarkerCluster) ;
+# le navigateur crée les marqueurs, et chaque popup n'est construit qu'à son ouverture.
+ESCAPE_JS = """var esc = function (v) {
+        return String(v).replace(/[&<>"]/g, function (c) { return {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;"}[c]; });
+    };"""
+
+# Ligne : [lat, lon, couleur, icône, arrêt, quartier, type véhicule, nb lignes, bruit, co2]
+SUPERVISION_MARKER_JS = """function (row) {
+    %s
+    var marker = L.marker(new L.LatLng(row[0], row[1]), {
+        icon: L.AwesomeMarkers.icon({markerColor: row[2], iconColor: "white", icon: row[3], prefix: "fa"})
+    });
+    marker.bindTooltip(esc(row[4]) + " (" + row[9] + " ppm)");
+    marker.bindPopup(function () {
+        return '<div style="font-family: Arial; width: 200px;">'
+            + '<h4 style="margin: 0; color: #2c3e50;">' + esc(row[4]) + '</h4>'
+            + '<span style="font-size: 0.8em; color: gray;">' + esc(row[5]) + '</span>'
+            + '<hr style="margin: 5px 0;">'
+            + '<b>🚍 Type :</b> ' + esc(row[6]) + '<br>'
+            + '<b>🔢 Lignes :</b> ' + row[7] + '<br>'
+            + '<b>🔊 Bruit :</b> ' + (row[8] === null ? 'N/A' : row[8]) + ' dB<br><br>'
+            + '<span style="color: ' + row[2] + ';"><b>🌫️ CO₂ : ' + row[9] + ' ppm</b></span>'
+            + '</div>';
+    }, {maxWidth: 250});
+    return marker;
+}""" % ESCAPE_JS
+
+# Ligne : [lat, lon, couleur, arrêt, ligne, co2, bruit, temp]
+DETAILS_MARKER_JS = """function (row) {
+    %s
+    var fmt = function (v) { return v === null ? 'N/A' : v.toFixed(1); };
+    var marker = L.marker(new L.LatLng(row[0], row[1]), {
+        icon: L.AwesomeMarkers.icon({markerColor: row[2], iconColor: "white", icon: "bus", prefix: "fa"})
+    });
+    marker.bindPopup(function () {
+        return "<div style='font-family: Arial; font-size: 12px; width: 160px;'>"
+            + "<b>" + esc(row[3]) + "</b><br>"
+            + "Ligne: " + esc(row[4]) + "<br><hr>"
+            + "🌫️ CO2: " + fmt(row[5]) + "<br>"
+            + "🔊 Bruit: " + fmt(row[6]) + " dB<br>"
+            + "🌡️ Temp: " + fmt(row[7]) + " °C"
+            + "</div>";
+    }, {maxWidth: 200});
+    return marker;
+}""" % ESCAPE_JS
+
+def marker_rows(df, columns):
+    """Lignes JSON des marqueurs (NaN -> null)."""
+    sub = df[columns].astype(object)
+    return sub.where(sub.notna(), None).values.tolist()
+
 def create_interactive_map(df_line):
     if df_line.empty:
         return folium.Map(location=[48.8566, 2.3522], zoom_start=12)._repr_html_()
@@ -165,115 +357,71 @@ def create_interactive_map(df_line):
     center_lat = df_line["Latitude"].mean()
     center_lon = df_line["Longitude"].mean()
     m = folium.Map(location=[center_lat, center_lon], zoom_start=12, tiles="cartodbpositron")
-    
-    marker_cluster = MarkerCluster(name="Arrêts").add_to(m)
-
-    for _, row in df_line.iterrows():
-        val_co2 = row['CO2 (ppm)']
-        color = "green"
-        if val_co2 > 400: color = "orange"
-        if val_co2 > 480: color = "red"
-        if val_co2 > 550: color = "darkred"
-        
-        icon_type = "exchange" if row['Nb Lignes'] > 1 else "bus"
-        
-        popup_html = f"""
-        <div style="font-family: Arial; width: 200px;">
-            <h4 style="margin: 0; color: #2c3e50;">{row['Arrêt']}</h4>
-            <span style="font-size: 0.8em; color: gray;">{row['Quartier']}</span>
-            <hr style="margin: 5px 0;">
-            <b>🚍 Type :</b> {row['Type Véhicule']}<br>
-            <b>🔢 Lignes :</b> {row['Nb Lignes']}<br>
-            <b>🔊 Bruit :</b> {row['Bruit (dB)'] or 'N/A'} dB<br>
-            <br>
-            <span style="color: {color};"><b>🌫️ CO₂ : {val_co2} ppm</b></span>
-        </div>
-        """
-        
-        folium.Marker(
-            location=[row['Latitude'], row['Longitude']],
-            popup=folium.Popup(popup_html, max_width=250),
-            icon=folium.Icon(color=color, icon=icon_type, prefix="fa"),
-            tooltip=f"{row['Arrêt']} ({val_co2} ppm)"
-        ).add_to(marker_cluster)
+
+    df = df_line.copy()
+    val_co2 = df["CO2 (ppm)"]
+    df["couleur"] = np.select([val_co2 > 550, val_co2 > 480, val_co2 > 400], ["darkred", "red", "orange"], "green")
+    df["icone"] = np.where(df["Nb Lignes"] > 1, "exchange", "bus")
+    rows = marker_rows(df, ["Latitude", "Longitude", "couleur", "icone", "Arrêt", "Quartier",
+                            "Type Véhicule", "Nb Lignes", "Bruit (dB)", "CO2 (ppm)"])
+    FastMarkerCluster(rows, callback=SUPERVISION_MARKER_JS, name="Arrêts").add_to(m)
         
     return m._repr_html_()
 
-def get_heatmap_data():
+# Résultats de l'onglet Supervision par (ligne, véhicule, niveau CO2, version des données)
+SUPERVISION_CACHE = TTLCache(maxsize=64, ttl=600)
+
+# Choroplèthe : parcours d'Arrets (outils/arrets_scan.py)
+def get_arrets_scan():
+    return load_arrets_scan(environnement_data_version())
+
+# `version` ne sert qu'à la clé du cache : un rechargement MongoDB provoque un nouveau parcours
+@lru_cache(maxsize=2)
+def load_arrets_scan(version):
+    db = get_db()
+    if db is None: return {}
+    return scan_arrets(db, ["co2_quartier"])
+
+# Niveau de la pyramide TuilesCO2 pour la carte de chaleur Folium (vue initiale : zoom 12)
+HEATMAP_ZOOM = 12
+
+def get_heatmap_data(zoom=HEATMAP_ZOOM, bounds=None):
+    """Points [lat, lon, poids] de la carte de chaleur : une cellule de la pyramide par point, pas un arrêt."""
+    db = get_db()
     if db is None: return []
-    pipeline = [
-        {"$match": {"location": {"$ne": None}}},
-        {"$unwind": "$capteurs"},
-        {"$match": {"capteurs.type_capteur": {"$regex": "CO2|Pollution", "$options": "i"}}},
-        {"$unwind": "$capteurs.mesures"},
-        {"$group": {
-            "_id": "$_id",
-            "lat": {"$first": {"$arrayElemAt": ["$location.coordinates", 1]}},
-            "lon": {"$first": {"$arrayElemAt": ["$location.coordinates", 0]}},
-            "valeur": {"$avg": "$capteurs.mesures.valeur"}
-        }}
-    ]
-    data = list(db.Arrets.aggregate(pipeline))
-    return [[d['lat'], d['lon'], d['valeur']] for d in data if d['valeur'] > 0]
+    return [[c["lat"], c["lon"], c["somme_co2"]] for c in heat_cells(db, zoom, bounds) if c["somme_co2"] > 0]
 
 def get_arrets_full_details():
+    """Marqueurs de la carte combinée : moyennes stockées sur chaque arrêt, sans relire les mesures."""
+    db = get_db()
     if db is None: return pd.DataFrame()
-    cursor = db.Arrets.find({"location": {"$ne": None}})
-    data = []
-    for arret in cursor:
-        co2, bruit, temp = None, None, None
-        if "capteurs" in arret:
-            for c in arret["capteurs"]:
-                ctype = c.get("type_capteur", "")
-                measures = c.get("mesures", [])
-                if measures:
-                    avg = sum(m["valeur"] for m in measures) / len(measures)
-                    if "CO2" in ctype: co2 = avg
-                    elif "Bruit" in ctype: bruit = avg
-                    elif "Temp" in ctype: temp = avg
-        nom_final = arret.get("nom_arret") or arret.get("nom") or "Arrêt sans nom"
-        data.append({
-            "nom": nom_final,
-            "lat": arret["location"]["coordinates"][1],
-            "lon": arret["location"]["coordinates"][0],
-            "ligne": arret.get("id_ligne", "N/A"),
-            "co2": co2,
-            "bruit": bruit,
-            "temp": temp
-        })
-    return pd.DataFrame(data)
-
-def get_co2_by_quartier():
-    """Récupère le niveau moyen de CO₂ par quartier depuis MongoDB"""
-    if db is None: 
-        return pd.DataFrame()
-    
     pipeline = [
-        {"$unwind": "$quartiers"},
-        {"$unwind": "$capteurs"},
-        {"$match": {"capteurs.type_capteur": {"$regex": "CO2", "$options": "i"}}},
-        {"$unwind": "$capteurs.mesures"},
-        {"$group": {
-            "_id": {
-                "id_quartier": "$quartiers.id_quartier",
-                "nom_quartier": "$quartiers.nom"
-            },
-            "avg_co2": {"$avg": "$capteurs.mesures.valeur"}
-        }},
+        {"$match": {"location": {"$ne": None}}},
         {"$project": {
             "_id": 0,
-            "id_quartier": "$_id.id_quartier",
-            "nom_quartier": "$_id.nom_quartier",
-            "avg_co2": 1
+            "nom": {"$ifNull": ["$nom_arret", {"$ifNull": ["$nom", "Arrêt sans nom"]}]},
+            "lat": {"$arrayElemAt": ["$location.coordinates", 1]},
+            "lon": {"$arrayElemAt": ["$location.coordinates", 0]},
+            "ligne": {"$ifNull": ["$id_ligne", "N/A"]},
+            # null si les moyennes n'ont pas encore été calculées (outils/resume_env_arrets.py)
+            "co2": {"$ifNull": ["$co2_avg", None]},
+            "bruit": {"$ifNull": ["$bruit_avg", None]},
+            "temp": {"$ifNull": ["$temp_avg", None]},
         }},
-        {"$sort": {"avg_co2": -1}}
     ]
+    return pd.DataFrame(list(db.Arrets.aggregate(pipeline)))
+
+def get_co2_by_quartier():
+    """Récupère le niveau moyen de CO₂ par quartier depuis MongoDB"""
+    db = get_db()
+    if db is None: 
+        return pd.DataFrame()
     
-    data = list(db.Arrets.aggregate(pipeline))
-    return pd.DataFrame(data)
+    return pd.DataFrame(get_arrets_scan()["co2_quartier"])
 
 def get_quartiers_geojson():
     """Récupère les données GeoJSON des quartiers depuis MongoDB"""
+    db = get_db()
     if db is None:
         return {
             "type": "FeatureCollection",
@@ -401,66 +549,45 @@ def create_combined_map():
         HeatMap(h_data, radius=15, blur=10, max_zoom=1, name="Densité Pollution").add_to(m)
     df_markers = get_arrets_full_details()
     if not df_markers.empty:
-        cluster = MarkerCluster(name="Arrêts de bus").add_to(m)
-        for _, row in df_markers.iterrows():
-            color = "green"
-            val_co2 = row['co2'] if pd.notnull(row['co2']) else 0
-            if val_co2 > 400: color = "orange"
-            if val_co2 > 500: color = "red"
-            popup_content = f"""
-            <div style='font-family: Arial; font-size: 12px; width: 160px;'>
-                <b>{row['nom']}</b><br>
-                Ligne: {row['ligne']}<br><hr>
-                🌫️ CO2: {f"{row['co2']:.1f}" if pd.notnull(row['co2']) else 'N/A'}<br>
-                🔊 Bruit: {f"{row['bruit']:.1f}" if pd.notnull(row['bruit']) else 'N/A'} dB<br>
-                🌡️ Temp: {f"{row['temp']:.1f}" if pd.notnull(row['temp']) else 'N/A'} °C
-            </div>
-            """
-            folium.Marker(
-                location=[row['lat'], row['lon']],
-                popup=folium.Popup(popup_content, max_width=200),
-                icon=folium.Icon(color=color, icon="bus", prefix="fa")
-            ).add_to(cluster)
+        df_markers = df_markers.dropna(subset=["lat", "lon"])
+        val_co2 = df_markers["co2"].fillna(0)
+        df_markers["couleur"] = np.select([val_co2 > 500, val_co2 > 400], ["red", "orange"], "green")
+        rows = marker_rows(df_markers, ["lat", "lon", "couleur", "nom", "ligne", "co2", "bruit", "temp"])
+        FastMarkerCluster(rows, callback=DETAILS_MARKER_JS, name="Arrêts de bus").add_to(m)
     folium.LayerControl().add_to(m)
     return m._repr_html_()
 
-# --- CHARGEMENT DES DONNÉES ---
-print("📂 Chargement des fichiers CSV...")
-df_a = load("mongo_requete_a.csv")
-df_b = load("mongo_requete_b.csv")
-df_c = load("mongo_requete_c.csv")
-df_d = load("mongo_requete_d.csv")
-df_e = load("mongo_requete_e.csv")
-df_f = load("mongo_requete_f.csv")
-df_g = load("mongo_requete_g.csv")
-df_h = load("mongo_requete_h.csv")
-df_i = load("mongo_requete_i.csv")
-df_j = load("mongo_requete_j.csv")
-df_k = load("mongo_requete_k.csv")
-df_l = load("mongo_requete_l.csv")
-df_m = load("mongo_requete_m.csv")
-df_n = load("mongo_requete_n.csv")
-
-print(f"✓ Chargement terminé")
-
-
-
-# Construction Figure E
-fig_e = px.bar(
-    df_e, 
-    x="quartier_nom", 
-    y="avg_bruit", 
-    title="Top 5 Quartiers les Plus Bruyants (Niveau Sonore Moyen)"
-)
-if not df_e.empty:
-    e_min = df_e["avg_bruit"].min()
-    e_max = df_e["avg_bruit"].max()
-    fig_e.update_layout(yaxis=dict(range=[e_min * 0.98, e_max * 1.01]))
+# Cartes rendues, compressées sur disque par version des données et paramètres de rendu (outils/html_cache.py)
+MAP_CACHE_DIR = "dashboard/cache_cartes"
+
+def cached_map(name, render, inputs, **params):
+    """HTML d'une carte Folium : relu sur disque si les données lues (`inputs`) n'ont pas changé."""
+    db = get_db()
+    if db is None: return render()
+    return cached_html(MAP_CACHE_DIR, name, mongo_version(db, inputs), {"folium": folium.__version__, **params}, render)
 
+# --- GRAPHIQUES (construits au premier affichage de leur onglet) ---
 
+def build_fig_e():
+    df_e = load("mongo_requete_e.csv")
+    fig_e = px.bar(
+        df_e, 
+        x="quartier_nom", 
+        y="avg_bruit", 
+        title="Top 5 Quartiers les Plus Bruyants (Niveau Sonore Moyen)"
+    )
+    if not df_e.empty:
+        e_min = df_e["avg_bruit"].min()
+        e_max = df_e["avg_bruit"].max()
+        fig_e.update_layout(yaxis=dict(range=[e_min * 0.98, e_max * 1.01]))
+    return fig_e
 
 # ---  fig_j_temp (Top/Bottom Températures) ---
-if not df_j.empty:
+def build_fig_j_temp():
+    df_j = load("mongo_requete_j.csv")
+    if df_j.empty:
+        return px.bar(title="Pas de données Température")
+
     # On trie les données
     df_sorted = df_j.sort_values("avg_temperature", ascending=False)
     
@@ -487,86 +614,95 @@ if not df_j.empty:
     y_max = df_j_filtered["avg_temperature"].max() * 1.01
     fig_j_temp.update_layout(yaxis=dict(range=[y_min, y_max]))
     fig_j_temp.update_traces(textposition='outside')
-else:
-    fig_j_temp = px.bar(title="Pas de données Température")
-
-
+    return fig_j_temp
 
 # --- Autres Graphiques ---
 # MODIFICATION: Échelle logarithmique pour les retards
-df_a_subset = df_a.sort_values("avg_retard", ascending=False).head(15) if not df_a.empty else df_a
-fig_a_retard = px.bar(
-    df_a_subset, 
-    x="nom_ligne", 
-    y="avg_retard", 
-    title="a. Retards Moyens par Ligne de Bus (Échelle Logarithmique)",
-    log_y=True,
-    text_auto='.1f'
-)
-if not df_a_subset.empty:
-    fig_a_retard.update_traces(textposition='outside')
-
-df_k_subset = df_k.sort_values("avg_retard_minutes").head(10) if not df_k.empty else df_k
-fig_k_chauffeurs = px.bar(
-    df_k_subset, 
-    x="chauffeur_nom", 
-    y="avg_retard_minutes", 
-    title="Top 10 Chauffeurs avec les Retards Moyens les Plus Élevés"
-)
-if not df_k_subset.empty:
-    k_min = df_k_subset["avg_retard_minutes"].min()
-    k_max = df_k_subset["avg_retard_minutes"].max()
-    fig_k_chauffeurs.update_layout(yaxis=dict(range=[k_min * 0.90, k_max * 1.05]))
-
-fig_d_co2 = px.histogram(
-    df_d, 
-    x="avg_co2", 
-    color="type_vehicule", 
-    title="Répartition des Émissions de CO2 par Type de Véhicule", 
-    barmode="overlay"
-)
-fig_n_pie = px.pie(
-    df_n, 
-    names="classification_retard", 
-    title="Répartition des Retards par Classification"
-)
-fig_c_incidents = px.scatter(
-    df_c, 
-    x="nom_ligne", 
-    y="incident_taux", 
-    size="incident_taux", 
-    title="Taux d'Incidents par Ligne de Bus"
-)
+def build_fig_a_retard():
+    df_a = load("mongo_requete_a.csv")
+    df_a_subset = df_a.sort_values("avg_retard", ascending=False).head(15) if not df_a.empty else df_a
+    fig_a_retard = px.bar(
+        df_a_subset, 
+        x="nom_ligne", 
+        y="avg_retard", 
+        title="a. Retards Moyens par Ligne de Bus (Échelle Logarithmique)",
+        log_y=True,
+        text_auto='.1f'
+    )
+    if not df_a_subset.empty:
+        fig_a_retard.update_traces(textposition='outside')
+    return fig_a_retard
+
+def build_fig_k_chauffeurs():
+    df_k = load("mongo_requete_k.csv")
+    df_k_subset = df_k.sort_values("avg_retard_minutes").head(10) if not df_k.empty else df_k
+    fig_k_chauffeurs = px.bar(
+        df_k_subset, 
+        x="chauffeur_nom", 
+        y="avg_retard_minutes", 
+        title="Top 10 Chauffeurs avec les Retards Moyens les Plus Élevés"
+    )
+    if not df_k_subset.empty:
+        k_min = df_k_subset["avg_retard_minutes"].min()
+        k_max = df_k_subset["avg_retard_minutes"].max()
+        fig_k_chauffeurs.update_layout(yaxis=dict(range=[k_min * 0.90, k_max * 1.05]))
+    return fig_k_chauffeurs
+
+def build_fig_d_co2():
+    return px.histogram(
+        load("mongo_requete_d.csv"), 
+        x="avg_co2", 
+        color="type_vehicule", 
+        title="Répartition des Émissions de CO2 par Type de Véhicule", 
+        barmode="overlay"
+    )
 
-if not df_b.empty:
-    fig_b_passagers = px.line(
+def build_fig_n_pie():
+    return px.pie(
+        load("mongo_requete_n.csv"), 
+        names="classification_retard", 
+        title="Répartition des Retards par Classification"
+    )
+
+def build_fig_c_incidents():
+    return px.scatter(
+        load("mongo_requete_c.csv"), 
+        x="nom_ligne", 
+        y="incident_taux", 
+        size="incident_taux", 
+        title="Taux d'Incidents par Ligne de Bus"
+    )
+
+def build_fig_b_passagers():
+    df_b = load("mongo_requete_b.csv")
+    if df_b.empty:
+        return px.line(title="Pas de Données sur les Passagers Disponibles")
+    return px.line(
         df_b.groupby("jour")["avg_passagers"].mean().reset_index(), 
         x="jour", 
         y="avg_passagers", 
         title="Évolution Moyenne du Nombre de Passagers par Jour"
     )
-else:
-    fig_b_passagers = px.line(title="Pas de Données sur les Passagers Disponibles")
-
-fig_l_elec = px.bar(
-    df_l.sort_values("taux_electrique", ascending=False), 
-    x="nom_ligne", 
-    y="taux_electrique", 
-    title="Taux de Véhicules Électriques par Ligne"
-)
 
-fig_i_corr = px.bar(
-    df_i.sort_values("correlation"), 
-    x="nom_ligne", 
-    y="correlation", 
-    title="Corrélation entre les Retards et les Lignes de Bus"
-)
+def build_fig_l_elec():
+    df_l = load("mongo_requete_l.csv")
+    return px.bar(
+        df_l.sort_values("taux_electrique", ascending=False) if not df_l.empty else df_l, 
+        x="nom_ligne", 
+        y="taux_electrique", 
+        title="Taux de Véhicules Électriques par Ligne"
+    )
 
-# --- LAYOUT DASH ---
-app = dash.Dash(__name__)
+def build_fig_i_corr():
+    df_i = load("mongo_requete_i.csv")
+    return px.bar(
+        df_i.sort_values("correlation") if not df_i.empty else df_i, 
+        x="nom_ligne", 
+        y="correlation", 
+        title="Corrélation entre les Retards et les Lignes de Bus"
+    )
 
-line_options = get_liste_lignes()
-vehicle_options = get_vehicle_options()
+# --- ONGLETS (chacun construit une seule fois, à sa première ouverture) ---
 co2_options = [
     {'label': 'Tous les niveaux', 'value': 'all'},
     {'label': '🟢 Faible (< 400 ppm)', 'value': 'low'},
@@ -574,117 +710,145 @@ co2_options = [
     {'label': '🔴 Élevé (> 480 ppm)', 'value': 'high'}
 ]
 
-# On génère l'HTML de la carte une seule fois au lancement
-map_html = create_combined_map()
-choropleth_html = create_choropleth_map()
-ponctualite = df_g.iloc[0,0]*100 if not df_g.empty else 0
-
-app.layout = html.Div([
-    html.H1("Paris 2055 - Dashboard Intégral (Folium & Dash)", style={'textAlign': 'center', 'margin': '30px'}),
-    html.Div([
-        html.H2(f"Taux de Ponctualité Global : {ponctualite:.2f}%", 
-                style={'textAlign': 'center', 'color': 'white', 'backgroundColor': '#2c3e50', 'padding': '15px'})
-    ], style={'margin': '20px'}),
-
-    dcc.Tabs([
-        # NOUVEL ONGLET: Supervision & Filtres
-        dcc.Tab(label='🔍 Supervision & Filtres', children=[
+# Pas de mémoïsation : les menus suivent la version des données (maps ci-dessus)
+def build_supervision_tab():
+    line_options = get_liste_lignes()
+    vehicle_options = get_vehicle_options()
+    return html.Div([
+        # Filtres
+        html.Div([
+            html.Div([html.Label("1. Choisir une Ligne"), dcc.Dropdown(id='line-selector', options=line_options, placeholder="Toutes les lignes...", clearable=True)], style={'width': '30%', 'display': 'inline-block'}),
+            html.Div([html.Label("2. Type de Véhicule"), dcc.Dropdown(id='vehicle-selector', options=vehicle_options, placeholder="Tous types...", clearable=True)], style={'width': '30%', 'display': 'inline-block', 'marginLeft': '2%'}),
+            html.Div([html.Label("3. Niveau de CO₂"), dcc.Dropdown(id='co2-selector', options=co2_options, value='all', clearable=False)], style={'width': '30%', 'display': 'inline-block', 'marginLeft': '2%'}),
+        ], style={'padding': '15px', 'backgroundColor': '#ecf0f1', 'borderRadius': '5px', 'marginBottom': '20px'}),
+
+        # HAUT : Carte + Pie Chart
+        html.Div([
             html.Div([
-                # Filtres
-                html.Div([
-                    html.Div([html.Label("1. Choisir une Ligne"), dcc.Dropdown(id='line-selector', options=line_options, placeholder="Toutes les lignes...", clearable=True)], style={'width': '30%', 'display': 'inline-block'}),
-                    html.Div([html.Label("2. Type de Véhicule"), dcc.Dropdown(id='vehicle-selector', options=vehicle_options, placeholder="Tous types...", clearable=True)], style={'width': '30%', 'display': 'inline-block', 'marginLeft': '2%'}),
-                    html.Div([html.Label("3. Niveau de CO₂"), dcc.Dropdown(id='co2-selector', options=co2_options, value='all', clearable=False)], style={'width': '30%', 'display': 'inline-block', 'marginLeft': '2%'}),
-                ], style={'padding': '15px', 'backgroundColor': '#ecf0f1', 'borderRadius': '5px', 'marginBottom': '20px'}),
-
-                # HAUT : Carte + Pie Chart
-                html.Div([
-                    html.Div([
-                        html.H4("Cartographie Temps Réel"),
-                        html.Iframe(id='interactive-map', style={'width': '100%', 'height': '500px', 'border': '2px solid #ddd', 'borderRadius': '5px'})
-                    ], style={'width': '68%', 'display': 'inline-block', 'verticalAlign': 'top'}),
-                    
-                    html.Div([
-                        dcc.Graph(id='pie-vehicules', style={'height': '500px'})
-                    ], style={'width': '30%', 'display': 'inline-block', 'verticalAlign': 'top', 'paddingLeft': '1%'})
-                ]),
-
-                # MILIEU : Tendance CO2
-                html.Div([
-                    html.Hr(),
-                    dcc.Graph(id='co2-trend', style={'height': '350px'})
-                ], style={'marginTop': '20px', 'marginBottom': '20px'}),
-
-                # BAS : Tableau
-                html.H4("📋 Détail des Arrêts Filtrés"),
-                dash_table.DataTable(
-                    id='filtered-table', page_size=10, 
-                    style_header={'backgroundColor': '#2c3e50', 'color': 'white', 'fontWeight': 'bold'}, 
-                    style_cell={'textAlign': 'center', 'fontFamily': 'Arial'},
-                    style_data_conditional=[{'if': {'row_index': 'odd'}, 'backgroundColor': 'rgb(248, 248, 248)'}]
-                )
-            ], style={'padding': '20px', 'backgroundColor': '#f9f9f9'})
-        ]),
-        
-        dcc.Tab(label='🌍 Environnement', children=[
+                html.H4("Cartographie Temps Réel"),
+                html.Iframe(id='interactive-map', style={'width': '100%', 'height': '500px', 'border': '2px solid #ddd', 'borderRadius': '5px'})
+            ], style={'width': '68%', 'display': 'inline-block', 'verticalAlign': 'top'}),
+            
             html.Div([
-                html.H3("Carte Choroplèthe - CO₂ Moyen par Quartier", style={'textAlign': 'center'}),
-                html.Iframe(srcDoc=choropleth_html, style={'width': '100%', 'height': '600px', 'border': 'none'}),
-                html.Hr(),
-                html.H3("m. Carte de Chaleur Folium (Pollution CO2)", style={'textAlign': 'center'}),
-                html.Iframe(srcDoc=map_html, style={'width': '100%', 'height': '600px', 'border': 'none'}),
-                html.Div([
-                    dcc.Graph(figure=fig_e, style={'width': '50%', 'display': 'inline-block'}),
-                    dcc.Graph(figure=fig_j_temp, style={'width': '50%', 'display': 'inline-block'}),
-                ]),
-                dcc.Graph(figure=fig_d_co2)
-            ])
+                dcc.Graph(id='pie-vehicules', style={'height': '500px'})
+            ], style={'width': '30%', 'display': 'inline-block', 'verticalAlign': 'top', 'paddingLeft': '1%'})
         ]),
-        dcc.Tab(label='⏱️ Performance Trafic', children=[
-            html.Div([
-                dcc.Graph(figure=fig_a_retard),
-                html.Div([
-                    dcc.Graph(figure=fig_n_pie, style={'width': '50%', 'display': 'inline-block'}),
-                    dcc.Graph(figure=fig_c_incidents, style={'width': '50%', 'display': 'inline-block'}),
-                ]),
-                html.H3("f. Retards sans incidents", style={'textAlign': 'center'}),
-                dash_table.DataTable(
-                    data=df_f.to_dict('records') if not df_f.empty else [],
-                    columns=[{"name": "Lignes Concernées", "id": "nom_ligne"}],
-                    page_size=10,
-                    style_cell={'textAlign': 'center'}
-                )
-            ])
+
+        # Carte dynamique : rechargée à chaque déplacement ou zoom
+        html.Div([
+            html.H4("Carte dynamique (zone visible)"),
+            dcc.Store(id='viewport-store', data=VIEWPORT_DEFAULT),
+            dcc.Graph(id='viewport-map', style={'height': '500px'})
+        ], style={'marginTop': '20px'}),
+
+        # MILIEU : Tendance CO2
+        html.Div([
+            html.Hr(),
+            dcc.Graph(id='co2-trend', style={'height': '350px'})
+        ], style={'marginTop': '20px', 'marginBottom': '20px'}),
+
+        # BAS : Tableau
+        html.H4("📋 Détail des Arrêts Filtrés"),
+        dash_table.DataTable(
+            id='filtered-table', page_size=10, 
+            style_header={'backgroundColor': '#2c3e50', 'color': 'white', 'fontWeight': 'bold'}, 
+            style_cell={'textAlign': 'center', 'fontFamily': 'Arial'},
+            style_data_conditional=[{'if': {'row_index': 'odd'}, 'backgroundColor': 'rgb(248, 248, 248)'}]
+        )
+    ], style={'padding': '20px', 'backgroundColor': '#f9f9f9'})
+
+def build_environnement_tab():
+    return load_environnement_tab(environnement_data_version())
+
+# Comme l'onglet Supervision, l'onglet suit la version des données (cartes et choroplèthe)
+@lru_cache(maxsize=2)
+def load_environnement_tab(version):
+    return html.Div([
+        html.H3("Carte Choroplèthe - CO₂ Moyen par Quartier", style={'textAlign': 'center'}),
+        html.Iframe(srcDoc=cached_map("choroplethe", create_choropleth_map, ["Arrets", "Quartiers"]), style={'width': '100%', 'height': '600px', 'border': 'none'}),
+        html.Hr(),
+        html.H3("m. Carte de Chaleur Folium (Pollution CO2)", style={'textAlign': 'center'}),
+        html.Iframe(srcDoc=cached_map("carte_combinee", create_combined_map, ["Arrets", HEAT_TILES_COLLECTION],
+                                      heatmap_zoom=HEATMAP_ZOOM), style={'width': '100%', 'height': '600px', 'border': 'none'}),
+        html.Div([
+            dcc.Graph(figure=build_fig_e(), style={'width': '50%', 'display': 'inline-block'}),
+            dcc.Graph(figure=build_fig_j_temp(), style={'width': '50%', 'display': 'inline-block'}),
         ]),
-        dcc.Tab(label='🚍 Exploitation & Flotte', children=[
-            html.Div([
-                dcc.Graph(figure=fig_b_passagers),
-                dcc.Graph(figure=fig_l_elec),
-                dcc.Graph(figure=fig_k_chauffeurs),
-            ])
+        dcc.Graph(figure=build_fig_d_co2())
+    ])
+
+@lru_cache(maxsize=None)
+def build_trafic_tab():
+    df_f = load("mongo_requete_f.csv")
+    return html.Div([
+        dcc.Graph(figure=build_fig_a_retard()),
+        html.Div([
+            dcc.Graph(figure=build_fig_n_pie(), style={'width': '50%', 'display': 'inline-block'}),
+            dcc.Graph(figure=build_fig_c_incidents(), style={'width': '50%', 'display': 'inline-block'}),
         ]),
-        dcc.Tab(label='📊 Analyses Avancées', children=[
-            html.Div([
-                dcc.Graph(figure=fig_i_corr),
-            ])
+        html.H3("f. Retards sans incidents", style={'textAlign': 'center'}),
+        dash_table.DataTable(
+            data=df_f.to_dict('records') if not df_f.empty else [],
+            columns=[{"name": "Lignes Concernées", "id": "nom_ligne"}],
+            page_size=10,
+            style_cell={'textAlign': 'center'}
+        )
+    ])
+
+@lru_cache(maxsize=None)
+def build_flotte_tab():
+    return html.Div([
+        dcc.Graph(figure=build_fig_b_passagers()),
+        dcc.Graph(figure=build_fig_l_elec()),
+        dcc.Graph(figure=build_fig_k_chauffeurs()),
+    ])
+
+@lru_cache(maxsize=None)
+def build_analyses_tab():
+    return html.Div([
+        dcc.Graph(figure=build_fig_i_corr()),
+    ])
+
+# Onglet -> (libellé, constructeur)
+TABS = {
+    "supervision": ('🔍 Supervision & Filtres', build_supervision_tab),
+    "environnement": ('🌍 Environnement', build_environnement_tab),
+    "trafic": ('⏱️ Performance Trafic', build_trafic_tab),
+    "flotte": ('🚍 Exploitation & Flotte', build_flotte_tab),
+    "analyses": ('📊 Analyses Avancées', build_analyses_tab),
+}
+
+# --- LAYOUT DASH ---
+# Les composants des onglets n'existent qu'une fois l'onglet affiché
+app = dash.Dash(__name__, suppress_callback_exceptions=True)
+
+def serve_layout():
+    df_g = load("mongo_requete_g.csv")
+    ponctualite = df_g.iloc[0,0]*100 if not df_g.empty else 0
+    return html.Div([
+        html.H1("Paris 2055 - Dashboard Intégral (Folium & Dash)", style={'textAlign': 'center', 'margin': '30px'}),
+        html.Div([
+            html.H2(f"Taux de Ponctualité Global : {ponctualite:.2f}%", 
+                    style={'textAlign': 'center', 'color': 'white', 'backgroundColor': '#2c3e50', 'padding': '15px'})
+        ], style={'margin': '20px'}),
+
+        dcc.Tabs(id='tabs', value='supervision', children=[
+            dcc.Tab(label=label, value=key) for key, (label, _) in TABS.items()
         ]),
+        dcc.Loading(html.Div(id='tab-content'))
     ])
-])
+
+app.layout = serve_layout
 
 # =============================================================================
 # CALLBACKS
 # =============================================================================
-@app.callback(
-    [Output('interactive-map', 'srcDoc'), 
-     Output('filtered-table', 'data'), 
-     Output('filtered-table', 'columns'),
-     Output('pie-vehicules', 'figure'),
-     Output('co2-trend', 'figure')],
-    [Input('line-selector', 'value'), 
-     Input('vehicle-selector', 'value'), 
-     Input('co2-selector', 'value')]
-)
-def update_supervision(selected_line, selected_vehicle, selected_co2):
+@app.callback(Output('tab-content', 'children'), Input('tabs', 'value'))
+def render_tab(tab):
+    return TABS[tab][1]()
+
+def build_supervision(selected_line, selected_vehicle, selected_co2):
+    """Carte, tableau, camembert et tendance CO2 pour une combinaison de filtres."""
     df_filtered = get_filtered_data(id_ligne=selected_line, vehicle_type=selected_vehicle, co2_level=selected_co2)
     
     map_html = create_interactive_map(df_filtered)
@@ -703,13 +867,12 @@ def update_supervision(selected_line, selected_vehicle, selected_co2):
         counts.columns = ["Type", "Nombre"]
         fig_pie = px.pie(counts, names="Type", values="Nombre", title="Répartition (Sur la sélection)", hole=0.4)
         
-        # Tendance CO2 Dynamique
-        target_stops = df_filtered["Arrêt"].tolist()
-        if len(target_stops) > 2000:
-             df_trend_filtered = get_trend_for_stops(None) 
+        # Tendance CO2 Dynamique : somme des séries journalières des arrêts sélectionnés
+        if selected_line is None and selected_vehicle is None and selected_co2 in (None, 'all'):
+             df_trend_filtered = get_trend_for_stops(None)
              title_suffix = "(Tout le réseau)"
         else:
-             df_trend_filtered = get_trend_for_stops(target_stops)
+             df_trend_filtered = get_trend_for_stops(df_filtered["id_arret"].tolist())
              title_suffix = "(Sélection filtrée)"
 
         if not df_trend_filtered.empty:
@@ -718,5 +881,55 @@ def update_supervision(selected_line, selected_vehicle, selected_co2):
     
     return map_html, table_data, table_cols, fig_pie, fig_trend
 
+@app.callback(
+    [Output('interactive-map', 'srcDoc'), 
+     Output('filtered-table', 'data'), 
+     Output('filtered-table', 'columns'),
+     Output('pie-vehicules', 'figure'),
+     Output('co2-trend', 'figure')],
+    [Input('line-selector', 'value'), 
+     Input('vehicle-selector', 'value'), 
+     Input('co2-selector', 'value')]
+)
+def update_supervision(selected_line, selected_vehicle, selected_co2):
+    # Clé : filtres + version des données (un rechargement MongoDB invalide les entrées)
+    key = (selected_line, selected_vehicle, selected_co2, supervision_data_version())
+    found, result = SUPERVISION_CACHE.get(key)
+    if not found:
+        result = build_supervision(selected_line, selected_vehicle, selected_co2)
+        SUPERVISION_CACHE.put(key, result)
+    return result
+
+@app.callback(Output('viewport-store', 'data'), Input('viewport-map', 'relayoutData'))
+def store_viewport(relayout):
+    # Les autres relayouts (redimensionnement, légende) ne changent pas la zone visible
+    viewport = viewport_from_relayout(relayout)
+    if viewport is None:
+        raise PreventUpdate
+    return viewport
+
+@app.callback(
+    Output('viewport-map', 'figure'),
+    [Input('viewport-store', 'data'),
+     Input('line-selector', 'value'),
+     Input('vehicle-selector', 'value'),
+     Input('co2-selector', 'value')]
+)
+def update_viewport_map(viewport, selected_line, selected_vehicle, selected_co2):
+    viewport = viewport or VIEWPORT_DEFAULT
+    try:
+        df, n_stops = get_viewport_stops(viewport, selected_line, selected_vehicle, selected_co2)
+        heat = get_heatmap_data(viewport["zoom"], viewport_bounds(viewport))
+    except PyMongoError as e:
+        # Zone refusée par le serveur : la carte garde son dernier état et suit le prochain déplacement
+        print(f"⚠️ Zone visible non chargée : {e}")
+        raise PreventUpdate
+    return create_viewport_figure(df, n_stops, heat)
+
+@app.server.route("/cache-supervision")
+def supervision_cache_stats():
+    """Compteurs du cache de l'onglet Supervision (succès, échecs, entrées)."""
+    return SUPERVISION_CACHE.stats()
+
 if __name__ == '__main__':
     app.run(debug=True, port=8051, use_reloader=False)
\ No newline at end of file
@@ -5,10 +5,12 @@ import subprocess
 import re
 import queue
 import threading
-import pandas as pd
 import os
 from pathlib import Path
 
+from outils.compare_results import same_result
+from outils.export_stream import read_result
+
 # Initialize Dash app
 app = dash.Dash(__name__, 
                 external_stylesheets=["https://cdnjs.cloudflare.com/ajax/libs/normalize/8.0.1/normalize.min.css"],
@@ -22,6 +24,14 @@ current_process = None
 # Paths for CSV results
 SQL_RESULTS_DIR = "requetes_sql/resultat_requetes_sql"
 MONGODB_RESULTS_DIR = "requetes_mongodb/resultat_requetes_mongodb"
+COLUMNAR_RESULTS_DIR = "requetes_columnar/resultat_requetes_columnar"
+
+# Sources de résultats : (nom affiché, dossier, préfixe des fichiers)
+RESULT_SOURCES = {
+    "SQL": (SQL_RESULTS_DIR, ""),
+    "MongoDB": (MONGODB_RESULTS_DIR, "mongo_"),
+    "Columnar": (COLUMNAR_RESULTS_DIR, ""),
+}
 
 # Layout of the Dash app
 app.layout = html.Div([
@@ -95,6 +105,7 @@ home_layout = html.Div([
             "fontSize": "16px"
         }),
         html.Button("Run MongoDB Queries", id="btn-mongodb-queries", n_clicks=0, style={
+            "marginRight": "10px",
             "padding": "10px 20px",
             "backgroundColor": "#FFC107",
             "color": "white",
@@ -102,6 +113,15 @@ home_layout = html.Div([
             "borderRadius": "5px",
             "cursor": "pointer",
             "fontSize": "16px"
+        }),
+        html.Button("Run Columnar Queries", id="btn-columnar-queries", n_clicks=0, style={
+            "padding": "10px 20px",
+            "backgroundColor": "#6F42C1",
+            "color": "white",
+            "border": "none",
+            "borderRadius": "5px",
+            "cursor": "pointer",
+            "fontSize": "16px"
         })
     ], style={
         "textAlign": "center",
@@ -141,7 +161,7 @@ results_layout = html.Div([
                 "padding": "10px",
                 "borderRadius": "5px"
             })
-        ], style={"width": "48%", "display": "inline-block", "verticalAlign": "top"}),
+        ], style={"width": "32%", "display": "inline-block", "verticalAlign": "top"}),
         html.Div([
             html.H3("MongoDB Query Results", style={"color": "#FFC107"}),
             html.Div(id="mongodb-file-list", style={
@@ -151,7 +171,17 @@ results_layout = html.Div([
                 "padding": "10px",
                 "borderRadius": "5px"
             })
-        ], style={"width": "48%", "display": "inline-block", "verticalAlign": "top", "marginLeft": "4%"})
+        ], style={"width": "32%", "display": "inline-block", "verticalAlign": "top", "marginLeft": "2%"}),
+        html.Div([
+            html.H3("Columnar Query Results", style={"color": "#6F42C1"}),
+            html.Div(id="columnar-file-list", style={
+                "maxHeight": "300px",
+                "overflowY": "auto",
+                "border": "1px solid #ddd",
+                "padding": "10px",
+                "borderRadius": "5px"
+            })
+        ], style={"width": "32%", "display": "inline-block", "verticalAlign": "top", "marginLeft": "2%"})
     ]),
     html.Hr(),
     html.Div(id="selected-file-info", style={
@@ -243,10 +273,11 @@ def run_script(script_path):
     [Input("btn-migration", "n_clicks"),
      Input("btn-queries", "n_clicks"),
      Input("btn-mongodb-queries", "n_clicks"),
+     Input("btn-columnar-queries", "n_clicks"),
      Input("interval", "n_intervals")],
     [State("store-terminal-output", "data")]
 )
-def handle_updates(btn_migration_clicks, btn_queries_clicks, btn_mongodb_clicks, n_intervals, current_output):
+def handle_updates(btn_migration_clicks, btn_queries_clicks, btn_mongodb_clicks, btn_columnar_clicks, n_intervals, current_output):
     ctx = dash.callback_context
     if not ctx.triggered:
         return current_output
@@ -254,7 +285,7 @@ def handle_updates(btn_migration_clicks, btn_queries_clicks, btn_mongodb_clicks,
     triggered_id = ctx.triggered[0]["prop_id"].split(".")[0]
     
     # Handle button clicks - start new process
-    if triggered_id in ["btn-migration", "btn-queries", "btn-mongodb-queries"]:
+    if triggered_id in ["btn-migration", "btn-queries", "btn-mongodb-queries", "btn-columnar-queries"]:
         # Clear queue and output
         while not output_queue.empty():
             output_queue.get()
@@ -262,7 +293,8 @@ def handle_updates(btn_migration_clicks, btn_queries_clicks, btn_mongodb_clicks,
         script_map = {
             "btn-migration": "migration/migration.py",
             "btn-queries": "requetes_sql/requete_sql.py",
-            "btn-mongodb-queries": "requetes_mongodb/requete_mongo.py"
+            "btn-mongodb-queries": "requetes_mongodb/requete_mongo.py",
+            "btn-columnar-queries": "requetes_columnar/requete_columnar.py"
         }
         
         script_path = script_map.get(triggered_id)
@@ -299,20 +331,22 @@ def update_terminal_output(data):
 def get_csv_files(directory):
     if not os.path.exists(directory):
         return []
-    return sorted([f for f in os.listdir(directory) if f.endswith('.csv')])
+    return sorted([f for f in os.listdir(directory) if f.endswith(('.csv', '.csv.gz'))])
 
 # Callback to populate file lists
 @app.callback(
     [Output('sql-file-list', 'children'),
-     Output('mongodb-file-list', 'children')],
+     Output('mongodb-file-list', 'children'),
+     Output('columnar-file-list', 'children')],
     Input('url', 'pathname')
 )
 def populate_file_lists(pathname):
     if pathname != '/results':
-        return [], []
+        return [], [], []
     
     sql_files = get_csv_files(SQL_RESULTS_DIR)
     mongodb_files = get_csv_files(MONGODB_RESULTS_DIR)
+    columnar_files = get_csv_files(COLUMNAR_RESULTS_DIR)
     
     sql_buttons = [
         html.Button(
@@ -352,8 +386,41 @@ def populate_file_lists(pathname):
         ) for file in mongodb_files
     ]
     
+    columnar_buttons = [
+        html.Button(
+            f"📄 {file}",
+            id={'type': 'columnar-file-btn', 'index': file},
+            n_clicks=0,
+            style={
+                "width": "100%",
+                "marginBottom": "5px",
+                "padding": "8px",
+                "backgroundColor": "#6F42C1",
+                "color": "white",
+                "border": "none",
+                "borderRadius": "3px",
+                "cursor": "pointer",
+                "textAlign": "left"
+            }
+        ) for file in columnar_files
+    ]
+    
     return (sql_buttons if sql_buttons else html.P("No SQL results found", style={"color": "#999"}),
-            mongodb_buttons if mongodb_buttons else html.P("No MongoDB results found", style={"color": "#999"}))
+            mongodb_buttons if mongodb_buttons else html.P("No MongoDB results found", style={"color": "#999"}),
+            columnar_buttons if columnar_buttons else html.P("No columnar results found", style={"color": "#999"}))
+
+# Comparaison d'un résultat avec le même fichier des autres sources
+def compare_with_sources(source, file_name):
+    directory, prefix = RESULT_SOURCES[source]
+    base = file_name[len(prefix):] if prefix and file_name.startswith(prefix) else file_name
+    checks = []
+    for other, (other_dir, other_prefix) in RESULT_SOURCES.items():
+        if other == source:
+            continue
+        verdict = same_result(os.path.join(directory, file_name), os.path.join(other_dir, other_prefix + base))
+        if verdict is not None:
+            checks.append(f"{'✓' if verdict else '≠'} {other}")
+    return f" — {', '.join(checks)}" if checks else ""
 
 # Callback to handle file selection and display
 # Callback to handle file selection and display
@@ -362,10 +429,11 @@ def populate_file_lists(pathname):
      Output('selected-file-info', 'children'),
      Output('selected-csv-path', 'data')],
     [Input({'type': 'sql-file-btn', 'index': dash.dependencies.ALL}, 'n_clicks'),
-     Input({'type': 'mongodb-file-btn', 'index': dash.dependencies.ALL}, 'n_clicks')],
+     Input({'type': 'mongodb-file-btn', 'index': dash.dependencies.ALL}, 'n_clicks'),
+     Input({'type': 'columnar-file-btn', 'index': dash.dependencies.ALL}, 'n_clicks')],
     prevent_initial_call=True
 )
-def display_csv(sql_clicks, mongodb_clicks):
+def display_csv(sql_clicks, mongodb_clicks, columnar_clicks):
     ctx = dash.callback_context
     
     # Si rien n'a déclenché le callback ou si triggered_id est vide
@@ -392,13 +460,17 @@ def display_csv(sql_clicks, mongodb_clicks):
     elif button_type == 'mongodb-file-btn':
         file_path = os.path.join(MONGODB_RESULTS_DIR, file_name)
         source = "MongoDB"
+    elif button_type == 'columnar-file-btn':
+        file_path = os.path.join(COLUMNAR_RESULTS_DIR, file_name)
+        source = "Columnar"
     
     # Vérification de l'existence du fichier
     if not file_path or not os.path.exists(file_path):
         return html.P("File not found", style={"textAlign": "center", "color": "red"}), "", None
     
     try:
-        df = pd.read_csv(file_path)
+        # Fichier Arrow associé (--arrow) s'il est à jour : pas d'analyse du texte CSV
+        df = read_result(file_path)
         
         table = dash_table.DataTable(
             data=df.to_dict('records'),
@@ -421,7 +493,7 @@ def display_csv(sql_clicks, mongodb_clicks):
             page_size=20
         )
         
-        info_text = f"📊 {source} Query: {file_name} ({len(df)} rows)"
+        info_text = f"📊 {source} Query: {file_name} ({len(df)} rows){compare_with_sources(source, file_name)}"
         
         return table, info_text, file_path
         
@@ -0,0 +1,154 @@
+"""
+==============================================================
+Partie 2 — Dump hors-ligne et restauration parallèle
+==============================================================
+
+La transformation SQLite → documents est déterministe : on peut
+l'exécuter une seule fois (`migration.py --dump DOSSIER`) puis
+recharger le résultat dans n'importe quelle instance MongoDB :
+
+    python migration/dump_restore.py DOSSIER --workers 8
+
+Format du dump :
+- un sous-dossier par collection, un fichier compressé par lot
+  (BSON concaténé façon mongodump, ou NDJSON Extended JSON) ;
+- un fichier manifest.json (fichiers, comptages, index à créer).
+
+==============================================================
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import bson
+from bson import json_util
+from pymongo import MongoClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from outils.result_cache import record_data_version
+from outils.resume_env_arrets import build_stop_summaries
+from outils.resume_env_lignes import build_env_summary
+
+DUMP_EXTENSIONS = {"bson": ".bson.gz", "ndjson": ".ndjson.gz"}
+MANIFEST_NAME = "manifest.json"
+COMPRESS_LEVEL = 6
+
+
+def write_chunk(dump_dir, collection, index, docs, fmt="bson"):
+    """Écrit un lot de documents dans son propre fichier compressé et renvoie son chemin relatif."""
+    folder = os.path.join(dump_dir, collection)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{collection}_{index:05d}{DUMP_EXTENSIONS[fmt]}")
+    with gzip.open(path, "wb", compresslevel=COMPRESS_LEVEL) as f:
+        if fmt == "bson":
+            for doc in docs:
+                f.write(bson.encode(doc))
+        else:
+            for doc in docs:
+                f.write(json_util.dumps(doc, json_options=json_util.RELAXED_JSON_OPTIONS).encode("utf-8"))
+                f.write(b"\n")
+    return os.path.relpath(path, dump_dir)
+
+
+def write_manifest(dump_dir, fmt, files, counts, indexes):
+    """Écrit le manifest décrivant le dump (fichiers par collection, comptages, index)."""
+    manifest = {
+        "format": fmt,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "collections": {
+            name: {"files": files.get(name, []), "count": counts.get(name, 0)}
+            for name in files
+        },
+        "indexes": [{"collection": c, "keys": [[k, d] for k, d in keys]} for c, keys in indexes],
+    }
+    with open(os.path.join(dump_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+def read_manifest(dump_dir):
+    with open(os.path.join(dump_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_chunk(path, fmt):
+    """Relit un fichier de dump en liste de documents."""
+    with gzip.open(path, "rb") as f:
+        if fmt == "bson":
+            return list(bson.decode_file_iter(f))
+        return [json_util.loads(line) for line in f if line.strip()]
+
+
+def load_chunk(db, collection, path, fmt):
+    """Tâche d'un worker : décode un fichier et l'insère d'un bloc."""
+    docs = read_chunk(path, fmt)
+    if docs:
+        db[collection].insert_many(docs, ordered=False, bypass_document_validation=True)
+    return collection, len(docs)
+
+
+def restore_dump(dump_dir, mongo_uri, db_name, workers=4, drop=True):
+    """Recharge un dump dans MongoDB avec `workers` chargeurs concurrents, puis crée les index."""
+    manifest = read_manifest(dump_dir)
+    fmt = manifest["format"]
+
+    # Un seul client partagé : son pool de connexions sert tous les workers
+    client = MongoClient(mongo_uri, maxPoolSize=max(workers, 1) + 2)
+    db = client[db_name]
+
+    if drop:
+        print("Nettoyage des collections existantes...")
+        for name in manifest["collections"]:
+            db[name].drop()
+
+    tasks = [
+        (name, os.path.join(dump_dir, rel))
+        for name, info in manifest["collections"].items()
+        for rel in info["files"]
+    ]
+    # Les plus gros fichiers d'abord pour équilibrer la charge entre workers
+    tasks.sort(key=lambda t: os.path.getsize(t[1]), reverse=True)
+
+    print(f"Restauration de {len(tasks)} fichier(s) avec {workers} worker(s)...")
+    start = time.perf_counter()
+    loaded = {name: 0 for name in manifest["collections"]}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(load_chunk, db, name, path, fmt) for name, path in tasks]
+        for future in as_completed(futures):
+            name, n = future.result()
+            loaded[name] += n
+    elapsed = time.perf_counter() - start
+
+    print("Création des index...")
+    for index in manifest["indexes"]:
+        db[index["collection"]].create_index([(k, d) for k, d in index["keys"]])
+    build_env_summary(db)
+    build_stop_summaries(db)
+    record_data_version(db, f"restauration {dump_dir}")
+
+    print("\n" + "=" * 60)
+    print(f"RESTAURATION TERMINÉE EN {elapsed:.1f} s")
+    print("=" * 60)
+    for name, n in loaded.items():
+        expected = manifest["collections"][name]["count"]
+        status = "✓" if n == expected else f"⚠️ attendu {expected}"
+        print(f"{name:<12}: {n} {status}")
+
+    client.close()
+    return loaded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Restauration parallèle d'un dump produit par migration.py --dump")
+    parser.add_argument("dump_dir", help="Dossier du dump (contenant manifest.json)")
+    parser.add_argument("--workers", type=int, default=4, help="Nombre de chargeurs concurrents")
+    parser.add_argument("--uri", default="mongodb://localhost:27017/", help="URI MongoDB cible")
+    parser.add_argument("--db", default="Paris2055", help="Base MongoDB cible")
+    parser.add_argument("--no-drop", action="store_true", help="Ne pas vider les collections avant chargement")
+    args = parser.parse_args()
+
+    restore_dump(args.dump_dir, args.uri, args.db, workers=args.workers, drop=not args.no_drop)
@@ -7,35 +7,70 @@ Améliorations par rapport à la v1 :
 1. GeoJSON : Ajout du champ 'location' pour la cartographie (Partie 4).
 2. Dates : Conversion en objets datetime natifs (plus de strings).
 3. Performance : Utilisation de groupby() pour éviter les lenteurs.
+4. Planification : `--plan` estime la taille des documents sans migrer.
+5. Dump : `--dump DOSSIER` écrit les documents dans des fichiers (un par
+   lot) rechargeables en parallèle avec dump_restore.py.
 
 ==============================================================
 """
 
+import argparse
+import os
 import sqlite3
+import sys
 import pandas as pd
 from pymongo import MongoClient, GEOSPHERE
 from tqdm import tqdm
 
+from plan_migration import build_migration_plan, print_migration_plan
+from dump_restore import write_chunk, write_manifest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from outils.result_cache import record_data_version
+from outils.resume_env_arrets import build_stop_summaries
+from outils.resume_env_lignes import ENV_SUMMARY_COLLECTION, build_env_summary
+
 # --- CONFIGURATION ---
 SQLITE_PATH = "data/Paris2055.sqlite"
 MONGO_URI = "mongodb://localhost:27017/"
 MONGO_DB_NAME = "Paris2055"
+GEOJSON_PATH = "data/paris_quartiers_real.geojson"
+
+parser = argparse.ArgumentParser(description="Migration SQLite → MongoDB")
+parser.add_argument("--plan", action="store_true",
+                    help="Estime la taille des documents et la durée de chargement sans rien écrire dans MongoDB")
+parser.add_argument("--dump", metavar="DOSSIER",
+                    help="Écrit les documents dans des fichiers de dump (un par lot) au lieu de MongoDB")
+parser.add_argument("--dump-format", choices=["bson", "ndjson"], default="bson",
+                    help="Format des fichiers de dump (BSON ou NDJSON, compressés gzip)")
+args = parser.parse_args()
+
+# --- MODE PLAN (aucune connexion MongoDB) ---
+if args.plan:
+    conn = sqlite3.connect(SQLITE_PATH)
+    print_migration_plan(build_migration_plan(conn, GEOJSON_PATH))
+    conn.close()
+    sys.exit(0)
 
 # --- CONNEXIONS ---
 print("Connexion à la base SQLite...")
 conn = sqlite3.connect(SQLITE_PATH)
 
-print("Connexion à MongoDB...")
-client = MongoClient(MONGO_URI)
-db = client[MONGO_DB_NAME]
-
-# Nettoyage préalable
-print("Nettoyage des collections existantes...")
-db.Lignes.drop()
-db.Arrets.drop()
-db.Vehicules.drop()
-db.Trafic.drop()
-db.Quartiers.drop()  # Nouvelle collection
+if args.dump:
+    print(f"Mode dump : écriture dans {args.dump} (aucune connexion MongoDB)")
+    client, db = None, None
+else:
+    print("Connexion à MongoDB...")
+    client = MongoClient(MONGO_URI)
+    db = client[MONGO_DB_NAME]
+
+    # Nettoyage préalable
+    print("Nettoyage des collections existantes...")
+    db.Lignes.drop()
+    db.Arrets.drop()
+    db.Vehicules.drop()
+    db.Trafic.drop()
+    db.Quartiers.drop()  # Nouvelle collection
 
 # --- CHARGEMENT ET PRÉ-TRAITEMENT DES DONNÉES ---
 print("Chargement et pré-traitement des DataFrames...")
@@ -101,13 +136,36 @@ def chunked(seq, size):
     for i in range(0, len(seq), size):
         yield seq[i:i + size]
 
+# Index créés en fin de migration (repris tels quels par dump_restore.py)
+INDEXES = [
+    ("Arrets", [("location", GEOSPHERE)]),
+    ("Quartiers", [("geometry", GEOSPHERE)]),  # Index géospatial pour les quartiers
+    ("Quartiers", [("id_quartier", 1)]),
+    ("Lignes", [("id_ligne", 1)]),
+    ("Arrets", [("id_ligne", 1)]),
+    ("Arrets", [("quartiers.id_quartier", 1)]),
+    ("Vehicules", [("id_ligne", 1)]),
+    ("Trafic", [("id_ligne", 1)]),
+    ("Trafic", [("horodatage", 1)]),
+]
+
+dump_files = {}
+
+def write_collection(name, docs, batch_size=None):
+    """Insère les documents par lots dans MongoDB, ou écrit un fichier de dump par lot."""
+    for i, batch in enumerate(chunked(docs, batch_size or max(len(docs), 1))):
+        if args.dump:
+            dump_files.setdefault(name, []).append(write_chunk(args.dump, name, i, batch, args.dump_format))
+        else:
+            db[name].insert_many(batch, ordered=False, bypass_document_validation=True)
+
 # =============================================================================
 # COLLECTION 1 : LIGNES
 # =============================================================================
 print("\nMigration LIGNES...")
 docs_lignes = lignes.to_dict(orient="records")
 if docs_lignes:
-    db.Lignes.insert_many(docs_lignes)
+    write_collection("Lignes", docs_lignes)
     total_stats["lignes"] = len(docs_lignes)
 
 # =============================================================================
@@ -118,7 +176,7 @@ docs_quartiers = []
 
 # Charger le fichier GeoJSON réel
 import json
-geojson_path = "data/paris_quartiers_real.geojson"
+geojson_path = GEOJSON_PATH
 
 try:
     with open(geojson_path, 'r', encoding='utf-8') as f:
@@ -202,7 +260,7 @@ except FileNotFoundError:
             continue
 
 if docs_quartiers:
-    db.Quartiers.insert_many(docs_quartiers)
+    write_collection("Quartiers", docs_quartiers)
     total_stats["quartiers"] = len(docs_quartiers)
     real_count = sum(1 for q in docs_quartiers if q.get('is_real_paris', False))
     print(f"📊 Quartiers réels de Paris : {real_count}/{len(docs_quartiers)}")
@@ -249,8 +307,7 @@ for arret in tqdm(arrets.to_dict(orient="records"), total=len(arrets), disable=F
     docs_arrets.append(doc)
 
 if docs_arrets:
-    for batch in chunked(docs_arrets, 5000):
-        db.Arrets.insert_many(batch, ordered=False, bypass_document_validation=True)
+    write_collection("Arrets", docs_arrets, 5000)
     total_stats["arrets"] = len(docs_arrets)
 
 # =============================================================================
@@ -275,8 +332,7 @@ for row in tqdm(vehicules_full.itertuples(index=False), total=len(vehicules_full
     })
 
 if docs_vehicules:
-    for batch in chunked(docs_vehicules, 10000):
-        db.Vehicules.insert_many(batch, ordered=False, bypass_document_validation=True)
+    write_collection("Vehicules", docs_vehicules, 10000)
     total_stats["vehicules"] = len(docs_vehicules)
 
 # =============================================================================
@@ -299,21 +355,27 @@ for row in tqdm(trafics.itertuples(index=False), total=len(trafics)):
     })
 
 if docs_trafic:
-    for batch in chunked(docs_trafic, 10000):
-        db.Trafic.insert_many(batch, ordered=False, bypass_document_validation=True)
+    write_collection("Trafic", docs_trafic, 10000)
     total_stats["trafic"] = len(docs_trafic)
 
 # --- INDEXATION ---
-print("\nCréation des index (dont Géospatial)...")
-db.Arrets.create_index([("location", GEOSPHERE)])
-db.Quartiers.create_index([("geometry", GEOSPHERE)])  # Index géospatial pour les quartiers
-db.Quartiers.create_index("id_quartier")
-db.Lignes.create_index("id_ligne")
-db.Arrets.create_index("id_ligne")
-db.Arrets.create_index("quartiers.id_quartier")
-db.Vehicules.create_index("id_ligne")
-db.Trafic.create_index("id_ligne")
-db.Trafic.create_index("horodatage")
+if args.dump:
+    print("\nÉcriture du manifest (index créés à la restauration)...")
+    write_manifest(args.dump, args.dump_format, dump_files,
+                   {"Lignes": total_stats["lignes"], "Quartiers": total_stats["quartiers"],
+                    "Arrets": total_stats["arrets"], "Vehicules": total_stats["vehicules"],
+                    "Trafic": total_stats["trafic"]},
+                   INDEXES)
+else:
+    print("\nCréation des index (dont Géospatial)...")
+    for collection, keys in INDEXES:
+        db[collection].create_index(keys)
+    print(f"Résumé environnemental par ligne ({ENV_SUMMARY_COLLECTION})...")
+    build_env_summary(db)
+    print("Moyennes environnementales et séries CO2 par arrêt...")
+    build_stop_summaries(db)
+    # Nouvel identifiant de chargement : invalide le cache des requêtes MongoDB
+    record_data_version(db, "migration")
 
 # --- RÉSUMÉ ---
 print("\n" + "="*60)
@@ -326,5 +388,8 @@ print(f"Véhicules   : {total_stats['vehicules']}")
 print(f"Trafic      : {total_stats['trafic']}")
 print(f"Mesures     : {total_stats['mesures']} (imbriquées)")
 print(f"Incidents   : {total_stats['incidents']} (imbriqués)")
+if args.dump:
+    print(f"Dump        : {sum(len(f) for f in dump_files.values())} fichier(s) dans {args.dump}")
 conn.close()
-client.close()
\ No newline at end of file
+if client is not None:
+    client.close()
\ No newline at end of file
@@ -0,0 +1,314 @@
+"""
+==============================================================
+Partie 2 — Planification de la migration (mode --plan)
+==============================================================
+
+Estime la taille des documents MongoDB AVANT la migration, sans
+construire les documents :
+1. Comptages SQLite par groupe (mesures par capteur, horaires et
+   quartiers par arrêt, incidents par trafic).
+2. Taille BSON d'un document « squelette » par type d'élément
+   imbriqué, multipliée par les comptages.
+3. Distribution des tailles, document le plus lourd, volume total,
+   lot d'insertion le plus lourd et durée de chargement estimée.
+4. Alerte si un arrêt dépasse la limite de 16 MB et recommandation
+   (imbrication complète ou bucketing des mesures).
+
+==============================================================
+"""
+
+import json
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import bson
+
+BSON_MAX_DOCUMENT_SIZE = 16 * 1024 * 1024   # Limite MongoDB par document
+MAX_MESSAGE_SIZE = 48 * 1000 * 1000         # Taille max d'un message insert_many côté serveur
+WARNING_RATIO = 0.5                         # Alerte dès 50 % de la limite
+LOAD_THROUGHPUT_MB_S = 25                   # Débit d'insertion supposé (MB/s)
+OBJECT_ID_SIZE = 1 + len("_id") + 1 + 12
+
+# Taille des lots utilisés par migration.py
+BATCH_SIZES = {"Lignes": None, "Quartiers": None, "Arrets": 5000, "Vehicules": 10000, "Trafic": 10000}
+
+
+def doc_size(doc):
+    """Taille BSON exacte d'un document squelette (+ _id ajouté par MongoDB)."""
+    return len(bson.encode(doc)) + OBJECT_ID_SIZE
+
+
+def array_extra_size(counts, elem_size):
+    """
+    Surcoût BSON d'un tableau de n éléments par rapport au tableau vide.
+    Chaque élément coûte : 1 octet de type + clé "i" (chiffres + \\0) + valeur.
+    La somme des chiffres des clés 0..n-1 vaut n + sum_k max(0, n - 10^k).
+    """
+    n = np.asarray(counts, dtype=np.int64)
+    digits = n.copy()
+    power = 10
+    while power <= (n.max() if n.size else 0):
+        digits += np.maximum(0, n - power)
+        power *= 10
+    return 2 * n + digits + n * elem_size
+
+
+def avg_length(conn, table, column):
+    """Longueur moyenne (en octets UTF-8) d'une colonne texte."""
+    value = conn.execute(
+        f"SELECT AVG(LENGTH(CAST({column} AS BLOB))) FROM {table}"
+    ).fetchone()[0]
+    return int(round(value or 0))
+
+
+def group_counts(conn, table, key):
+    """Comptage SQLite par groupe : {clé -> nombre de lignes}."""
+    return pd.read_sql_query(
+        f"SELECT {key}, COUNT(*) AS nb FROM {table} GROUP BY {key}", conn
+    ).set_index(key)["nb"]
+
+
+def summarize(name, sizes, batch_size=None):
+    """Distribution des tailles d'une collection et lot le plus lourd."""
+    sizes = pd.Series(sizes, dtype="int64")
+    total = int(sizes.sum())
+    if batch_size:
+        heaviest_batch = int(sizes.groupby(np.arange(len(sizes)) // batch_size).sum().max()) if len(sizes) else 0
+    else:
+        heaviest_batch = total
+    return {
+        "collection": name,
+        "documents": int(len(sizes)),
+        "min": int(sizes.min()) if len(sizes) else 0,
+        "p50": int(sizes.quantile(0.50)) if len(sizes) else 0,
+        "p90": int(sizes.quantile(0.90)) if len(sizes) else 0,
+        "p99": int(sizes.quantile(0.99)) if len(sizes) else 0,
+        "max": int(sizes.max()) if len(sizes) else 0,
+        "total": total,
+        "batch_size": batch_size,
+        "heaviest_batch": heaviest_batch,
+    }
+
+
+def estimate_arrets(conn):
+    """Tailles estimées des documents Arrets (capteurs + mesures + horaires + quartiers imbriqués)."""
+    now = datetime(2053, 1, 1)
+
+    mesure_size = len(bson.encode({
+        "horodatage": now, "valeur": 0.0, "unite": "x" * avg_length(conn, "Mesure", "unite")
+    }))
+    horaire_size = len(bson.encode({
+        "id_vehicule": 0,
+        "heure_prevue": "x" * avg_length(conn, "Horaire", "heure_prevue"),
+        "heure_effective": "x" * avg_length(conn, "Horaire", "heure_effective"),
+        "passagers_estimes": 0
+    }))
+    quartier_size = len(bson.encode({"id_quartier": 0, "nom": "x" * avg_length(conn, "Quartier", "nom")}))
+
+    # Capteurs : taille du sous-document (sans mesures) + mesures imbriquées
+    capteurs = pd.read_sql_query(
+        "SELECT id_capteur, id_arret, LENGTH(CAST(type_capteur AS BLOB)) AS len_type FROM Capteur", conn
+    )
+    mesures_par_capteur = group_counts(conn, "Mesure", "id_capteur")
+    capteurs["nb_mesures"] = capteurs["id_capteur"].map(mesures_par_capteur).fillna(0).astype("int64")
+    capteur_base = len(bson.encode({
+        "id_capteur": 0, "type_capteur": "",
+        "location": {"type": "Point", "coordinates": [0.0, 0.0]},
+        "mesures": []
+    }))
+    capteurs["taille"] = (
+        capteur_base + capteurs["len_type"].fillna(0).astype("int64")
+        + array_extra_size(capteurs["nb_mesures"], mesure_size)
+    )
+    # Rang du capteur dans le tableau de l'arrêt (coût de la clé "0", "1", ...)
+    capteurs["rang"] = capteurs.groupby("id_arret").cumcount()
+    capteurs["taille_elem"] = capteurs["taille"] + 2 + capteurs["rang"].astype(str).str.len()
+    capteurs_par_arret = capteurs.groupby("id_arret").agg(
+        taille_capteurs=("taille_elem", "sum"),
+        nb_capteurs=("id_capteur", "count"),
+        nb_mesures=("nb_mesures", "sum"),
+        max_mesures_capteur=("nb_mesures", "max")
+    )
+
+    arrets = pd.read_sql_query(
+        "SELECT id_arret, LENGTH(CAST(nom AS BLOB)) AS len_nom FROM Arret", conn
+    )
+    arret_base = doc_size({
+        "id_arret": 0, "nom": "", "id_ligne": 0,
+        "location": {"type": "Point", "coordinates": [0.0, 0.0]},
+        "latitude": 0.0, "longitude": 0.0,
+        "quartiers": [], "capteurs": [], "horaires": []
+    })
+    nb_horaires = arrets["id_arret"].map(group_counts(conn, "Horaire", "id_arret")).fillna(0).astype("int64")
+    nb_quartiers = arrets["id_arret"].map(group_counts(conn, "ArretQuartier", "id_arret")).fillna(0).astype("int64")
+    arrets = arrets.join(capteurs_par_arret, on="id_arret")
+    arrets[["taille_capteurs", "nb_capteurs", "nb_mesures", "max_mesures_capteur"]] = (
+        arrets[["taille_capteurs", "nb_capteurs", "nb_mesures", "max_mesures_capteur"]].fillna(0).astype("int64")
+    )
+    arrets["nb_horaires"] = nb_horaires
+    arrets["taille"] = (
+        arret_base + arrets["len_nom"].fillna(0).astype("int64")
+        + arrets["taille_capteurs"]
+        + array_extra_size(nb_horaires, horaire_size)
+        + array_extra_size(nb_quartiers, quartier_size)
+    )
+    return arrets, mesure_size
+
+
+def estimate_trafic(conn):
+    """Tailles estimées des documents Trafic (incidents imbriqués)."""
+    incident_size = len(bson.encode({
+        "description": "x" * avg_length(conn, "Incident", "description"),
+        "gravite": 0,
+        "horodatage": datetime(2053, 1, 1)
+    }))
+    trafic_base = doc_size({
+        "id_trafic": 0, "id_ligne": 0, "horodatage": datetime(2053, 1, 1),
+        "retard_minutes": 0, "evenement": "x" * avg_length(conn, "Trafic", "evenement"),
+        "incidents": []
+    })
+    trafic = pd.read_sql_query("SELECT id_trafic FROM Trafic", conn)
+    nb_incidents = trafic["id_trafic"].map(group_counts(conn, "Incident", "id_trafic")).fillna(0).astype("int64")
+    return trafic_base + array_extra_size(nb_incidents, incident_size)
+
+
+def estimate_vehicules(conn):
+    """Tailles estimées des documents Vehicules (chauffeur imbriqué)."""
+    size = doc_size({
+        "id_vehicule": 0,
+        "immatriculation": "x" * avg_length(conn, "Vehicule", "immatriculation"),
+        "id_ligne": 0,
+        "type_vehicule": "x" * avg_length(conn, "Vehicule", "type_vehicule"),
+        "capacite": 0,
+        "chauffeur": {"id_chauffeur": 0, "nom": "x" * avg_length(conn, "Chauffeur", "nom"), "date_embauche": datetime(2053, 1, 1)}
+    })
+    nb = conn.execute("SELECT COUNT(*) FROM Vehicule").fetchone()[0]
+    return np.full(nb, size, dtype=np.int64)
+
+
+def estimate_lignes(conn):
+    """Tailles estimées des documents Lignes (copie directe de la table)."""
+    size = doc_size({
+        "id_ligne": 0, "nom_ligne": "x" * avg_length(conn, "Ligne", "nom_ligne"),
+        "type": "x" * avg_length(conn, "Ligne", "type"), "frequentation_moyenne": 0
+    })
+    nb = conn.execute("SELECT COUNT(*) FROM Ligne").fetchone()[0]
+    return np.full(nb, size, dtype=np.int64)
+
+
+def estimate_quartiers(geojson_path):
+    """Tailles estimées des documents Quartiers (géométrie GeoJSON réelle)."""
+    try:
+        with open(geojson_path, 'r', encoding='utf-8') as f:
+            features = json.load(f)["features"]
+    except FileNotFoundError:
+        return np.array([], dtype=np.int64)
+    base = doc_size({
+        "id_quartier": 0, "nom": "", "nom_officiel": "", "code_quartier": "",
+        "arrondissement": 0, "geometry": {}, "surface": 0.0, "perimetre": 0.0, "is_real_paris": True
+    })
+    return np.array([
+        base + len(bson.encode(f["geometry"])) + 2 * len((f["properties"].get("l_qu") or "").encode("utf-8"))
+        for f in features
+    ], dtype=np.int64)
+
+
+def estimate_bucket_size(conn, mesure_size):
+    """Taille max d'un bucket de mesures (un document par capteur et par mois)."""
+    row = conn.execute("""
+        SELECT MAX(nb) FROM (
+            SELECT COUNT(*) AS nb FROM Mesure
+            GROUP BY id_capteur, strftime('%Y-%m', horodatage)
+        )
+    """).fetchone()
+    max_mesures = row[0] or 0
+    bucket_base = doc_size({"id_capteur": 0, "id_arret": 0, "mois": "2053-01", "nb": 0, "mesures": []})
+    return max_mesures, int(bucket_base + array_extra_size([max_mesures], mesure_size)[0])
+
+
+def build_migration_plan(conn, geojson_path):
+    """Construit le plan complet : statistiques par collection + alertes."""
+    arrets, mesure_size = estimate_arrets(conn)
+    collections = [
+        summarize("Lignes", estimate_lignes(conn)),
+        summarize("Quartiers", estimate_quartiers(geojson_path)),
+        summarize("Arrets", arrets["taille"], BATCH_SIZES["Arrets"]),
+        summarize("Vehicules", estimate_vehicules(conn), BATCH_SIZES["Vehicules"]),
+        summarize("Trafic", estimate_trafic(conn), BATCH_SIZES["Trafic"]),
+    ]
+
+    warnings = []
+    recommendations = []
+
+    trop_gros = arrets[arrets["taille"] > BSON_MAX_DOCUMENT_SIZE]
+    proches = arrets[(arrets["taille"] > BSON_MAX_DOCUMENT_SIZE * WARNING_RATIO) & (arrets["taille"] <= BSON_MAX_DOCUMENT_SIZE)]
+    if not trop_gros.empty:
+        pire = trop_gros.sort_values("taille", ascending=False).iloc[0]
+        warnings.append(
+            f"{len(trop_gros)} arrêt(s) dépassent la limite de 16 MB "
+            f"(pire : id_arret={int(pire['id_arret'])}, {pire['taille'] / 1e6:.1f} MB, "
+            f"{int(pire['nb_mesures'])} mesures)"
+        )
+    if not proches.empty:
+        warnings.append(f"{len(proches)} arrêt(s) dépassent {int(WARNING_RATIO * 100)} % de la limite de 16 MB")
+
+    for stats in collections:
+        if stats["heaviest_batch"] > MAX_MESSAGE_SIZE:
+            recommended = max(1, int(MAX_MESSAGE_SIZE // max(stats["p99"], 1)))
+            warnings.append(
+                f"Lot {stats['collection']} le plus lourd : {stats['heaviest_batch'] / 1e6:.1f} MB "
+                f"(> {MAX_MESSAGE_SIZE / 1e6:.0f} MB, le driver devra le découper)"
+            )
+            recommendations.append(f"Réduire la taille des lots {stats['collection']} à ~{recommended} documents")
+
+    if not trop_gros.empty or not proches.empty:
+        max_mesures, bucket_size = estimate_bucket_size(conn, mesure_size)
+        recommendations.append(
+            "Bucketing : sortir capteurs.mesures dans une collection Mesures "
+            f"(un document par capteur et par mois, max {max_mesures} mesures ≈ {bucket_size / 1e3:.0f} KB), "
+            "en gardant dans Arrets uniquement les capteurs et des résumés (moyennes)"
+        )
+    else:
+        recommendations.append(
+            f"Imbrication complète OK : l'arrêt le plus lourd fait {arrets['taille'].max() / 1e6:.2f} MB "
+            f"({arrets['taille'].max() / BSON_MAX_DOCUMENT_SIZE:.1%} de la limite)"
+        )
+
+    total_bytes = sum(s["total"] for s in collections)
+    return {
+        "collections": collections,
+        "total_bytes": total_bytes,
+        "load_seconds": total_bytes / (LOAD_THROUGHPUT_MB_S * 1e6),
+        "warnings": warnings,
+        "recommendations": recommendations,
+    }
+
+
+def print_migration_plan(plan):
+    """Affiche le plan de migration sous forme de tableau."""
+    print("\n" + "=" * 60)
+    print("PLAN DE MIGRATION (estimation, aucune écriture MongoDB)")
+    print("=" * 60)
+    df = pd.DataFrame(plan["collections"]).set_index("collection")
+    for col in ["min", "p50", "p90", "p99", "max"]:
+        df[col] = df[col].map(lambda v: f"{v / 1e3:.1f} KB")
+    df["total"] = df["total"].map(lambda v: f"{v / 1e6:.1f} MB")
+    df["heaviest_batch"] = df["heaviest_batch"].map(lambda v: f"{v / 1e6:.1f} MB")
+    df["batch_size"] = df["batch_size"].map(lambda v: "tout" if pd.isna(v) else str(int(v)))
+    print(df.to_string())
+    print("-" * 60)
+    print(f"Volume total estimé     : {plan['total_bytes'] / 1e6:.1f} MB")
+    print(f"Durée de chargement     : ~{plan['load_seconds']:.0f} s (à {LOAD_THROUGHPUT_MB_S} MB/s)")
+    for w in plan["warnings"]:
+        print(f"⚠️ {w}")
+    for r in plan["recommendations"]:
+        print(f"💡 {r}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    conn = sqlite3.connect("data/Paris2055.sqlite")
+    print_migration_plan(build_migration_plan(conn, "data/paris_quartiers_real.geojson"))
+    conn.close()
@@ -0,0 +1,170 @@
+"""
+Parcours unique de la collection Arrets pour plusieurs résultats.
+
+Les requêtes e, h et m et la choroplèthe CO2 du tableau de bord
+parcourent chacune toute la collection Arrets et redéplient capteurs et
+mesures. Ici un seul curseur alimente plusieurs accumulateurs ; chaque
+résultat est ensuite mis en forme comme la requête ou la fonction
+d'origine (mêmes champs, même tri).
+
+Chaque sortie est un triplet (init, add, finish) : état initial, ajout
+d'un document Arrets, résultat final. Le calcul est fait côté client :
+un $facet renverrait toutes les sorties dans un seul document, limité à
+16 MB (la requête m produit une ligne par mesure).
+
+    scan_arrets(db, ["e", "m", "co2_quartier"])
+"""
+
+import re
+from numbers import Number
+
+# Champs lus par au moins une sortie
+PROJECTION = {"quartiers": 1, "capteurs": 1}
+
+CO2_RE = re.compile("CO2", re.IGNORECASE)
+
+
+def is_number(value):
+    """Valeurs prises en compte par $avg (les booléens et les null sont ignorés)."""
+    return isinstance(value, Number) and not isinstance(value, bool)
+
+
+def as_list(value):
+    """Éléments produits par $unwind (rien pour null, manquant ou tableau vide)."""
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def measures(capteur):
+    return as_list(capteur.get("mesures"))
+
+
+def add_values(acc, key, values):
+    """Ajoute des valeurs à une moyenne groupée {clé: [somme, n]} ; le groupe existe même sans valeur numérique."""
+    total = acc.setdefault(key, [0, 0])
+    for v in values:
+        if is_number(v):
+            total[0] += v
+            total[1] += 1
+
+
+def mean(total):
+    return total[0] / total[1] if total[1] else None
+
+
+def coordinates(doc):
+    location = doc.get("location")
+    coords = location.get("coordinates") if isinstance(location, dict) else None
+    return coords if isinstance(coords, list) and len(coords) >= 2 else None
+
+
+def mongo_sort_key(value):
+    """Ordre de tri MongoDB simplifié : null < nombres < chaînes."""
+    if value is None:
+        return (0, 0)
+    if is_number(value):
+        return (1, value)
+    return (2, str(value))
+
+
+# --- e. Top 5 des quartiers les plus bruyants ---
+
+def add_bruit_quartier(acc, arret):
+    bruit = [m.get("valeur") for c in as_list(arret.get("capteurs"))
+             if c.get("type_capteur") == "Bruit" for m in measures(c)]
+    if not bruit:
+        return
+    for quartier in as_list(arret.get("quartiers")):
+        add_values(acc, quartier.get("nom"), bruit)
+
+
+def finish_bruit_quartier(acc):
+    rows = [{"_id": nom, "quartier_nom": nom, "avg_bruit": mean(total)} for nom, total in acc.items()]
+    # avg_bruit décroissant (null en dernier), puis nom
+    rows.sort(key=lambda r: mongo_sort_key(r["_id"]))
+    rows.sort(key=lambda r: mongo_sort_key(r["avg_bruit"]), reverse=True)
+    return rows[:5]
+
+
+# --- h. Nombre d'arrêts par quartier ---
+
+def add_arrets_quartier(acc, arret):
+    for quartier in as_list(arret.get("quartiers")):
+        acc[quartier.get("nom")] = acc.get(quartier.get("nom"), 0) + 1
+
+
+def finish_arrets_quartier(acc):
+    rows = [{"_id": nom, "quartier_nom": nom, "arret_count": n} for nom, n in acc.items()]
+    rows.sort(key=lambda r: mongo_sort_key(r["quartier_nom"]))
+    rows.sort(key=lambda r: r["arret_count"], reverse=True)
+    return rows
+
+
+# --- m. Classification pollution avec localisation ---
+
+def niveau_pollution(valeur):
+    # $lt MongoDB : null / manquant < nombres < chaînes
+    if valeur is None or (is_number(valeur) and valeur < 400):
+        return "faible"
+    if is_number(valeur) and valeur < 500:
+        return "moyen"
+    return "élevé"
+
+
+def add_pollution(acc, arret):
+    for capteur in as_list(arret.get("capteurs")):
+        if capteur.get("type_capteur") != "CO2":
+            continue
+        coords = coordinates(capteur)
+        for mesure in measures(capteur):
+            row = {"id_capteur": capteur.get("id_capteur"), "valeur": mesure.get("valeur"),
+                   "niveau_pollution": niveau_pollution(mesure.get("valeur"))}
+            if coords:
+                row["latitude"], row["longitude"] = coords[1], coords[0]
+            acc.append(row)
+
+
+def finish_pollution(acc):
+    acc.sort(key=lambda r: mongo_sort_key(r["id_capteur"]))
+    return acc
+
+
+# --- Tableau de bord : CO2 moyen par quartier (choroplèthe) ---
+
+def add_co2_quartier(acc, arret):
+    co2 = [m.get("valeur") for c in as_list(arret.get("capteurs"))
+           if isinstance(c.get("type_capteur"), str) and CO2_RE.search(c["type_capteur"])
+           for m in measures(c)]
+    if not co2:
+        return
+    for quartier in as_list(arret.get("quartiers")):
+        add_values(acc, (quartier.get("id_quartier"), quartier.get("nom")), co2)
+
+
+def finish_co2_quartier(acc):
+    rows = [{"id_quartier": id_q, "nom_quartier": nom, "avg_co2": mean(total)} for (id_q, nom), total in acc.items()]
+    rows.sort(key=lambda r: mongo_sort_key(r["avg_co2"]), reverse=True)
+    return rows
+
+
+OUTPUTS = {
+    "e": (dict, add_bruit_quartier, finish_bruit_quartier),
+    "h": (dict, add_arrets_quartier, finish_arrets_quartier),
+    "m": (list, add_pollution, finish_pollution),
+    "co2_quartier": (dict, add_co2_quartier, finish_co2_quartier),
+}
+# Requêtes du registre MongoDB calculables par le parcours unique
+FUSED_QUERIES = ["e", "h", "m"]
+
+
+def scan_arrets(db, outputs, batch_size=500, max_time_ms=None):
+    """
+    Parcourt Arrets une seule fois et renvoie {sortie: résultat} pour les sorties demandées.
+    max_time_ms : délai maximal côté serveur (maxTimeMS) du parcours.
+    """
+    states = {name: OUTPUTS[name][0]() for name in outputs}
+    for arret in db.Arrets.find({}, PROJECTION, batch_size=batch_size, max_time_ms=max_time_ms):
+        for name, state in states.items():
+            OUTPUTS[name][1](state, arret)
+    return {name: OUTPUTS[name][2](state) for name, state in states.items()}
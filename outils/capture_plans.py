@@ -0,0 +1,259 @@
+"""
+Capture des plans d'exécution des requêtes a–n et rapport de régressions.
+
+Pour chaque requête des registres (requetes_sql/sql_registry.py et
+requetes_mongodb/mongo_registry.py) :
+- SQLite : EXPLAIN QUERY PLAN de chaque SELECT (tables parcourues en
+  entier et leur nombre de lignes, index utilisés, B-tree temporaires
+  pour GROUP BY / ORDER BY) ;
+- MongoDB : explain "executionStats" de chaque pipeline (étapes, index,
+  documents / clés examinés, tris bloquants, débordement sur disque).
+
+Les plans sont enregistrés dans un instantané JSON puis comparés à une
+référence : un plan qui change est signalé, un plan qui se dégrade
+(lignes ou documents parcourus multipliés, nouveau COLLSCAN, index
+perdu, tri en mémoire, écriture sur disque) est une régression.
+
+Utilisation :
+    python outils/capture_plans.py --update-baseline   # fige la référence
+    python outils/capture_plans.py                     # capture + comparaison
+    python outils/capture_plans.py --backend sql a c   # sous-ensemble
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+from datetime import datetime
+from math import sqrt
+from pathlib import Path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "requetes_sql"))
+sys.path.append(os.path.join(ROOT, "requetes_mongodb"))
+
+SQLITE_PATH = "data/Paris2055.sqlite"
+MONGO_URI = "mongodb://localhost:27017/"
+DB_NAME = "Paris2055"
+PLANS_DIR = "plans_requetes"
+BASELINE_PATH = os.path.join(PLANS_DIR, "baseline.json")
+SNAPSHOT_PATH = os.path.join(PLANS_DIR, "snapshot.json")
+
+# Lignes / documents (ou clés) examinés : au-delà de ce facteur par rapport à la référence, régression
+EXAMINED_RATIO = 2.0
+
+FULL_SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\w+)$")
+INDEX_RE = re.compile(r"USING (?:COVERING )?INDEX (\w+)")
+ALIAS_RE = re.compile(r"(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+
+
+# --- SQLite ---
+
+def table_rows(conn, table, cache):
+    if table not in cache:
+        cache[table] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    return cache[table]
+
+
+def sqlite_plan(conn, sql_statements, row_counts):
+    """
+    Plan structuré d'une requête SQL (un ou plusieurs SELECT). Un parcours
+    complet est pondéré par le nombre de lignes de la table : parcourir
+    Capteur au lieu de Mesure change le plan mais n'est pas une régression.
+    """
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    steps, full_scans, indexes, temp_btrees = [], [], [], []
+    scanned_rows = 0
+    for sql in sql_statements:
+        aliases = {alias: table for table, alias in ALIAS_RE.findall(sql) if alias and table in tables}
+        for _, _, _, detail in conn.execute(f"EXPLAIN QUERY PLAN {sql}"):
+            steps.append(detail)
+            scan = FULL_SCAN_RE.match(detail)
+            if scan:
+                table = aliases.get(scan.group(1), scan.group(1))
+                full_scans.append(table)
+                if table in tables:
+                    scanned_rows += table_rows(conn, table, row_counts)
+            index = INDEX_RE.search(detail)
+            if index:
+                indexes.append(index.group(1))
+            if "TEMP B-TREE" in detail:
+                temp_btrees.append(detail)
+    return {"steps": steps, "full_scans": sorted(full_scans), "scanned_rows": scanned_rows,
+            "indexes": sorted(set(indexes)), "temp_btrees": sorted(temp_btrees)}
+
+
+def capture_sql(db_path, names=None, summary=None):
+    from sql_registry import select_queries, statements
+    from summary_tables import has_summary_tables
+
+    conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    conn.create_function("SQRT", 1, sqrt)
+    # Même choix de variante que requete_sql.py
+    if summary is None:
+        summary = has_summary_tables(conn)
+    row_counts = {}
+    plans = {q["name"]: sqlite_plan(conn, statements(q, summary), row_counts) for q in select_queries(names)}
+    conn.close()
+    return plans
+
+
+# --- MongoDB ---
+
+def walk_explain(node, stats):
+    """Parcourt récursivement une sortie explain et cumule les indicateurs utiles."""
+    if isinstance(node, list):
+        for item in node:
+            walk_explain(item, stats)
+        return
+    if not isinstance(node, dict):
+        return
+    stage = node.get("stage")
+    if isinstance(stage, str):
+        stats["stages"].append(stage)
+        if stage == "COLLSCAN":
+            stats["collscans"] += 1
+        if stage == "SORT":
+            stats["blocking_sorts"] += 1
+    if "indexName" in node:
+        stats["indexes"].add(node["indexName"])
+    # Totaux de executionStats et des étapes $lookup (executionStages n'est pas parcouru : doublon du plan)
+    if isinstance(node.get("totalDocsExamined"), (int, float)):
+        stats["docs_examined"] += node["totalDocsExamined"]
+    if isinstance(node.get("totalKeysExamined"), (int, float)):
+        stats["keys_examined"] += node["totalKeysExamined"]
+    if node.get("usedDisk") is True or (isinstance(node.get("spills"), int) and node["spills"] > 0):
+        stats["used_disk"] = True
+    if isinstance(node.get("executionTimeMillis"), (int, float)):
+        stats["execution_ms"] = max(stats["execution_ms"], node["executionTimeMillis"])
+    for key, value in node.items():
+        # Étapes d'agrégation ($lookup, $group...) : une clé "$..." par étape
+        if key.startswith("$") and isinstance(value, dict):
+            stats["stages"].append(key)
+        if key in ("winningPlan", "executionStats", "inputStage", "inputStages", "queryPlan",
+                   "stages", "shards", "queryPlanner", "$cursor") or key.startswith("$"):
+            walk_explain(value, stats)
+
+
+def mongo_plan(db, collection, pipeline):
+    explain = db.command("explain", {"aggregate": collection, "pipeline": pipeline, "cursor": {}},
+                         verbosity="executionStats")
+    stats = {"stages": [], "indexes": set(), "collscans": 0, "blocking_sorts": 0,
+             "docs_examined": 0, "keys_examined": 0, "used_disk": False, "execution_ms": 0}
+    walk_explain(explain, stats)
+    stats["indexes"] = sorted(stats["indexes"])
+    stats["collection"] = collection
+    return stats
+
+
+def capture_mongo(names=None):
+    from pymongo import MongoClient
+    from mongo_registry import pipelines, select_queries
+
+    client = MongoClient(MONGO_URI)
+    db = client[DB_NAME]
+    plans = {q["name"]: [mongo_plan(db, coll, p) for coll, p in pipelines(q)] for q in select_queries(names)}
+    client.close()
+    return plans
+
+
+# --- Comparaison ---
+
+def compare_sql(name, old, new):
+    changes, regressions = [], []
+    if old["steps"] != new["steps"]:
+        changes.append(f"sql {name} : plan modifié")
+    if new["scanned_rows"] > EXAMINED_RATIO * old["scanned_rows"]:
+        regressions.append(f"sql {name} : lignes parcourues en entier {old['scanned_rows']} → {new['scanned_rows']}"
+                           f" ({', '.join(new['full_scans'])})")
+    if len(new["temp_btrees"]) > len(old["temp_btrees"]):
+        regressions.append(f"sql {name} : B-tree temporaire supplémentaire ({', '.join(new['temp_btrees'])})")
+    return changes, regressions
+
+
+def compare_mongo(name, old_list, new_list):
+    changes, regressions = [], []
+    if len(old_list) != len(new_list):
+        return [f"mongo {name} : nombre de pipelines modifié"], []
+    for k, (old, new) in enumerate(zip(old_list, new_list)):
+        label = f"mongo {name}" + (f"[{k}]" if len(new_list) > 1 else "")
+        if old["stages"] != new["stages"] or old["indexes"] != new["indexes"]:
+            changes.append(f"{label} : plan modifié")
+        if new["collscans"] > old["collscans"]:
+            regressions.append(f"{label} : COLLSCAN supplémentaire sur {new['collection']}")
+        for index in sorted(set(old["indexes"]) - set(new["indexes"])):
+            regressions.append(f"{label} : index plus utilisé ({index})")
+        if new["blocking_sorts"] > old["blocking_sorts"]:
+            regressions.append(f"{label} : tri bloquant en mémoire supplémentaire")
+        if new["used_disk"] and not old["used_disk"]:
+            regressions.append(f"{label} : écriture sur disque (allowDiskUse)")
+        for key in ("docs_examined", "keys_examined"):
+            if old[key] and new[key] > EXAMINED_RATIO * old[key]:
+                regressions.append(f"{label} : {key} {old[key]} → {new[key]}")
+    return changes, regressions
+
+
+def compare(baseline, snapshot):
+    """Renvoie (changements, régressions) entre la référence et l'instantané."""
+    changes, regressions = [], []
+    for backend, compare_one in (("sql", compare_sql), ("mongo", compare_mongo)):
+        old_plans, new_plans = baseline.get(backend, {}), snapshot.get(backend, {})
+        for name in sorted(new_plans):
+            if name not in old_plans:
+                changes.append(f"{backend} {name} : absent de la référence")
+                continue
+            c, r = compare_one(name, old_plans[name], new_plans[name])
+            changes += c
+            regressions += r
+    return changes, regressions
+
+
+def save(path, snapshot):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capture et compare les plans d'exécution des requêtes a–n")
+    parser.add_argument("queries", nargs="*", help="Sous-ensemble de requêtes (par défaut : toutes)")
+    parser.add_argument("--backend", choices=["sql", "mongo", "all"], default="all")
+    parser.add_argument("--db", default=SQLITE_PATH, help="Base SQLite à analyser")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--out", default=SNAPSHOT_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="Enregistrer la capture comme nouvelle référence")
+    args = parser.parse_args()
+
+    snapshot = {"date": datetime.now().isoformat(timespec="seconds")}
+    if args.backend in ("sql", "all"):
+        print(f"Plans SQLite ({args.db})...")
+        snapshot["sql"] = capture_sql(args.db, args.queries)
+    if args.backend in ("mongo", "all"):
+        print(f"Plans MongoDB ({DB_NAME})...")
+        snapshot["mongo"] = capture_mongo(args.queries)
+
+    save(args.out, snapshot)
+    print(f"✓ Instantané écrit dans {args.out}")
+
+    if args.update_baseline:
+        save(args.baseline, snapshot)
+        print(f"✓ Référence mise à jour : {args.baseline}")
+        sys.exit(0)
+    if not os.path.exists(args.baseline):
+        print(f"⚠️ Pas de référence ({args.baseline}) : relancer avec --update-baseline")
+        sys.exit(0)
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    changes, regressions = compare(baseline, snapshot)
+    for line in changes:
+        print(f"  ~ {line}")
+    for line in regressions:
+        print(f"  ✗ {line}")
+    if regressions:
+        print(f"⚠️ {len(regressions)} régression(s) de plan")
+        sys.exit(1)
+    print(f"✓ Aucune régression ({len(changes)} plan(s) modifié(s))")
@@ -0,0 +1,31 @@
+"""
+Comparaison de deux exports CSV d'une même requête (SQL, MongoDB, colonnaire).
+
+Les colonnes numériques sont comparées à une tolérance relative près :
+l'ordre de sommation des moyennes diffère d'un moteur à l'autre.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+RTOL = 1e-9
+
+
+def same_result(path, ref_path, rtol=RTOL):
+    """True si les deux CSV ont mêmes colonnes, même ordre de lignes et mêmes valeurs ; None si ref_path manque."""
+    if not os.path.exists(ref_path):
+        return None
+    ref = pd.read_csv(ref_path)
+    ours = pd.read_csv(path)
+    if list(ref.columns) != list(ours.columns) or len(ref) != len(ours):
+        return False
+    for col in ref.columns:
+        a, b = ref[col], ours[col]
+        if pd.api.types.is_numeric_dtype(a) and pd.api.types.is_numeric_dtype(b):
+            if not np.allclose(a.to_numpy(float), b.to_numpy(float), rtol=rtol, atol=0, equal_nan=True):
+                return False
+        elif not a.fillna("").astype(str).equals(b.fillna("").astype(str)):
+            return False
+    return True
@@ -0,0 +1,117 @@
+"""
+Moteur de corrélation trafic / pollution (requête i).
+
+La requête i associe chaque mesure de CO2 à chaque relevé de trafic de
+la même ligne et du même jour : le résultat intermédiaire compte
+mesures × relevés par (ligne, jour). Ici chaque côté est d'abord réduit
+à des agrégats par (ligne, jour) — effectif n, somme, somme des carrés —
+puis les deux petites tables sont jointes sur (ligne, jour). Les sommes
+sur les paires s'en déduisent exactement :
+
+    n   = Σ nx·ny        Σx  = Σ Sx·ny       Σy  = Σ Sy·nx
+    Σx² = Σ Qx·ny        Σy² = Σ Qy·nx       Σxy = Σ Sx·Sy
+
+et la corrélation de Pearson utilise la même formule que la requête SQL.
+"""
+
+import numpy as np
+import pandas as pd
+
+DAILY_COLUMNS = ["id_ligne", "jour", "n", "somme", "somme_carres"]
+SUM_COLUMNS = ["n", "sx", "sy", "sxx", "syy", "sxy"]
+
+
+def daily_aggregates(id_ligne, jour, valeur):
+    """
+    Réduit des triplets (ligne, jour, valeur) en agrégats par (ligne, jour)
+    avec des bincount NumPy (un seul passage linéaire).
+    """
+    valeur = np.asarray(valeur, dtype=np.float64)
+    keep = ~np.isnan(valeur) & pd.notna(np.asarray(jour, dtype=object)) & pd.notna(np.asarray(id_ligne, dtype=object))
+    if not keep.all():
+        id_ligne, jour, valeur = np.asarray(id_ligne)[keep], np.asarray(jour, dtype=object)[keep], valeur[keep]
+    if len(valeur) == 0:
+        return pd.DataFrame(columns=DAILY_COLUMNS)
+
+    line_codes, lines = pd.factorize(np.asarray(id_ligne))
+    day_codes, days = pd.factorize(np.asarray(jour, dtype=object))
+    keys = line_codes.astype(np.int64) * len(days) + day_codes
+    uniq, inverse = np.unique(keys, return_inverse=True)
+
+    return pd.DataFrame({
+        "id_ligne": np.asarray(lines)[uniq // len(days)],
+        "jour": np.asarray(days)[uniq % len(days)],
+        "n": np.bincount(inverse),
+        "somme": np.bincount(inverse, weights=valeur),
+        "somme_carres": np.bincount(inverse, weights=valeur * valeur),
+    })
+
+
+def combine_daily(parts):
+    """Fusionne des agrégats journaliers partiels (ex : un par bloc lu) : les sommes s'additionnent."""
+    parts = [p for p in parts if not p.empty]
+    if not parts:
+        return pd.DataFrame(columns=DAILY_COLUMNS)
+    if len(parts) == 1:
+        return parts[0]
+    return pd.concat(parts).groupby(["id_ligne", "jour"], as_index=False, sort=False)[["n", "somme", "somme_carres"]].sum()
+
+
+def line_sums(x_daily, y_daily):
+    """
+    Joint les agrégats journaliers des deux variables sur (ligne, jour) et
+    renvoie par ligne les sommes sur toutes les paires (n, Σx, Σy, Σx², Σy², Σxy).
+    """
+    joined = x_daily.merge(y_daily, on=["id_ligne", "jour"], suffixes=("_x", "_y"))
+    if joined.empty:
+        return pd.DataFrame(columns=["id_ligne"] + SUM_COLUMNS)
+    nx, ny = joined["n_x"].to_numpy(np.float64), joined["n_y"].to_numpy(np.float64)
+    sx, sy = joined["somme_x"].to_numpy(np.float64), joined["somme_y"].to_numpy(np.float64)
+    pairs = pd.DataFrame({
+        "id_ligne": joined["id_ligne"].to_numpy(),
+        "n": nx * ny,
+        "sx": sx * ny,
+        "sy": sy * nx,
+        "sxx": joined["somme_carres_x"].to_numpy(np.float64) * ny,
+        "syy": joined["somme_carres_y"].to_numpy(np.float64) * nx,
+        "sxy": sx * sy,
+    })
+    return pairs.groupby("id_ligne", as_index=False, sort=False)[SUM_COLUMNS].sum()
+
+
+def pearson(sums):
+    """
+    Corrélation de Pearson à partir des sommes (même formule que la requête SQL).
+    Les cas indéfinis (variance nulle, n = 0) donnent NaN, comme NULL en SQL.
+    """
+    n = np.asarray(sums["n"], dtype=np.float64)
+    sx, sy = np.asarray(sums["sx"], dtype=np.float64), np.asarray(sums["sy"], dtype=np.float64)
+    sxx, syy = np.asarray(sums["sxx"], dtype=np.float64), np.asarray(sums["syy"], dtype=np.float64)
+    sxy = np.asarray(sums["sxy"], dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = sxy - sx * sy / n
+        var_x = sxx - sx * sx / n
+        var_y = syy - sy * sy / n
+        corr = cov / np.sqrt(var_x * var_y)
+    corr[~np.isfinite(corr)] = np.nan
+    return corr
+
+
+def correlation_by_line(x_daily, y_daily, lignes, min_pairs=1):
+    """
+    Corrélation par ligne, avec le nom de ligne, triée par nom_ligne.
+    `lignes` : DataFrame (id_ligne, nom_ligne) ; seules les lignes ayant
+    au moins `min_pairs` paires (mesure, relevé) sont conservées.
+    """
+    return correlation_from_sums(line_sums(x_daily, y_daily), lignes, min_pairs)
+
+
+def correlation_from_sums(sums, lignes, min_pairs=1):
+    """
+    Corrélation par ligne à partir des sommes déjà calculées par ligne
+    (colonnes id_ligne + SUM_COLUMNS, ex : calculées côté serveur).
+    """
+    sums = sums[sums["n"] >= min_pairs]
+    out = lignes.merge(sums, on="id_ligne")
+    out["correlation"] = pearson(out)
+    return out.sort_values("nom_ligne", kind="stable")[["nom_ligne", "correlation"]].reset_index(drop=True)
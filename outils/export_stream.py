@@ -0,0 +1,136 @@
+"""
+Export CSV en flux pour les scripts de requêtes SQL et MongoDB.
+
+Les lignes sont écrites au fil de la lecture (fetchmany côté SQLite,
+curseur MongoDB avec un batch_size réglé) sans jamais construire de
+DataFrame : la mémoire reste constante quelle que soit la taille du
+résultat. Le fichier peut être compressé en gzip (suffixe .csv.gz).
+
+Option arrow (pyarrow requis) : le même résultat est aussi écrit en
+Feather / Arrow IPC non compressé (suffixe .feather) avec les types des
+valeurs lues. read_result le relit en mémoire projetée, sans analyse de
+texte, et revient au CSV si le fichier Arrow manque ou est plus ancien.
+"""
+
+import csv
+import gzip
+import math
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # export Arrow optionnel
+    pa = None
+
+HAS_ARROW = pa is not None
+
+FETCH_SIZE = 10_000         # lignes lues par fetchmany (SQLite)
+MONGO_BATCH_SIZE = 5_000    # documents par getMore (MongoDB)
+
+
+def iter_sqlite_rows(result, size=FETCH_SIZE):
+    """Itère sur un curseur SQLite par blocs de `size` lignes (ou sur une liste déjà calculée)."""
+    if not hasattr(result, "fetchmany"):
+        yield from result
+        return
+    while True:
+        rows = result.fetchmany(size)
+        if not rows:
+            break
+        yield from rows
+
+
+def iter_mongo_rows(cursor, columns, batch_size=MONGO_BATCH_SIZE):
+    """Itère sur un curseur MongoDB en ne gardant que `columns` (clé absente -> valeur vide)."""
+    if hasattr(cursor, "batch_size"):
+        cursor.batch_size(batch_size)
+    for doc in cursor:
+        yield [doc.get(col) for col in columns]
+
+
+def csv_path(path, compress=False):
+    return path + ".gz" if compress and not path.endswith(".gz") else path
+
+
+def arrow_path(path):
+    """Fichier Arrow associé à un export CSV (requete_a.csv[.gz] -> requete_a.feather)."""
+    base = path[:-3] if path.endswith(".gz") else path
+    return (base[:-4] if base.endswith(".csv") else base) + ".feather"
+
+
+def arrow_column(values):
+    """Colonne Arrow typée d'après les valeurs ; repli en texte si les types sont mélangés."""
+    try:
+        return pa.array(values, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+
+def write_arrow(path, columns, data):
+    """Écrit les colonnes `data` en Feather non compressé (lisible en mémoire projetée)."""
+    table = pa.table({col: arrow_column(values) for col, values in zip(columns, data)})
+    tmp_path = path + ".tmp"
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+
+
+def write_csv(path, columns, rows, compress=False, arrow=False):
+    """
+    Écrit l'en-tête puis les lignes au fil de l'eau. Les NaN sont écrits
+    comme des cellules vides (même rendu que DataFrame.to_csv).
+    arrow=True écrit aussi le fichier .feather (les colonnes sont alors
+    gardées en mémoire le temps de l'export).
+    Renvoie (chemin écrit, nombre de lignes).
+    """
+    if arrow and not HAS_ARROW:
+        raise RuntimeError("Export Arrow : pyarrow n'est pas installé (pip install pyarrow)")
+    path = csv_path(path, compress)
+    tmp_path = path + ".tmp"
+    opener = gzip.open if compress else open
+    data = [[] for _ in columns] if arrow else None
+    count = 0
+    try:
+        with opener(tmp_path, "wt", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(columns)
+            for row in rows:
+                row = [None if isinstance(v, float) and math.isnan(v) else v for v in row]
+                writer.writerow(row)
+                if arrow:
+                    for values, v in zip(data, row):
+                        values.append(v)
+                count += 1
+    except BaseException:
+        # Curseur interrompu (maxTimeMS, erreur serveur) : pas de fichier partiel laissé sur le disque
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+    # Un seul format à jour par requête : on retire l'autre variante éventuelle
+    other = path[:-3] if compress else path + ".gz"
+    if os.path.exists(other):
+        os.remove(other)
+    if arrow:
+        write_arrow(arrow_path(path), columns, data)
+    elif os.path.exists(arrow_path(path)):
+        os.remove(arrow_path(path))  # fichier Arrow d'un export précédent, désormais périmé
+    return path, count
+
+
+def read_result(path):
+    """
+    Relit un export (chemin du .csv) : fichier Arrow en mémoire projetée s'il
+    est à jour, sinon le CSV (ou sa variante .csv.gz).
+    """
+    if not os.path.exists(path) and os.path.exists(path + ".gz"):
+        path += ".gz"
+    arrow_file = arrow_path(path)
+    if HAS_ARROW and os.path.exists(arrow_file) and (
+            not os.path.exists(path) or os.path.getmtime(arrow_file) >= os.path.getmtime(path)):
+        # split_blocks : pas de regroupement des colonnes numériques en un bloc (pas de copie)
+        return feather.read_table(arrow_file, memory_map=True).to_pandas(split_blocks=True)
+    return pd.read_csv(path)
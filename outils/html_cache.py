@@ -0,0 +1,60 @@
+"""
+Cache disque des documents HTML rendus (cartes Folium du tableau de bord).
+
+Chaque document est écrit compressé (gzip) sous un nom qui contient la clé
+de cache : empreinte de la version des données lues et des paramètres de
+rendu (même hachage que result_cache.query_key). Un nouveau processus, ou
+un second worker, relit le fichier au lieu de refaire le rendu ; la clé
+change dès que les données sont rechargées et l'ancienne version est
+supprimée à la réécriture.
+
+    html_doc = cached_html("dashboard/cache_cartes", "choroplethe",
+                           mongo_version(db, ["Arrets", "Quartiers"]), {"zoom": 12},
+                           create_choropleth_map)
+"""
+
+import glob
+import gzip
+import os
+
+from outils.result_cache import query_key
+
+
+def html_cache_path(directory, name, key):
+    return os.path.join(directory, f"{name}_{key[:16]}.html.gz")
+
+
+def read_html(path):
+    """Document en cache, ou None s'il est absent ou illisible (écriture interrompue)."""
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return f.read()
+    except (OSError, EOFError):
+        return None
+
+
+def write_html(path, html_doc):
+    # Écriture dans un fichier temporaire puis renommage : un autre processus ne lit jamais un fichier partiel
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        f.write(html_doc)
+    os.replace(tmp_path, path)
+
+
+def cached_html(directory, name, version, params, render):
+    """Renvoie le document `name` pour cette version des données et ces paramètres, rendu par render() si absent."""
+    path = html_cache_path(directory, name, query_key(version, {"nom": name, **params}))
+    html_doc = read_html(path) if os.path.exists(path) else None
+    if html_doc is not None:
+        return html_doc
+
+    html_doc = render()
+    os.makedirs(directory, exist_ok=True)
+    write_html(path, html_doc)
+    for old_path in glob.glob(html_cache_path(directory, name, "*")):
+        if old_path != path:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass  # déjà supprimé par un autre processus
+    return html_doc
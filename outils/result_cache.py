@@ -0,0 +1,89 @@
+"""
+Cache des résultats de requêtes, indexé par version des données.
+
+Chaque dossier de résultats contient un fichier cache_resultats.json qui
+associe à chaque requête la clé sous laquelle son CSV a été produit :
+empreinte SHA-256 de la version des données lues et de la définition de
+la requête (SQL, pipeline, colonnes, format). Si la clé recalculée est
+identique et que le fichier existe encore, le CSV est réutilisé tel quel.
+
+Version des données :
+- SQLite : taille et date de modification (ns) du fichier de base et de
+  son journal -wal. PRAGMA data_version n'est comparable qu'au sein d'une
+  même connexion, il ne sert donc pas d'un lancement à l'autre.
+- MongoDB : identifiant du dernier chargement (collection Migrations,
+  écrit par migration.py et dump_restore.py) et nombre de documents de
+  chaque collection lue par la requête.
+"""
+
+import hashlib
+import json
+import os
+import uuid
+from datetime import datetime
+
+CACHE_FILE = "cache_resultats.json"
+RUNS_COLLECTION = "Migrations"
+
+
+def sqlite_version(path):
+    """Empreinte du fichier SQLite (et de son WAL éventuel)."""
+    version = {}
+    for p in (path, path + "-wal"):
+        if os.path.exists(p):
+            st = os.stat(p)
+            version[os.path.basename(p)] = [st.st_size, st.st_mtime_ns]
+    return version
+
+
+def record_data_version(db, source):
+    """Enregistre un nouvel identifiant de chargement MongoDB (invalide les caches)."""
+    run_id = uuid.uuid4().hex
+    db[RUNS_COLLECTION].insert_one({"run_id": run_id, "source": source, "date": datetime.now()})
+    return run_id
+
+
+def mongo_version(db, collections):
+    """Dernier chargement + nombre de documents des collections lues."""
+    last = db[RUNS_COLLECTION].find_one({}, {"_id": 0, "run_id": 1}, sort=[("date", -1)])
+    return {
+        "run_id": last["run_id"] if last else None,
+        "counts": {name: db[name].estimated_document_count() for name in sorted(collections)},
+    }
+
+
+def query_key(version, definition):
+    """Clé de cache : hachage de la version des données et de la définition de la requête."""
+    payload = json.dumps({"version": version, "definition": definition}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def load_cache(directory):
+    path = os.path.join(directory, CACHE_FILE)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}  # cache illisible : tout sera recalculé
+
+
+def save_cache(directory, cache):
+    path = os.path.join(directory, CACHE_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def lookup(cache, name, key):
+    """Entrée en cache de la requête si sa clé correspond et que son fichier existe encore."""
+    entry = cache.get(name)
+    if entry and entry.get("key") == key and os.path.exists(entry.get("path", "")):
+        return entry
+    return None
+
+
+def store(cache, name, key, path, count):
+    cache[name] = {"key": key, "path": path, "lignes": count, "date": datetime.now().isoformat(timespec="seconds")}
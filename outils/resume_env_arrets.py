@@ -0,0 +1,156 @@
+"""
+Résumés environnementaux par arrêt.
+
+- Champs co2_avg, bruit_avg, temp_avg d'Arrets : moyenne des mesures du
+  capteur CO2, bruit et température de l'arrêt (null s'il n'en a pas). Le
+  filtre "Niveau de CO₂" et les couleurs des cartes du tableau de bord les
+  lisent au lieu de re-déplier les mesures ; l'index sur co2_avg sert les
+  filtres par plage (co2_avg >= 400 et <= 480).
+- Collection SerieCO2Arret : somme et nombre des mesures CO2 par arrêt et
+  par jour. La tendance d'une sélection d'arrêts, quelle que soit sa
+  taille, additionne ces séries (co2_trend_pipeline).
+- Pyramide TuilesCO2 (tuiles_co2.py), reconstruite à partir de co2_avg.
+
+Les deux sont calculés par le serveur. migration.py et dump_restore.py les
+recalculent après chaque chargement ; après l'ajout de mesures à quelques
+arrêts, seuls ceux-ci sont recalculés :
+    python outils/resume_env_arrets.py            # tous les arrêts
+    python outils/resume_env_arrets.py 12 57      # arrêts id_arret 12 et 57
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime
+
+from pymongo import MongoClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from outils.result_cache import record_data_version
+from outils.tuiles_co2 import HEAT_TILES_COLLECTION, build_heat_tiles
+
+MONGO_URI = "mongodb://localhost:27017/"
+MONGO_DB_NAME = "Paris2055"
+
+# Type de capteur -> champ de l'arrêt
+STOP_AVG_FIELDS = {"co2": "co2_avg", "bruit": "bruit_avg", "temp": "temp_avg"}
+STOP_AVG_INDEXES = [[("co2_avg", 1)], [("id_ligne", 1), ("co2_avg", 1)]]
+CO2_SERIES_COLLECTION = "SerieCO2Arret"
+
+
+def type_contains(regex, options=""):
+    """Le type du capteur $$c contient-il `regex` ?"""
+    return {"$regexMatch": {"input": {"$ifNull": ["$$c.type_capteur", ""]}, "regex": regex, "options": options}}
+
+
+# Premier type reconnu, dans l'ordre du tableau des arrêts (un capteur "CO2 dB" reste un capteur CO2)
+SENSOR_KIND = {"$switch": {"branches": [
+    {"case": type_contains("CO2"), "then": "co2"},
+    {"case": {"$or": [type_contains("Bruit"), type_contains("db", "i")]}, "then": "bruit"},
+    {"case": type_contains("Temp"), "then": "temp"},
+], "default": None}}
+
+
+def sensor_values(kind):
+    """Mesures du dernier capteur du type donné ayant des mesures (absent sinon)."""
+    capteurs = {"$filter": {
+        "input": {"$ifNull": ["$capteurs", []]}, "as": "c",
+        "cond": {"$and": [{"$eq": [SENSOR_KIND, kind]}, {"$gt": [{"$size": {"$ifNull": ["$$c.mesures", []]}}, 0]}]},
+    }}
+    return {"$arrayElemAt": [{"$map": {"input": capteurs, "as": "c", "in": "$$c.mesures.valeur"}}, -1]}
+
+
+def stop_averages_update():
+    """Pipeline de mise à jour : deux étapes, $avg d'un champ tableau ignorant les valeurs non numériques."""
+    return [
+        {"$set": {field: sensor_values(kind) for kind, field in STOP_AVG_FIELDS.items()}},
+        {"$set": {field: {"$avg": f"${field}"} for field in STOP_AVG_FIELDS.values()}},
+    ]
+
+
+def build_stop_averages(db, id_arrets=None):
+    """Recalcule les moyennes de tous les arrêts, ou des seuls `id_arrets`, et crée les index."""
+    query = {"id_arret": {"$in": list(id_arrets)}} if id_arrets else {}
+    result = db.Arrets.update_many(query, stop_averages_update())
+    for keys in STOP_AVG_INDEXES:
+        db.Arrets.create_index(keys)
+    return result.matched_count
+
+
+def co2_series_pipeline(built_at, id_arrets=None):
+    """Un document par (arrêt, jour) : somme et nombre des mesures numériques des capteurs CO2."""
+    match = {"id_arret": {"$in": list(id_arrets)}} if id_arrets else {}
+    return [
+        {"$match": match},
+        {"$unwind": "$capteurs"},
+        {"$match": {"capteurs.type_capteur": "CO2"}},
+        {"$unwind": "$capteurs.mesures"},
+        {"$group": {
+            "_id": {
+                "id_arret": "$id_arret",
+                "jour": {"$dateToString": {"format": "%Y-%m-%d", "date": "$capteurs.mesures.horodatage"}},
+            },
+            # $avg ignore les valeurs non numériques : même convention ici
+            "n": {"$sum": {"$cond": [{"$isNumber": "$capteurs.mesures.valeur"}, 1, 0]}},
+            "somme": {"$sum": "$capteurs.mesures.valeur"},
+        }},
+        {"$project": {
+            "_id": 1, "id_arret": "$_id.id_arret", "jour": "$_id.jour",
+            "n": 1, "somme": 1, "maj": {"$literal": built_at},
+        }},
+        {"$merge": {"into": CO2_SERIES_COLLECTION, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+
+
+def build_co2_series(db, id_arrets=None):
+    """Reconstruit SerieCO2Arret (tous les arrêts ou les seuls `id_arrets`) et retire les jours disparus."""
+    built_at = datetime.now()
+    db.Arrets.aggregate(co2_series_pipeline(built_at, id_arrets), allowDiskUse=True)
+    stale = {"maj": {"$ne": built_at}}
+    if id_arrets:
+        stale["id_arret"] = {"$in": list(id_arrets)}
+    db[CO2_SERIES_COLLECTION].delete_many(stale)
+    db[CO2_SERIES_COLLECTION].create_index([("id_arret", 1), ("jour", 1)])
+    return db[CO2_SERIES_COLLECTION].count_documents({})
+
+
+def co2_trend_pipeline(id_arrets=None):
+    """CO2 moyen par jour d'une sélection d'arrêts (None : tout le réseau), sur SerieCO2Arret."""
+    match = {"id_arret": {"$in": list(id_arrets)}} if id_arrets is not None else {}
+    return [
+        {"$match": match},
+        {"$group": {"_id": "$jour", "somme": {"$sum": "$somme"}, "n": {"$sum": "$n"}}},
+        {"$match": {"n": {"$gt": 0}}},
+        {"$project": {"_id": 1, "avg_co2": {"$divide": ["$somme", "$n"]}}},
+        {"$sort": {"_id": 1}},
+    ]
+
+
+def has_stop_summaries(db):
+    """Faux si un arrêt n'a pas encore ses moyennes ou si les séries manquent (base chargée avant leur introduction)."""
+    return (db.Arrets.find_one({"co2_avg": {"$exists": False}}, {"_id": 1}) is None
+            and db[CO2_SERIES_COLLECTION].estimated_document_count() > 0
+            and db[HEAT_TILES_COLLECTION].estimated_document_count() > 0)
+
+
+def build_stop_summaries(db, id_arrets=None):
+    """Moyennes par arrêt, séries CO2 journalières et pyramide de tuiles ; renvoie le nombre d'arrêts mis à jour."""
+    n = build_stop_averages(db, id_arrets)
+    build_co2_series(db, id_arrets)
+    build_heat_tiles(db)
+    return n
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recalcule les moyennes et séries CO2 des arrêts")
+    parser.add_argument("id_arrets", nargs="*", type=int, help="Arrêts à recalculer (par défaut : tous)")
+    args = parser.parse_args()
+
+    client = MongoClient(MONGO_URI)
+    db = client[MONGO_DB_NAME]
+    n = build_stop_summaries(db, args.id_arrets)
+    # Nouvel identifiant de chargement : invalide les caches (requêtes, tableau de bord)
+    record_data_version(db, "moyennes arrêts")
+    print(f"✓ Moyennes et séries CO2 recalculées pour {n} arrêt(s)")
+    client.close()
+    sys.exit(0)
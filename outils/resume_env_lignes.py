@@ -0,0 +1,88 @@
+"""
+Résumé environnemental par ligne (collection ResumeEnvLigne).
+
+Un document par id_ligne avec, pour chaque type de capteur (CO2, bruit,
+température), le nombre de mesures, la somme et la moyenne des valeurs.
+Construit côté serveur par un pipeline $merge sur Arrets, il évite aux
+requêtes par véhicule ou par ligne (d, j) de re-déplier toutes les
+mesures des arrêts de la ligne pour chaque véhicule.
+
+migration.py et dump_restore.py le reconstruisent après chaque chargement ;
+requete_mongo.py le construit s'il est absent. Reconstruction seule :
+    python outils/resume_env_lignes.py
+"""
+
+import sys
+from datetime import datetime
+
+from pymongo import MongoClient
+
+MONGO_URI = "mongodb://localhost:27017/"
+MONGO_DB_NAME = "Paris2055"
+ENV_SUMMARY_COLLECTION = "ResumeEnvLigne"
+
+# type_capteur -> champ du document résumé
+SENSOR_FIELDS = {"CO2": "co2", "Bruit": "bruit", "Temperature": "temperature"}
+
+
+def sensor_summary(field):
+    """Statistiques d'un type de capteur, absentes ({nb_mesures: 0}) si la ligne n'en a pas."""
+    stats = {"$arrayElemAt": [{"$filter": {"input": "$types", "cond": {"$eq": ["$$this.champ", field]}}}, 0]}
+    return {"$ifNull": [
+        {"$let": {"vars": {"s": stats}, "in": {
+            "nb_mesures": "$$s.nb_mesures",
+            "n": "$$s.n",
+            "somme": "$$s.somme",
+            "moyenne": {"$cond": [{"$gt": ["$$s.n", 0]}, {"$divide": ["$$s.somme", "$$s.n"]}, None]},
+        }}},
+        {"nb_mesures": 0, "n": 0, "somme": 0, "moyenne": None}
+    ]}
+
+
+def env_summary_pipeline(built_at):
+    return [
+        {"$unwind": "$capteurs"},
+        {"$match": {"capteurs.type_capteur": {"$in": list(SENSOR_FIELDS)}}},
+        {"$unwind": "$capteurs.mesures"},
+        {"$group": {
+            "_id": {"id_ligne": "$id_ligne", "type": "$capteurs.type_capteur"},
+            "nb_mesures": {"$sum": 1},
+            # $avg ignore les valeurs non numériques : même convention ici
+            "n": {"$sum": {"$cond": [{"$isNumber": "$capteurs.mesures.valeur"}, 1, 0]}},
+            "somme": {"$sum": "$capteurs.mesures.valeur"},
+        }},
+        {"$group": {
+            "_id": "$_id.id_ligne",
+            "types": {"$push": {
+                "champ": {"$switch": {
+                    "branches": [{"case": {"$eq": ["$_id.type", t]}, "then": f} for t, f in SENSOR_FIELDS.items()],
+                    "default": None,
+                }},
+                "nb_mesures": "$nb_mesures", "n": "$n", "somme": "$somme",
+            }},
+        }},
+        {"$project": {
+            "_id": 1,
+            "id_ligne": "$_id",
+            **{field: sensor_summary(field) for field in SENSOR_FIELDS.values()},
+            "maj": {"$literal": built_at},
+        }},
+        {"$merge": {"into": ENV_SUMMARY_COLLECTION, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+
+
+def build_env_summary(db):
+    """Reconstruit ResumeEnvLigne ($merge) puis retire les lignes qui n'ont plus de mesures."""
+    built_at = datetime.now()
+    db.Arrets.aggregate(env_summary_pipeline(built_at), allowDiskUse=True)
+    db[ENV_SUMMARY_COLLECTION].delete_many({"maj": {"$ne": built_at}})
+    db[ENV_SUMMARY_COLLECTION].create_index("id_ligne")
+    return db[ENV_SUMMARY_COLLECTION].count_documents({})
+
+
+if __name__ == "__main__":
+    client = MongoClient(MONGO_URI)
+    n = build_env_summary(client[MONGO_DB_NAME])
+    print(f"✓ {ENV_SUMMARY_COLLECTION} : {n} ligne(s)")
+    client.close()
+    sys.exit(0)
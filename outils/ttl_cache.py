@@ -0,0 +1,60 @@
+"""
+Cache mémoire borné (LRU) avec durée de vie des entrées (TTL).
+
+Utilisé par le tableau de bord pour les résultats des callbacks dont les
+combinaisons d'entrées sont peu nombreuses et souvent répétées. La clé
+doit contenir la version des données : une entrée n'est jamais relue
+après un rechargement, elle finit évincée par l'ordre LRU ou par le TTL.
+
+    cache = TTLCache(maxsize=64, ttl=600)
+    found, value = cache.get(key)
+    if not found:
+        value = compute()
+        cache.put(key, value)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    def __init__(self, maxsize=64, ttl=600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()  # clé -> (date d'insertion, valeur), la plus ancienne en tête
+        self.hits = 0
+        self.misses = 0
+        # Le serveur Dash traite les callbacks dans plusieurs threads
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Renvoie (trouvé, valeur) ; une entrée expirée compte comme absente et est supprimée."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {"entrees": len(self.entries), "taille_max": self.maxsize, "ttl_s": self.ttl,
+                    "succes": self.hits, "echecs": self.misses,
+                    "taux_succes": self.hits / total if total else None}
@@ -0,0 +1,84 @@
+"""
+Pyramide de tuiles CO2 pour les cartes de chaleur (collection TuilesCO2).
+
+Pour chaque niveau de zoom de ZOOMS, les arrêts sont regroupés par cellule
+de la grille des tuiles de carte (Web Mercator), chaque tuile de 256 px
+étant découpée en CELLS_PER_TILE x CELLS_PER_TILE cellules. Un document par
+(zoom, cellule) : position moyenne des arrêts, nombre d'arrêts, somme et
+moyenne de leur co2_avg. La couche de chaleur lit les cellules d'un niveau
+(et de la zone visible) au lieu d'un point par arrêt.
+
+La pyramide part des moyennes stockées sur les arrêts (co2_avg, voir
+resume_env_arrets.py) : elle est reconstruite avec elles, après chaque
+chargement ou recalcul d'arrêts.
+"""
+
+from datetime import datetime
+
+import numpy as np
+
+HEAT_TILES_COLLECTION = "TuilesCO2"
+ZOOMS = range(10, 16)
+CELLS_PER_TILE = 8
+
+
+def zoom_level(zoom):
+    """Niveau de la pyramide le plus proche d'un zoom de carte."""
+    return int(min(max(round(zoom), ZOOMS[0]), ZOOMS[-1]))
+
+
+def cell_indices(lat, lon, zoom):
+    """Indices (x, y) des cellules contenant les points, au niveau `zoom`."""
+    n = 2 ** zoom * CELLS_PER_TILE
+    x = np.floor((lon + 180) / 360 * n)
+    y = np.floor((1 - np.arcsinh(np.tan(np.radians(lat))) / np.pi) / 2 * n)
+    return x.astype(int), y.astype(int)
+
+
+def heat_tile_docs(lat, lon, co2, built_at):
+    """Documents de tous les niveaux à partir des coordonnées et du CO2 moyen (0 sans capteur) des arrêts."""
+    docs = []
+    for zoom in ZOOMS:
+        x, y = cell_indices(lat, lon, zoom)
+        cells, inverse, counts = np.unique(np.stack([x, y], axis=1), axis=0, return_inverse=True, return_counts=True)
+        inverse = inverse.ravel()
+        sum_lat = np.bincount(inverse, weights=lat)
+        sum_lon = np.bincount(inverse, weights=lon)
+        sum_co2 = np.bincount(inverse, weights=co2)
+        for k, (cx, cy) in enumerate(cells):
+            docs.append({
+                "_id": f"{zoom}/{cx}/{cy}", "zoom": zoom, "x": int(cx), "y": int(cy),
+                "lat": sum_lat[k] / counts[k], "lon": sum_lon[k] / counts[k],
+                "nb_arrets": int(counts[k]), "somme_co2": float(sum_co2[k]), "co2": float(sum_co2[k] / counts[k]),
+                "maj": built_at,
+            })
+    return docs
+
+
+def build_heat_tiles(db):
+    """Reconstruit toute la pyramide (une ligne lue par arrêt) ; renvoie le nombre de cellules."""
+    built_at = datetime.now()
+    stops = list(db.Arrets.find({"latitude": {"$ne": None}, "longitude": {"$ne": None}},
+                                {"_id": 0, "latitude": 1, "longitude": 1, "co2_avg": 1}))
+    docs = []
+    if stops:
+        lat = np.array([s["latitude"] for s in stops], dtype=float)
+        lon = np.array([s["longitude"] for s in stops], dtype=float)
+        co2 = np.array([s.get("co2_avg") or 0 for s in stops], dtype=float)
+        docs = heat_tile_docs(lat, lon, co2, built_at)
+    collection = db[HEAT_TILES_COLLECTION]
+    collection.delete_many({})
+    if docs:
+        collection.insert_many(docs)
+    collection.create_index([("zoom", 1), ("lon", 1), ("lat", 1)])
+    return len(docs)
+
+
+def heat_cells(db, zoom, bounds=None):
+    """Cellules du niveau le plus proche de `zoom`, limitées à bounds = (lon_min, lat_min, lon_max, lat_max)."""
+    query = {"zoom": zoom_level(zoom)}
+    if bounds is not None:
+        lon_min, lat_min, lon_max, lat_max = bounds
+        query["lon"] = {"$gte": lon_min, "$lte": lon_max}
+        query["lat"] = {"$gte": lat_min, "$lte": lat_max}
+    return list(db[HEAT_TILES_COLLECTION].find(query, {"_id": 0, "lat": 1, "lon": 1, "somme_co2": 1, "co2": 1, "nb_arrets": 1}))
@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+"""
+Moteur colonnaire en mémoire pour les requêtes a–n.
+
+Les tables de Paris2055.sqlite sont chargées une seule fois en colonnes
+NumPy typées (noms de ligne et de quartier en codes catégoriels triés),
+puis chaque requête est calculée par des jointures sur clés triées
+(np.searchsorted sur la clé primaire) et des group-by vectorisés
+(np.bincount). Le résultat reprend le schéma et l'ordre des exports de
+requete_sql.py, y compris la sémantique SQL des LEFT JOIN : les groupes
+sans correspondance (ligne, véhicule ou quartier NULL) sont conservés.
+"""
+
+import numpy as np
+import pandas as pd
+
+from outils.correlation import correlation_by_line, daily_aggregates
+
+# Colonnes chargées pour chaque table
+TABLE_COLUMNS = {
+    "Ligne": ["id_ligne", "nom_ligne", "type"],
+    "Quartier": ["id_quartier", "nom"],
+    "Arret": ["id_arret", "id_ligne"],
+    "ArretQuartier": ["id_arret", "id_quartier"],
+    "Chauffeur": ["id_chauffeur", "nom"],
+    "Vehicule": ["id_vehicule", "immatriculation", "id_ligne", "id_chauffeur", "type_vehicule"],
+    "Horaire": ["id_arret", "heure_prevue", "passagers_estimes"],
+    "Capteur": ["id_capteur", "id_arret", "type_capteur", "latitude", "longitude"],
+    "Mesure": ["id_mesure", "id_capteur", "horodatage", "valeur"],
+    "Trafic": ["id_trafic", "id_ligne", "horodatage", "retard_minutes"],
+    "Incident": ["id_incident", "id_trafic"],
+}
+CATEGORICAL_COLUMNS = {("Ligne", "nom_ligne"), ("Quartier", "nom"), ("Chauffeur", "nom"),
+                       ("Capteur", "type_capteur"), ("Vehicule", "type_vehicule"), ("Ligne", "type")}
+
+NIVEAUX_POLLUTION = np.array(["faible", "moyen", "élevé"], dtype=object)
+CLASSES_RETARD = np.array(["retard moyen inf a 6min30", "retard moyen inf a 7min", "retard moyen sup a 7min"], dtype=object)
+
+
+def load_tables(conn):
+    """Charge les tables utiles en colonnes (float64 pour les clés : NULL -> NaN)."""
+    tables = {}
+    for table, columns in TABLE_COLUMNS.items():
+        df = pd.read_sql_query(f"SELECT {', '.join(columns)} FROM {table}", conn)
+        # Mesure est lue dans l'ordre de balayage SQLite (rowid) : l'ordre intra-capteur de m en dépend
+        for col in columns:
+            if (table, col) in CATEGORICAL_COLUMNS:
+                df[col] = pd.Categorical(df[col])
+            elif col.startswith("id_"):
+                df[col] = df[col].astype(np.float64)
+        tables[table] = df
+    return tables
+
+
+def sql_date(values):
+    """Équivalent de DATE() pour des horodatages ISO 'YYYY-MM-DD[ HH:MM:SS]' (invalide -> None)."""
+    s = pd.Series(values, dtype=object).astype("string").str.slice(0, 10)
+    parsed = pd.to_datetime(s, format="%Y-%m-%d", errors="coerce")
+    return np.where(parsed.isna(), None, s.to_numpy(dtype=object))
+
+
+def index_of(keys, fk):
+    """Position dans `keys` (clé primaire) de chaque valeur de `fk`, -1 si absente ou NULL."""
+    keys = np.asarray(keys, dtype=np.float64)
+    fk = np.asarray(fk, dtype=np.float64)
+    if len(keys) == 0:
+        return np.full(len(fk), -1)
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    pos = np.minimum(np.searchsorted(sorted_keys, fk), len(keys) - 1)
+    return np.where(sorted_keys[pos] == fk, order[pos], -1)
+
+
+def group_stats(codes, n_groups, values=None):
+    """
+    Comptage, somme et nombre de valeurs non NULL par groupe (codes 0..n_groups-1).
+    Le groupe n_groups reçoit les lignes sans correspondance (code -1), comme le
+    groupe NULL d'un LEFT JOIN.
+    """
+    codes = np.where(codes < 0, n_groups, codes)
+    rows = np.bincount(codes, minlength=n_groups + 1)
+    if values is None:
+        return rows, None, None
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    sums = np.bincount(codes[valid], weights=values[valid], minlength=n_groups + 1)
+    counts = np.bincount(codes[valid], minlength=n_groups + 1)
+    return rows, sums, counts
+
+
+def safe_mean(sums, counts):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def category_sort_key(categorical, positions):
+    """Code catégoriel (ordre lexical des catégories) des lignes `positions` ; -1 (NULL) trie en premier."""
+    codes = np.asarray(categorical.codes, dtype=np.int64)
+    return np.where(positions >= 0, codes[np.maximum(positions, 0)], -1)
+
+
+def take(series, positions):
+    """Valeurs de `series` aux positions données (None pour -1)."""
+    values = np.asarray(series, dtype=object)
+    out = np.full(len(positions), None, dtype=object)
+    ok = positions >= 0
+    out[ok] = values[positions[ok]]
+    return np.where(pd.isna(out), None, out)
+
+
+def with_null_group(n_groups, present):
+    """Positions des groupes présents, le groupe NULL (index n_groups) devenant -1."""
+    groups = np.flatnonzero(present)
+    return groups, np.where(groups == n_groups, -1, groups)
+
+
+def measures_of_type(t, sensor_type):
+    """Mesures dont le capteur existe et est du type demandé, avec la position du capteur."""
+    mesure, capteur = t["Mesure"], t["Capteur"]
+    cap_pos = index_of(capteur["id_capteur"], mesure["id_capteur"])
+    is_type = np.asarray(capteur["type_capteur"] == sensor_type)
+    keep = cap_pos >= 0
+    keep[keep] = is_type[cap_pos[keep]]
+    return np.flatnonzero(keep), cap_pos[keep]
+
+
+def ligne_of_arret(t, arret_pos):
+    """Position dans Ligne de la ligne de chaque arrêt (-1 si arrêt ou ligne absents)."""
+    arret_ligne = index_of(t["Ligne"]["id_ligne"], t["Arret"]["id_ligne"])
+    return np.where(arret_pos >= 0, arret_ligne[np.maximum(arret_pos, 0)], -1)
+
+
+def per_line_frame(t, values_by_line, column, present):
+    """Résultat par ligne (y compris le groupe NULL) trié par nom_ligne."""
+    ligne = t["Ligne"]
+    n = len(ligne)
+    groups, pos = with_null_group(n, present)
+    return pd.DataFrame({
+        "nom_ligne": take(ligne["nom_ligne"], pos),
+        column: values_by_line[groups],
+        "_nom": category_sort_key(ligne["nom_ligne"].cat, pos),
+        "_id": np.where(pos >= 0, groups, -1),
+    }).sort_values(["_nom", "_id"], kind="stable")[["nom_ligne", column]]
+
+
+def trafic_by_line(t):
+    ligne, trafic = t["Ligne"], t["Trafic"]
+    line_pos = index_of(ligne["id_ligne"], trafic["id_ligne"])
+    return line_pos, group_stats(line_pos, len(ligne), trafic["retard_minutes"])
+
+
+# --- Requêtes ---
+
+def kpi_a(t):
+    """a. Moyenne des retards par ligne (toutes les lignes, LEFT JOIN Trafic)."""
+    n = len(t["Ligne"])
+    _, (_, sums, counts) = trafic_by_line(t)
+    present = np.arange(n + 1) < n
+    return per_line_frame(t, safe_mean(sums, counts), "avg_retard", present)
+
+
+def kpi_b(t):
+    """b. Passagers moyens par (ligne, jour) ; Horaire LEFT JOIN Arret LEFT JOIN Ligne."""
+    horaire, ligne = t["Horaire"], t["Ligne"]
+    arret_pos = index_of(t["Arret"]["id_arret"], horaire["id_arret"])
+    line_pos = ligne_of_arret(t, arret_pos)
+    df = pd.DataFrame({
+        "ligne": line_pos,
+        "jour": sql_date(horaire["heure_prevue"]),
+        "passagers": np.asarray(horaire["passagers_estimes"], dtype=np.float64),
+    })
+    grouped = df.groupby(["ligne", "jour"], dropna=False, sort=False)["passagers"].mean().reset_index()
+    pos = grouped["ligne"].to_numpy()
+    out = pd.DataFrame({
+        "nom_ligne": take(ligne["nom_ligne"], pos),
+        "jour": grouped["jour"].to_numpy(dtype=object),
+        "avg_passagers": grouped["passagers"].to_numpy(),
+        "_nom": category_sort_key(ligne["nom_ligne"].cat, pos),
+        "_jour_null": ~grouped["jour"].isna().to_numpy(),
+        "_jour": grouped["jour"].fillna("").to_numpy(dtype=object),
+        "_id": pos,
+    })
+    out = out.sort_values(["_nom", "_jour_null", "_jour", "_id"], kind="stable")
+    return out[["nom_ligne", "jour", "avg_passagers"]]
+
+
+def kpi_c(t):
+    """c. Taux d'incidents par ligne : incidents des relevés / relevés de la ligne."""
+    n = len(t["Ligne"])
+    line_pos, (rows, _, _) = trafic_by_line(t)
+    trafic_pos = index_of(t["Trafic"]["id_trafic"], t["Incident"]["id_trafic"])
+    incident_line = np.where(trafic_pos >= 0, line_pos[np.maximum(trafic_pos, 0)], -1)
+    incidents, _, _ = group_stats(incident_line[trafic_pos >= 0], n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        taux = np.where(rows > 0, incidents / np.maximum(rows, 1), np.nan)
+    return per_line_frame(t, taux, "incident_taux", np.arange(n + 1) < n)
+
+
+def kpi_d(t):
+    """d. CO2 moyen par véhicule : moyenne des mesures CO2 des arrêts de sa ligne (groupe NULL inclus)."""
+    ligne, vehicule = t["Ligne"], t["Vehicule"]
+    n = len(ligne)
+    mesures, cap_pos = measures_of_type(t, "CO2")
+    arret_pos = index_of(t["Arret"]["id_arret"], t["Capteur"]["id_arret"].to_numpy()[cap_pos])
+    line_pos = ligne_of_arret(t, arret_pos)
+    _, sums, counts = group_stats(line_pos, n, t["Mesure"]["valeur"].to_numpy()[mesures])
+    rows, _, _ = group_stats(line_pos, n)
+
+    veh_line = index_of(ligne["id_ligne"], vehicule["id_ligne"])
+    vehicles_per_line, _, _ = group_stats(veh_line[veh_line >= 0], n)
+    has_rows = veh_line >= 0
+    has_rows[has_rows] = rows[veh_line[has_rows]] > 0
+
+    # Chaque véhicule d'une ligne mesurée ; les mesures des lignes sans véhicule forment le groupe NULL
+    v = np.flatnonzero(has_rows)
+    out = pd.DataFrame({
+        "immatriculation": take(vehicule["immatriculation"], v),
+        "type_vehicule": take(vehicule["type_vehicule"], v),
+        "avg_co2": safe_mean(sums, counts)[veh_line[v]],
+        "_id": vehicule["id_vehicule"].to_numpy()[v],
+    })
+    orphan = rows.copy()
+    orphan[:n][vehicles_per_line[:n] > 0] = 0
+    if orphan.sum() > 0:
+        orphan_lines = orphan > 0
+        null_row = pd.DataFrame({
+            "immatriculation": [None], "type_vehicule": [None],
+            "avg_co2": [safe_mean(np.array([sums[orphan_lines].sum()]), np.array([counts[orphan_lines].sum()]))[0]],
+            "_id": [-np.inf],
+        })
+        out = pd.concat([null_row, out], ignore_index=True)
+    out["_immat_null"] = out["immatriculation"].notna()
+    out["_immat"] = out["immatriculation"].fillna("").astype(str)
+    return out.sort_values(["_immat_null", "_immat", "_id"], kind="stable")[["immatriculation", "type_vehicule", "avg_co2"]]
+
+
+def kpi_e(t):
+    """e. Top 5 des quartiers les plus bruyants (mesures dupliquées par quartier de l'arrêt)."""
+    quartier, aq = t["Quartier"], t["ArretQuartier"]
+    nq = len(quartier)
+    mesures, cap_pos = measures_of_type(t, "Bruit")
+    valeurs = t["Mesure"]["valeur"].to_numpy()[mesures]
+    arret_ids = t["Arret"]["id_arret"].to_numpy()
+    arret_pos = index_of(arret_ids, t["Capteur"]["id_arret"].to_numpy()[cap_pos])
+
+    # Associations arrêt -> quartier, triées par arrêt
+    aq_arret = index_of(arret_ids, aq["id_arret"])
+    aq_quartier = index_of(quartier["id_quartier"], aq["id_quartier"])
+    aq = pd.DataFrame({"arret": aq_arret, "quartier": aq_quartier})
+    aq = aq[aq["arret"] >= 0].sort_values("arret", kind="stable")
+    links = np.bincount(aq["arret"].to_numpy(), minlength=len(arret_ids))
+    starts = np.concatenate([[0], np.cumsum(links)[:-1]])
+
+    # Une ligne par (mesure, association) ; une seule ligne NULL si l'arrêt n'a aucun quartier
+    n_links = np.where(arret_pos >= 0, links[np.maximum(arret_pos, 0)], 0)
+    repeat = np.maximum(n_links, 1)
+    m_idx = np.repeat(np.arange(len(valeurs)), repeat)
+    offset = np.arange(len(m_idx)) - np.repeat(np.cumsum(repeat) - repeat, repeat)
+    linked = np.repeat(n_links > 0, repeat)
+    link_pos = np.repeat(starts[np.maximum(arret_pos, 0)], repeat) + offset
+    q_codes = np.full(len(m_idx), -1)
+    q_codes[linked] = aq["quartier"].to_numpy()[link_pos[linked]]
+
+    rows, sums, counts = group_stats(q_codes, nq, valeurs[m_idx])
+    groups, pos = with_null_group(nq, rows > 0)
+    out = pd.DataFrame({
+        "quartier_nom": take(quartier["nom"], pos),
+        "avg_bruit": safe_mean(sums, counts)[groups],
+        "_nom": category_sort_key(quartier["nom"].cat, pos),
+        "_id": np.where(pos >= 0, groups, -1),
+    })
+    # NULL en dernier pour un tri décroissant (comme SQLite)
+    out["_avg"] = out["avg_bruit"].fillna(-np.inf)
+    out = out.sort_values(["_avg", "_nom", "_id"], ascending=[False, True, True], kind="stable")
+    return out.head(5)[["quartier_nom", "avg_bruit"]]
+
+
+def kpi_f(t):
+    """f. Lignes ayant au moins un relevé > 10 min sans incident (noms distincts)."""
+    ligne, trafic = t["Ligne"], t["Trafic"]
+    n = len(ligne)
+    line_pos = index_of(ligne["id_ligne"], trafic["id_ligne"])
+    with_incident = np.zeros(len(trafic), dtype=bool)
+    trafic_pos = index_of(trafic["id_trafic"], t["Incident"]["id_trafic"])
+    with_incident[trafic_pos[trafic_pos >= 0]] = True
+    retard = np.asarray(trafic["retard_minutes"], dtype=np.float64)
+    keep = (retard > 10) & ~with_incident & (line_pos >= 0)
+    present = np.zeros(n, dtype=bool)
+    present[line_pos[keep]] = True
+    pos = np.flatnonzero(present)
+    out = pd.DataFrame({"nom_ligne": take(ligne["nom_ligne"], pos), "_nom": category_sort_key(ligne["nom_ligne"].cat, pos)})
+    return out.drop_duplicates("_nom").sort_values("_nom", kind="stable")[["nom_ligne"]]
+
+
+def kpi_g(t):
+    """g. Taux de relevés sans retard sur tout Trafic."""
+    retard = np.asarray(t["Trafic"]["retard_minutes"], dtype=np.float64)
+    taux = (retard == 0).sum() / len(retard) if len(retard) else None
+    return pd.DataFrame({"taux_sans_retard": [taux]})
+
+
+def kpi_h(t):
+    """h. Nombre d'arrêts par quartier (tous les quartiers)."""
+    quartier, aq = t["Quartier"], t["ArretQuartier"]
+    nq = len(quartier)
+    q_pos = index_of(quartier["id_quartier"], aq["id_quartier"])
+    counted = (q_pos >= 0) & aq["id_arret"].notna().to_numpy()
+    rows, _, _ = group_stats(q_pos[counted], nq)
+    pos = np.arange(nq)
+    out = pd.DataFrame({
+        "quartier_nom": take(quartier["nom"], pos),
+        "arret_count": rows[:nq],
+        "_nom": category_sort_key(quartier["nom"].cat, pos),
+        "_id": pos,
+    })
+    out = out.sort_values(["arret_count", "_nom", "_id"], ascending=[False, True, True], kind="stable")
+    return out[["quartier_nom", "arret_count"]]
+
+
+def kpi_i(t):
+    """i. Corrélation CO2 / retard par ligne (agrégats par ligne et jour, voir outils/correlation.py)."""
+    mesures, cap_pos = measures_of_type(t, "CO2")
+    arret = t["Arret"]
+    arret_pos = index_of(arret["id_arret"], t["Capteur"]["id_arret"].to_numpy()[cap_pos])
+    ok = arret_pos >= 0  # JOIN Arret
+    co2 = daily_aggregates(
+        arret["id_ligne"].to_numpy()[arret_pos[ok]],
+        sql_date(t["Mesure"]["horodatage"].to_numpy()[mesures][ok]),
+        t["Mesure"]["valeur"].to_numpy()[mesures][ok],
+    )
+    trafic = t["Trafic"]
+    retard = daily_aggregates(trafic["id_ligne"].to_numpy(), sql_date(trafic["horodatage"]), trafic["retard_minutes"])
+    lignes = pd.DataFrame({"id_ligne": t["Ligne"]["id_ligne"].to_numpy(),
+                           "nom_ligne": np.asarray(t["Ligne"]["nom_ligne"], dtype=object)})
+    return correlation_by_line(co2, retard, lignes)
+
+
+def kpi_j(t):
+    """j. Température moyenne par ligne (groupe NULL pour les arrêts sans ligne)."""
+    n = len(t["Ligne"])
+    mesures, cap_pos = measures_of_type(t, "Temperature")
+    arret_pos = index_of(t["Arret"]["id_arret"], t["Capteur"]["id_arret"].to_numpy()[cap_pos])
+    line_pos = ligne_of_arret(t, arret_pos)
+    rows, sums, counts = group_stats(line_pos, n, t["Mesure"]["valeur"].to_numpy()[mesures])
+    return per_line_frame(t, safe_mean(sums, counts), "avg_temperature", rows > 0)
+
+
+def kpi_k(t):
+    """k. Retard moyen par chauffeur : relevés de la ligne de chacun de ses véhicules."""
+    ligne, vehicule, chauffeur = t["Ligne"], t["Vehicule"], t["Chauffeur"]
+    n = len(ligne)
+    _, (rows, sums, counts) = trafic_by_line(t)
+    veh_line = index_of(ligne["id_ligne"], vehicule["id_ligne"])
+    veh_chauffeur = index_of(chauffeur["id_chauffeur"], vehicule["id_chauffeur"])
+    ok = (veh_line >= 0) & (veh_chauffeur >= 0)
+    ok[ok] = rows[veh_line[ok]] > 0  # INNER JOIN Trafic
+    nc = len(chauffeur)
+    c_rows = np.bincount(veh_chauffeur[ok], minlength=nc)
+    c_sums = np.bincount(veh_chauffeur[ok], weights=sums[veh_line[ok]], minlength=nc)
+    c_counts = np.bincount(veh_chauffeur[ok], weights=counts[veh_line[ok]], minlength=nc)
+    pos = np.flatnonzero(c_rows > 0)
+    out = pd.DataFrame({
+        "chauffeur_nom": take(chauffeur["nom"], pos),
+        "avg_retard_minutes": safe_mean(c_sums, c_counts)[pos],
+        "_nom": category_sort_key(chauffeur["nom"].cat, pos),
+        "_id": pos,
+    })
+    return out.sort_values(["_nom", "_id"], kind="stable")[["chauffeur_nom", "avg_retard_minutes"]]
+
+
+def kpi_l(t):
+    """l. Part de véhicules électriques par ligne de bus (lignes ayant des véhicules)."""
+    ligne, vehicule = t["Ligne"], t["Vehicule"]
+    n = len(ligne)
+    veh_line = index_of(ligne["id_ligne"], vehicule["id_ligne"])
+    is_bus = np.asarray(ligne["type"] == "Bus")
+    ok = veh_line >= 0
+    ok[ok] = is_bus[veh_line[ok]]
+    electrique = np.asarray(vehicule["type_vehicule"] == "Electrique")[ok]
+    total = np.bincount(veh_line[ok], minlength=n)
+    elec = np.bincount(veh_line[ok], weights=electrique.astype(np.float64), minlength=n)
+    present = np.append(total > 0, False)
+    taux = np.append(elec / np.maximum(total, 1), np.nan)
+    return per_line_frame(t, taux, "taux_electrique", present)
+
+
+def kpi_m(t):
+    """m. Classification de chaque mesure CO2, triée par capteur (ordre de balayage conservé)."""
+    mesures, cap_pos = measures_of_type(t, "CO2")
+    capteur = t["Capteur"]
+    valeur = t["Mesure"]["valeur"].to_numpy()[mesures]
+    niveau = NIVEAUX_POLLUTION[np.select([valeur < 400, valeur < 500], [0, 1], default=2)]
+    out = pd.DataFrame({
+        "id_capteur": capteur["id_capteur"].to_numpy()[cap_pos].astype(np.int64),
+        "latitude": capteur["latitude"].to_numpy()[cap_pos],
+        "longitude": capteur["longitude"].to_numpy()[cap_pos],
+        "valeur": valeur,
+        "niveau_pollution": niveau,
+    })
+    return out.sort_values("id_capteur", kind="stable")
+
+
+def kpi_n(t):
+    """n. Classe de retard moyen par ligne (moyenne NULL -> classe la plus haute, comme le CASE SQL)."""
+    n = len(t["Ligne"])
+    _, (_, sums, counts) = trafic_by_line(t)
+    avg = safe_mean(sums, counts)
+    classe = CLASSES_RETARD[np.select([avg < 6.5, avg < 7], [0, 1], default=2)]
+    return per_line_frame(t, classe, "classification_retard", np.arange(n + 1) < n)
+
+
+KPIS = {
+    "a": kpi_a, "b": kpi_b, "c": kpi_c, "d": kpi_d, "e": kpi_e, "f": kpi_f, "g": kpi_g,
+    "h": kpi_h, "i": kpi_i, "j": kpi_j, "k": kpi_k, "l": kpi_l, "m": kpi_m, "n": kpi_n,
+}
+
+
+def iter_rows(df):
+    """Lignes du résultat en types Python (entiers sans '.0', NULL -> None) pour write_csv."""
+    columns = [df[c].to_numpy(dtype=object) for c in df.columns]
+    for row in zip(*columns):
+        yield [None if v is None or (isinstance(v, float) and np.isnan(v)) else
+               (int(v) if isinstance(v, np.integer) else v) for v in row]
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Requêtes a–n sur un moteur colonnaire en mémoire (pandas / NumPy).
+
+Les tables SQLite sont chargées une fois (columnar_kpis.load_tables), puis
+les 14 requêtes sont calculées en mémoire et exportées avec le même schéma
+CSV que requete_sql.py (colonnes et noms de fichiers de sql_registry.py).
+--check compare chaque résultat à l'export SQL (outils/compare_results.py) ;
+--benchmark mesure aussi les requêtes SQLite pour afficher le gain.
+"""
+
+print("Début des requêtes colonnaires...")
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from math import sqrt
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "requetes_sql"))
+from columnar_kpis import KPIS, iter_rows, load_tables
+from sql_registry import execute, select_queries
+from outils.compare_results import same_result
+from outils.export_stream import HAS_ARROW, write_csv
+
+SQLITE_PATH = "data/Paris2055.sqlite"
+EXPORT_DIR = "requetes_columnar/resultat_requetes_columnar"
+SQL_EXPORT_DIR = "requetes_sql/resultat_requetes_sql"
+os.makedirs(EXPORT_DIR, exist_ok=True)
+
+parser = argparse.ArgumentParser(description="Requêtes a–n sur un moteur colonnaire en mémoire")
+parser.add_argument("queries", nargs="*", help="Sous-ensemble de requêtes à exécuter (ex : a d i). Par défaut : toutes")
+parser.add_argument("--db", default=SQLITE_PATH)
+parser.add_argument("--gzip", action="store_true", help="Exporter en .csv.gz")
+parser.add_argument("--arrow", action="store_true",
+                    help="Écrire aussi chaque résultat en Feather / Arrow IPC (.feather, pyarrow requis)")
+parser.add_argument("--check", action="store_true", help="Comparer chaque résultat à l'export SQL correspondant")
+parser.add_argument("--benchmark", action="store_true", help="Mesurer aussi les requêtes SQLite et afficher le gain")
+args = parser.parse_args()
+if args.arrow and not HAS_ARROW:
+    parser.error("--arrow nécessite pyarrow (pip install pyarrow)")
+
+
+conn = sqlite3.connect(f"{Path(args.db).resolve().as_uri()}?mode=ro", uri=True)
+conn.create_function("SQRT", 1, sqrt)
+
+start = time.perf_counter()
+tables = load_tables(conn)
+load_time = time.perf_counter() - start
+print(f"Chargement des tables : {load_time:.3f} s")
+
+timings = []
+for query in select_queries(args.queries):
+    start = time.perf_counter()
+    df = KPIS[query["name"]](tables)
+    compute_time = time.perf_counter() - start
+    path, count = write_csv(os.path.join(EXPORT_DIR, query["file"]), query["columns"], iter_rows(df), compress=args.gzip, arrow=args.arrow)
+    row = {"requete": query["name"], "lignes": count, "duree_s": compute_time}
+
+    if args.benchmark:
+        start = time.perf_counter()
+        list(execute(conn, query))
+        row["sqlite_s"] = time.perf_counter() - start
+        row["gain"] = row["sqlite_s"] / compute_time if compute_time > 0 else float("inf")
+    if args.check:
+        sql_path = os.path.join(SQL_EXPORT_DIR, query["file"])
+        if not os.path.exists(sql_path) and os.path.exists(sql_path + ".gz"):
+            sql_path += ".gz"
+        row["identique_sql"] = same_result(path, sql_path)
+    timings.append(row)
+conn.close()
+
+df_timings = pd.DataFrame(timings)
+print(df_timings.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+print(f"Calcul : {df_timings['duree_s'].sum():.3f} s (+ chargement {load_time:.3f} s)")
+if args.benchmark:
+    print(f"SQLite : {df_timings['sqlite_s'].sum():.3f} s")
+if args.check and (df_timings["identique_sql"] == False).any():
+    print("⚠️ Résultats différents de l'export SQL :", ", ".join(df_timings.loc[df_timings["identique_sql"] == False, "requete"]))
+
+print("Fin des requêtes colonnaires.")
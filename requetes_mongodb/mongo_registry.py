@@ -0,0 +1,489 @@
+"""
+Registre déclaratif des requêtes MongoDB a–n (Partie 3).
+
+Chaque entrée décrit une requête :
+- name       : lettre de la requête (a–n)
+- title      : intitulé du sujet
+- collection : collection sur laquelle le pipeline est lancé
+- pipeline   : pipeline d'agrégation
+- inputs     : collections lues (pipeline et $lookup), pour la version du cache
+- columns    : colonnes du CSV exporté (même schéma que les exports SQLite)
+- file       : nom du fichier CSV exporté
+- compute    : (optionnel) fonction Python qui calcule le résultat à partir
+               de la base, au lieu d'un pipeline unique
+- options    : (optionnel) options passées à aggregate (ex : allowDiskUse)
+- explain    : (optionnel, avec compute) pipelines [(collection, pipeline)]
+               réellement exécutés, pour la capture des plans
+- partition  : (optionnel) champ de la collection Trafic qui partitionne le
+               résultat : la vue matérialisée (vues_kpi.py) ne recalcule que
+               les partitions qui ont reçu de nouveaux relevés
+"""
+
+import inspect
+
+import pandas as pd
+
+from outils.resume_env_lignes import ENV_SUMMARY_COLLECTION
+import outils.correlation
+from outils.correlation import SUM_COLUMNS, correlation_from_sums
+
+
+# g. Taux de ponctualité global
+# count_documents est lui-même un $match + $group côté serveur
+PONCTUALITE_PIPELINES = [
+    ("Trafic", [{"$match": {}}, {"$group": {"_id": 1, "n": {"$sum": 1}}}]),
+    ("Trafic", [{"$match": {"retard_minutes": 0}}, {"$group": {"_id": 1, "n": {"$sum": 1}}}]),
+]
+
+
+def compute_ponctualite(db, max_time_ms=None):
+    options = {"maxTimeMS": max_time_ms} if max_time_ms else {}
+    total = db.Trafic.count_documents({}, **options)
+    sans_retard = db.Trafic.count_documents({"retard_minutes": 0}, **options)
+    return [{"taux_sans_retard": sans_retard / total if total > 0 else 0}]
+
+
+# i. Corrélation (CO2 vs Retard par ligne et jour)
+# Au lieu de joindre chaque relevé de trafic à toutes les mesures CO2 du même jour,
+# chaque côté est réduit en agrégats par (ligne, jour) puis joint (outils/correlation.py).
+# Tout est fait côté serveur : seules les six sommes de chaque ligne sont renvoyées.
+def daily_group(value):
+    """Étape $group : effectif, somme et somme des carrés par (ligne, jour)."""
+    return {"$group": {
+        "_id": {"id_ligne": "$id_ligne", "jour": {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}}},
+        "n": {"$sum": 1},
+        "somme": {"$sum": value},
+        "somme_carres": {"$sum": {"$multiply": [value, value]}}
+    }}
+
+
+def side_sum(side, field):
+    """Somme de `field` pour les agrégats journaliers du côté `side` (x : CO2, y : retard)."""
+    return {"$sum": {"$cond": [{"$eq": ["$cote", side]}, f"${field}", 0]}}
+
+
+CO2_DAILY_PIPELINE = [
+    {"$unwind": "$capteurs"},
+    {"$match": {"capteurs.type_capteur": "CO2"}},
+    {"$unwind": "$capteurs.mesures"},
+    {"$project": {"id_ligne": 1, "date": "$capteurs.mesures.horodatage", "valeur": "$capteurs.mesures.valeur"}},
+    daily_group("$valeur")
+]
+RETARD_DAILY_PIPELINE = [
+    {"$project": {"id_ligne": 1, "date": "$horodatage", "retard": "$retard_minutes"}},
+    daily_group("$retard")
+]
+# Agrégats journaliers des deux côtés ($unionWith), réunis par (ligne, jour), puis
+# sommes sur les paires par ligne : n = Σ nx·ny, Σx = Σ Sx·ny, ..., Σxy = Σ Sx·Sy.
+# Un jour présent d'un seul côté contribue 0 à toutes les sommes (jointure interne).
+CORRELATION_PIPELINE = CO2_DAILY_PIPELINE + [
+    {"$addFields": {"cote": "x"}},
+    {"$unionWith": {"coll": "Trafic", "pipeline": RETARD_DAILY_PIPELINE + [{"$addFields": {"cote": "y"}}]}},
+    {"$group": {
+        "_id": "$_id",
+        "nx": side_sum("x", "n"), "sx": side_sum("x", "somme"), "qx": side_sum("x", "somme_carres"),
+        "ny": side_sum("y", "n"), "sy": side_sum("y", "somme"), "qy": side_sum("y", "somme_carres"),
+    }},
+    {"$group": {
+        "_id": "$_id.id_ligne",
+        "n": {"$sum": {"$multiply": ["$nx", "$ny"]}},
+        "sx": {"$sum": {"$multiply": ["$sx", "$ny"]}},
+        "sy": {"$sum": {"$multiply": ["$sy", "$nx"]}},
+        "sxx": {"$sum": {"$multiply": ["$qx", "$ny"]}},
+        "syy": {"$sum": {"$multiply": ["$qy", "$nx"]}},
+        "sxy": {"$sum": {"$multiply": ["$sx", "$sy"]}},
+    }},
+    # Au moins 2 paires, comme le calcul Pandas d'origine
+    {"$match": {"n": {"$gte": 2}}},
+]
+
+
+def compute_correlation(db, max_time_ms=None):
+    options = {"maxTimeMS": max_time_ms} if max_time_ms else {}
+    sums = pd.DataFrame([{"id_ligne": d["_id"], **{c: d[c] for c in SUM_COLUMNS}}
+                         for d in db.Arrets.aggregate(CORRELATION_PIPELINE, allowDiskUse=True, **options)],
+                        columns=["id_ligne"] + SUM_COLUMNS)
+    lignes_cursor = db.Lignes.find({}, {"_id": 0, "id_ligne": 1, "nom_ligne": 1}).max_time_ms(max_time_ms)
+    lignes = pd.DataFrame(list(lignes_cursor), columns=["id_ligne", "nom_ligne"])
+    # Tri : Alphabétique par nom_ligne ; la formule de Pearson est celle de la requête SQL
+    return correlation_from_sums(sums, lignes, min_pairs=2).to_dict("records")
+
+
+QUERIES = [
+    # a. Moyenne des retards par ligne
+    # Tri : Alphabétique par nom_ligne
+    {
+        "name": "a",
+        "title": "Moyenne des retards par ligne",
+        "collection": "Trafic",
+        "inputs": ["Trafic", "Lignes"],
+        "pipeline": [
+            {"$group": {"_id": "$id_ligne", "avg_retard": {"$avg": "$retard_minutes"}}},
+            {"$lookup": {"from": "Lignes", "localField": "_id", "foreignField": "id_ligne", "as": "ligne_info"}},
+            {"$unwind": "$ligne_info"},
+            {"$project": {"nom_ligne": "$ligne_info.nom_ligne", "avg_retard": 1}},
+            {"$sort": {"nom_ligne": 1}}
+        ],
+        "columns": ["nom_ligne", "avg_retard"],
+        "file": "mongo_requete_a.csv",
+        "partition": "id_ligne",
+    },
+    # b. Nombre moyen de passagers par jour et par ligne
+    # Tri : Alphabétique par nom_ligne, puis par jour
+    {
+        "name": "b",
+        "title": "Nombre moyen de passagers par jour et par ligne",
+        "collection": "Arrets",
+        "inputs": ["Arrets", "Lignes"],
+        "pipeline": [
+            {"$unwind": "$horaires"},
+            {"$addFields": {
+                "horaires.heure_prevue": {
+                    "$dateFromString": {
+                        "dateString": "$horaires.heure_prevue",
+                        "onError": None,
+                        "onNull": None
+                    }
+                }
+            }},
+            {"$group": {
+                "_id": {
+                    "id_ligne": "$id_ligne",
+                    "jour": {"$dateToString": {"format": "%Y-%m-%d", "date": "$horaires.heure_prevue"}}
+                },
+                "avg_passagers": {"$avg": "$horaires.passagers_estimes"}
+            }},
+            {"$lookup": {"from": "Lignes", "localField": "_id.id_ligne", "foreignField": "id_ligne", "as": "l"}},
+            {"$unwind": "$l"},
+            {"$project": {"nom_ligne": "$l.nom_ligne", "jour": "$_id.jour", "avg_passagers": 1}},
+            {"$sort": {"nom_ligne": 1, "jour": 1}}
+        ],
+        "columns": ["nom_ligne", "jour", "avg_passagers"],
+        "file": "mongo_requete_b.csv",
+    },
+    # c. Taux d'incidents par ligne
+    # Pas de changement majeur de logique nécessaire ici, le SQL a été adapté à Mongo.
+    # On s'assure juste du tri.
+    {
+        "name": "c",
+        "title": "Taux d'incidents par ligne",
+        "collection": "Trafic",
+        "inputs": ["Trafic", "Lignes"],
+        "pipeline": [
+            {"$group": {
+                "_id": "$id_ligne",
+                "total_releves": {"$sum": 1},
+                "total_incidents": {"$sum": {"$size": {"$ifNull": ["$incidents", []]}}} # Sécurité si null
+            }},
+            {"$project": {
+                "incident_taux": {"$divide": ["$total_incidents", "$total_releves"]}
+            }},
+            {"$lookup": {
+                "from": "Lignes",
+                "localField": "_id",
+                "foreignField": "id_ligne",
+                "as": "l"
+            }},
+            {"$unwind": "$l"},
+            {"$project": {
+                "nom_ligne": "$l.nom_ligne",
+                "incident_taux": 1
+            }},
+            {"$sort": {"nom_ligne": 1}}
+        ],
+        "columns": ["nom_ligne", "incident_taux"],
+        "file": "mongo_requete_c.csv",
+        "partition": "id_ligne",
+    },
+    # d. Emissions moyennes de CO2 par véhicule
+    # Tri : Par immatriculation
+    {
+        "name": "d",
+        "title": "Emissions moyennes de CO2 par véhicule",
+        "collection": "Vehicules",
+        "inputs": ["Vehicules", ENV_SUMMARY_COLLECTION],
+        # Lit le résumé par ligne (outils/resume_env_lignes.py) au lieu de déplier
+        # toutes les mesures des arrêts de la ligne pour chaque véhicule
+        "pipeline": [
+            {"$lookup": {
+                "from": ENV_SUMMARY_COLLECTION,
+                "localField": "id_ligne",
+                "foreignField": "id_ligne",
+                "as": "resume"
+            }},
+            {"$unwind": "$resume"},
+            {"$match": {"resume.co2.nb_mesures": {"$gt": 0}}},
+            {"$project": {
+                "_id": "$id_vehicule",
+                "immatriculation": 1,
+                "type_vehicule": 1,
+                "avg_co2": "$resume.co2.moyenne"
+            }},
+            {"$sort": {"immatriculation": 1}}
+        ],
+        "columns": ["immatriculation", "type_vehicule", "avg_co2"],
+        "file": "mongo_requete_d.csv",
+    },
+    # e. Top 5 des quartiers les plus bruyants
+    # Tri : Valeur décroissante, puis nom quartier (pour égalité)
+    {
+        "name": "e",
+        "title": "Top 5 des quartiers les plus bruyants",
+        "collection": "Arrets",
+        "inputs": ["Arrets"],
+        "pipeline": [
+            {"$unwind": "$quartiers"},
+            {"$unwind": "$capteurs"},
+            {"$match": {"capteurs.type_capteur": "Bruit"}},
+            {"$unwind": "$capteurs.mesures"},
+            {"$group": {"_id": "$quartiers.nom", "avg_bruit": {"$avg": "$capteurs.mesures.valeur"}}},
+            {"$sort": {"avg_bruit": -1, "_id": 1}},
+            {"$limit": 5},
+            {"$project": {"quartier_nom": "$_id", "avg_bruit": 1}}
+        ],
+        "columns": ["quartier_nom", "avg_bruit"],
+        "file": "mongo_requete_e.csv",
+    },
+    # f. Liste des lignes sans incident mais avec retards > 10 min
+    # Tri : Alphabétique par nom_ligne
+    {
+        "name": "f",
+        "title": "Lignes sans incident mais avec retards > 10 min",
+        "collection": "Trafic",
+        "inputs": ["Trafic", "Lignes"],
+        "pipeline": [
+            {"$match": {"retard_minutes": {"$gt": 10}, "incidents": {"$size": 0}}},
+            {"$lookup": {"from": "Lignes", "localField": "id_ligne", "foreignField": "id_ligne", "as": "l"}},
+            {"$unwind": "$l"},
+            {"$group": {"_id": "$l.nom_ligne"}},
+            {"$project": {"nom_ligne": "$_id"}},
+            {"$sort": {"nom_ligne": 1}}
+        ],
+        "columns": ["nom_ligne"],
+        "file": "mongo_requete_f.csv",
+        "partition": "id_ligne",
+    },
+    # g. Taux de ponctualité global
+    {
+        "name": "g",
+        "title": "Taux de ponctualité global",
+        "collection": "Trafic",
+        "inputs": ["Trafic"],
+        "compute": compute_ponctualite,
+        "explain": PONCTUALITE_PIPELINES,
+        "columns": ["taux_sans_retard"],
+        "file": "mongo_requete_g.csv",
+    },
+    # h. Nombre d'arrêts par quartier
+    # Tri : Nombre arrêts décroissant, puis nom quartier
+    {
+        "name": "h",
+        "title": "Nombre d'arrêts par quartier",
+        "collection": "Arrets",
+        "inputs": ["Arrets"],
+        "pipeline": [
+            {"$unwind": "$quartiers"},
+            {"$group": {"_id": "$quartiers.nom", "arret_count": {"$sum": 1}}},
+            {"$project": {"quartier_nom": "$_id", "arret_count": 1}},
+            {"$sort": {"arret_count": -1, "quartier_nom": 1}}
+        ],
+        "columns": ["quartier_nom", "arret_count"],
+        "file": "mongo_requete_h.csv",
+    },
+    # i. Corrélation trafic / pollution (agrégats par ligne et jour)
+    {
+        "name": "i",
+        "title": "Corrélation entre trafic et pollution",
+        "collection": "Arrets",
+        "inputs": ["Arrets", "Trafic", "Lignes"],
+        "compute": compute_correlation,
+        "explain": [("Arrets", CORRELATION_PIPELINE)],
+        "columns": ["nom_ligne", "correlation"],
+        "file": "mongo_requete_i.csv",
+    },
+    # j. Moyenne de température par ligne
+    # Tri : Alphabétique par nom_ligne
+    {
+        "name": "j",
+        "title": "Moyenne de température par ligne",
+        "collection": ENV_SUMMARY_COLLECTION,
+        "inputs": [ENV_SUMMARY_COLLECTION, "Lignes"],
+        "pipeline": [
+            {"$match": {"temperature.nb_mesures": {"$gt": 0}}},
+            {"$lookup": {"from": "Lignes", "localField": "id_ligne", "foreignField": "id_ligne", "as": "l"}},
+            {"$unwind": "$l"},
+            {"$project": {"nom_ligne": "$l.nom_ligne", "avg_temperature": "$temperature.moyenne"}},
+            {"$sort": {"nom_ligne": 1}}
+        ],
+        "columns": ["nom_ligne", "avg_temperature"],
+        "file": "mongo_requete_j.csv",
+    },
+    # k. Performance chauffeur (retard moyen)
+    # Correction : S'assurer que le scope est identique au SQL (Vehicules -> Lignes -> Trafic existant)
+    {
+        "name": "k",
+        "title": "Performance chauffeur (retard moyen)",
+        "collection": "Vehicules",
+        "inputs": ["Vehicules", "Trafic"],
+        "pipeline": [
+            # 1. Récupérer le nom du chauffeur
+            {"$project": {
+                "id_ligne": 1,
+                "chauffeur_nom": "$chauffeur.nom",
+                "id_chauffeur": "$chauffeur.id_chauffeur"
+            }},
+            # 2. Joindre le trafic de la ligne correspondante
+            {"$lookup": {
+                "from": "Trafic",
+                "localField": "id_ligne",
+                "foreignField": "id_ligne",
+                "as": "t"
+            }},
+            # 3. Unwind : Cela agit comme un INNER JOIN. Si 't' est vide (pas de trafic), le chauffeur est exclu.
+            {"$unwind": "$t"},
+            # 4. Groupement
+            {"$group": {
+                "_id": "$id_chauffeur",
+                "nom": {"$first": "$chauffeur_nom"},
+                "avg_retard": {"$avg": "$t.retard_minutes"}
+            }},
+            {"$project": {
+                "chauffeur_nom": "$nom",
+                "avg_retard_minutes": "$avg_retard"
+            }},
+            {"$sort": {"chauffeur_nom": 1}}
+        ],
+        "columns": ["chauffeur_nom", "avg_retard_minutes"],
+        "file": "mongo_requete_k.csv",
+    },
+    # l. % véhicules électriques par ligne de bus
+    # Tri : Alphabétique par nom_ligne
+    {
+        "name": "l",
+        "title": "% véhicules électriques par ligne de bus",
+        "collection": "Lignes",
+        "inputs": ["Lignes", "Vehicules"],
+        "pipeline": [
+            {"$match": {"type": "Bus"}},
+            {"$lookup": {"from": "Vehicules", "localField": "id_ligne", "foreignField": "id_ligne", "as": "v"}},
+            {"$project": {
+                "nom_ligne": 1,
+                "taux_electrique": {
+                    "$cond": [
+                        {"$gt": [{"$size": "$v"}, 0]},
+                        {"$divide": [
+                            {"$size": {"$filter": {"input": "$v", "cond": {"$eq": ["$$this.type_vehicule", "Electrique"]}}}},
+                            {"$size": "$v"}
+                        ]},
+                        0
+                    ]
+                }
+            }},
+            {"$sort": {"nom_ligne": 1}}
+        ],
+        "columns": ["nom_ligne", "taux_electrique"],
+        "file": "mongo_requete_l.csv",
+    },
+    # m. Classification pollution avec localisation
+    # Tri : Par id_capteur
+    {
+        "name": "m",
+        "title": "Classification pollution avec localisation",
+        "collection": "Arrets",
+        "inputs": ["Arrets"],
+        "pipeline": [
+            {"$unwind": "$capteurs"},
+            {"$match": {"capteurs.type_capteur": "CO2"}},
+            {"$unwind": "$capteurs.mesures"},
+            {"$project": {
+                "id_capteur": "$capteurs.id_capteur",
+                "latitude": {"$arrayElemAt": ["$capteurs.location.coordinates", 1]},
+                "longitude": {"$arrayElemAt": ["$capteurs.location.coordinates", 0]},
+                "valeur": "$capteurs.mesures.valeur",
+                "niveau_pollution": {
+                    "$switch": {
+                        "branches": [
+                            {"case": {"$lt": ["$capteurs.mesures.valeur", 400]}, "then": "faible"},
+                            {"case": {"$lt": ["$capteurs.mesures.valeur", 500]}, "then": "moyen"}
+                        ],
+                        "default": "élevé"
+                    }
+                }
+            }},
+            {"$sort": {"id_capteur": 1}}
+        ],
+        "columns": ["id_capteur", "latitude", "longitude", "valeur", "niveau_pollution"],
+        "file": "mongo_requete_m.csv",
+    },
+    # n. Classification des lignes par retard moyen
+    # Tri : Alphabétique par nom_ligne
+    {
+        "name": "n",
+        "title": "Classification des lignes par retard moyen",
+        "collection": "Trafic",
+        "inputs": ["Trafic", "Lignes"],
+        "pipeline": [
+            {"$group": {"_id": "$id_ligne", "avg_r": {"$avg": "$retard_minutes"}}},
+            {"$lookup": {"from": "Lignes", "localField": "_id", "foreignField": "id_ligne", "as": "l"}},
+            {"$unwind": "$l"},
+            {"$project": {
+                "nom_ligne": "$l.nom_ligne",
+                "classification_retard": {
+                    "$switch": {
+                        "branches": [
+                            {"case": {"$lt": ["$avg_r", 6.5]}, "then": "retard moyen inf a 6min30"},
+                            {"case": {"$lt": ["$avg_r", 7]}, "then": "retard moyen inf a 7min"}
+                        ],
+                        "default": "retard moyen sup a 7min"
+                    }
+                }
+            }},
+            {"$sort": {"nom_ligne": 1}}
+        ],
+        "columns": ["nom_ligne", "classification_retard"],
+        "file": "mongo_requete_n.csv",
+        "partition": "id_ligne",
+    },
+]
+
+QUERIES_BY_NAME = {q["name"]: q for q in QUERIES}
+
+
+def select_queries(names=None):
+    """Renvoie les entrées du registre demandées (toutes si names est vide)."""
+    if not names:
+        return list(QUERIES)
+    unknown = [n for n in names if n not in QUERIES_BY_NAME]
+    if unknown:
+        raise ValueError(f"Requête(s) inconnue(s) : {', '.join(unknown)}")
+    return [QUERIES_BY_NAME[n] for n in names]
+
+
+def definition(query):
+    """Définition d'une entrée (pipeline, ou source du registre pour une fonction compute), pour la clé de cache."""
+    if "compute" in query:
+        # Source du module entier : inclut les pipelines auxiliaires appelés par compute,
+        # et du moteur de corrélation (formule de Pearson, min_pairs)
+        return {"compute": query["compute"].__name__, "source": inspect.getsource(inspect.getmodule(query["compute"])),
+                "correlation": inspect.getsource(outils.correlation), "columns": query["columns"]}
+    return {"pipeline": query["pipeline"], "options": query.get("options", {}), "columns": query["columns"]}
+
+
+def pipelines(query):
+    """Pipelines [(collection, pipeline)] exécutés par une entrée du registre."""
+    if "compute" in query:
+        return query.get("explain", [])
+    return [(query["collection"], query["pipeline"])]
+
+
+def execute(db, query, max_time_ms=None):
+    """
+    Exécute une entrée du registre et renvoie un itérable de documents (curseur ou liste).
+    max_time_ms : délai maximal côté serveur (maxTimeMS) de chaque opération.
+    """
+    if "compute" in query:
+        return query["compute"](db, max_time_ms)
+    options = dict(query.get("options", {}))
+    if max_time_ms:
+        options["maxTimeMS"] = max_time_ms
+    return db[query["collection"]].aggregate(query["pipeline"], **options)
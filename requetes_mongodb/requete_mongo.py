@@ -1,6 +1,20 @@
+import argparse
 import pandas as pd
 from pymongo import MongoClient
+from pymongo.errors import ExecutionTimeout, PyMongoError
 import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mongo_registry import definition, execute, select_queries
+from outils.resume_env_lignes import ENV_SUMMARY_COLLECTION, build_env_summary
+from vues_kpi import read_view, refresh
+from outils.arrets_scan import FUSED_QUERIES, scan_arrets
+from outils.export_stream import HAS_ARROW, iter_mongo_rows, write_csv
+from outils.result_cache import load_cache, lookup, mongo_version, query_key, save_cache, store
 
 # Configuration
 MONGO_URI = "mongodb://localhost:27017/"
@@ -8,314 +22,117 @@ DB_NAME = "Paris2055"
 EXPORT_DIR = "requetes_mongodb/resultat_requetes_mongodb"
 os.makedirs(EXPORT_DIR, exist_ok=True)
 
-client = MongoClient(MONGO_URI)
+parser = argparse.ArgumentParser(description="Requêtes a–n sur MongoDB")
+parser.add_argument("queries", nargs="*", help="Sous-ensemble de requêtes à exécuter (ex : a d i). Par défaut : toutes")
+parser.add_argument("--workers", type=int, default=4,
+                    help="Nombre d'agrégations envoyées en parallèle au serveur")
+parser.add_argument("--max-time-ms", type=int, default=0,
+                    help="Délai maximal d'une requête côté serveur (maxTimeMS, 0 : aucun)")
+parser.add_argument("--gzip", action="store_true", help="Exporter en .csv.gz")
+parser.add_argument("--arrow", action="store_true",
+                    help="Écrire aussi chaque résultat en Feather / Arrow IPC (.feather, pyarrow requis)")
+parser.add_argument("--no-cache", action="store_true", help="Réexécuter toutes les requêtes même si les données n'ont pas changé")
+parser.add_argument("--fused", action="store_true",
+                    help=f"Calculer {', '.join(FUSED_QUERIES)} en un seul parcours d'Arrets (outils/arrets_scan.py)")
+parser.add_argument("--vues", action="store_true", help="Exporter depuis les vues matérialisées KPI_* (rafraîchies au besoin, vues_kpi.py)")
+args = parser.parse_args()
+if args.arrow and not HAS_ARROW:
+    parser.error("--arrow nécessite pyarrow (pip install pyarrow)")
+
+# Un seul client partagé par les threads : pymongo gère le pool de connexions
+client = MongoClient(MONGO_URI, maxPoolSize=max(args.workers, 1) + 1)
 db = client[DB_NAME]
 
 def export_to_csv(cursor, filename, columns):
     """
-    Export MongoDB cursor data to a CSV file with specified columns.
-    Ensures consistent structure with SQLite exports.
+    Stream MongoDB cursor data to a CSV file with specified columns.
+    Ensures consistent structure with SQLite exports (missing keys -> empty cells)
+    without materializing the result set in memory.
     """
-    df = pd.DataFrame(list(cursor))
-    if not df.empty:
-        # Reorder columns to match list provided
-        # Handle cases where some keys might be missing in documents using reindex
-        df = df.reindex(columns=columns)
-    else:
-        # Create empty DF with columns if no data
-        df = pd.DataFrame(columns=columns)
-        
-    df.to_csv(os.path.join(EXPORT_DIR, filename), index=False)
-    print(f"✅ Exporté : {filename}")
-
-# --- REQUÊTES ---
-
-# a. Moyenne des retards par ligne
-# Tri : Alphabétique par nom_ligne
-res_a = db.Trafic.aggregate([
-    {"$group": {"_id": "$id_ligne", "avg_retard": {"$avg": "$retard_minutes"}}},
-    {"$lookup": {"from": "Lignes", "localField": "_id", "foreignField": "id_ligne", "as": "ligne_info"}},
-    {"$unwind": "$ligne_info"},
-    {"$project": {"nom_ligne": "$ligne_info.nom_ligne", "avg_retard": 1}},
-    {"$sort": {"nom_ligne": 1}}
-])
-export_to_csv(res_a, "mongo_requete_a.csv", ["nom_ligne", "avg_retard"])
-
-# b. Nombre moyen de passagers par jour et par ligne
-# Tri : Alphabétique par nom_ligne, puis par jour
-res_b = db.Arrets.aggregate([
-    {"$unwind": "$horaires"},
-    {"$addFields": {
-        "horaires.heure_prevue": {
-            "$dateFromString": {
-                "dateString": "$horaires.heure_prevue",
-                "onError": None,
-                "onNull": None
-            }
-        }
-    }},
-    {"$group": {
-        "_id": {
-            "id_ligne": "$id_ligne", 
-            "jour": {"$dateToString": {"format": "%Y-%m-%d", "date": "$horaires.heure_prevue"}}
-        },
-        "avg_passagers": {"$avg": "$horaires.passagers_estimes"}
-    }},
-    {"$lookup": {"from": "Lignes", "localField": "_id.id_ligne", "foreignField": "id_ligne", "as": "l"}},
-    {"$unwind": "$l"},
-    {"$project": {"nom_ligne": "$l.nom_ligne", "jour": "$_id.jour", "avg_passagers": 1}},
-    {"$sort": {"nom_ligne": 1, "jour": 1}}
-])
-export_to_csv(res_b, "mongo_requete_b.csv", ["nom_ligne", "jour", "avg_passagers"])
-
-# c. Taux d'incidents par ligne
-# Pas de changement majeur de logique nécessaire ici, le SQL a été adapté à Mongo.
-# On s'assure juste du tri.
-res_c = db.Trafic.aggregate([
-    {"$group": {
-        "_id": "$id_ligne",
-        "total_releves": {"$sum": 1},
-        "total_incidents": {"$sum": {"$size": {"$ifNull": ["$incidents", []]}}} # Sécurité si null
-    }},
-    {"$project": {
-        "incident_taux": {"$divide": ["$total_incidents", "$total_releves"]}
-    }},
-    {"$lookup": {
-        "from": "Lignes", 
-        "localField": "_id", 
-        "foreignField": "id_ligne", 
-        "as": "l"
-    }},
-    {"$unwind": "$l"},
-    {"$project": {
-        "nom_ligne": "$l.nom_ligne", 
-        "incident_taux": 1
-    }},
-    {"$sort": {"nom_ligne": 1}}
-])
-export_to_csv(res_c, "mongo_requete_c.csv", ["nom_ligne", "incident_taux"])
-
-# d. Emissions moyennes de CO2 par véhicule
-# Tri : Par immatriculation
-res_d = db.Vehicules.aggregate([
-    {"$lookup": {
-        "from": "Arrets",
-        "localField": "id_ligne",
-        "foreignField": "id_ligne",
-        "as": "arrets_ligne"
-    }},
-    {"$unwind": "$arrets_ligne"},
-    {"$unwind": "$arrets_ligne.capteurs"},
-    {"$match": {"arrets_ligne.capteurs.type_capteur": "CO2"}},
-    {"$unwind": "$arrets_ligne.capteurs.mesures"},
-    {"$group": {
-        "_id": "$id_vehicule",
-        "immatriculation": {"$first": "$immatriculation"},
-        "type_vehicule": {"$first": "$type_vehicule"},
-        "avg_co2": {"$avg": "$arrets_ligne.capteurs.mesures.valeur"}
-    }},
-    {"$sort": {"immatriculation": 1}}
-])
-export_to_csv(res_d, "mongo_requete_d.csv", ["immatriculation", "type_vehicule", "avg_co2"])
-
-# e. Top 5 des quartiers les plus bruyants
-# Tri : Valeur décroissante, puis nom quartier (pour égalité)
-res_e = db.Arrets.aggregate([
-    {"$unwind": "$quartiers"},
-    {"$unwind": "$capteurs"},
-    {"$match": {"capteurs.type_capteur": "Bruit"}},
-    {"$unwind": "$capteurs.mesures"},
-    {"$group": {"_id": "$quartiers.nom", "avg_bruit": {"$avg": "$capteurs.mesures.valeur"}}},
-    {"$sort": {"avg_bruit": -1, "_id": 1}},
-    {"$limit": 5},
-    {"$project": {"quartier_nom": "$_id", "avg_bruit": 1}}
-])
-export_to_csv(res_e, "mongo_requete_e.csv", ["quartier_nom", "avg_bruit"])
-
-# f. Liste des lignes sans incident mais avec retards > 10 min
-# Tri : Alphabétique par nom_ligne
-res_f = db.Trafic.aggregate([
-    {"$match": {"retard_minutes": {"$gt": 10}, "incidents": {"$size": 0}}},
-    {"$lookup": {"from": "Lignes", "localField": "id_ligne", "foreignField": "id_ligne", "as": "l"}},
-    {"$unwind": "$l"},
-    {"$group": {"_id": "$l.nom_ligne"}},
-    {"$project": {"nom_ligne": "$_id"}},
-    {"$sort": {"nom_ligne": 1}}
-])
-export_to_csv(res_f, "mongo_requete_f.csv", ["nom_ligne"])
-
-# g. Taux de ponctualité global
-total = db.Trafic.count_documents({})
-sans_retard = db.Trafic.count_documents({"retard_minutes": 0})
-taux = sans_retard / total if total > 0 else 0
-pd.DataFrame([{"taux_sans_retard": taux}]).to_csv(
-    os.path.join(EXPORT_DIR, "mongo_requete_g.csv"), index=False
-)
-
-# h. Nombre d'arrêts par quartier
-# Tri : Nombre arrêts décroissant, puis nom quartier
-res_h = db.Arrets.aggregate([
-    {"$unwind": "$quartiers"},
-    {"$group": {"_id": "$quartiers.nom", "arret_count": {"$sum": 1}}},
-    {"$project": {"quartier_nom": "$_id", "arret_count": 1}},
-    {"$sort": {"arret_count": -1, "quartier_nom": 1}}
-])
-export_to_csv(res_h, "mongo_requete_h.csv", ["quartier_nom", "arret_count"])
-
-# i. Corrélation (CO2 vs Retard par ligne et jour)
-# On récupère le nom de ligne pour pouvoir trier
-data_i = db.Trafic.aggregate([
-    {"$project": {"id_ligne": 1, "retard": "$retard_minutes", "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$horodatage"}}}},
-    {"$lookup": {
-        "from": "Arrets",
-        "let": {"l_id": "$id_ligne", "t_date": "$date"},
-        "pipeline": [
-            {"$match": {"$expr": {"$eq": ["$id_ligne", "$$l_id"]}}},
-            {"$unwind": "$capteurs"},
-            {"$match": {"capteurs.type_capteur": "CO2"}},
-            {"$unwind": "$capteurs.mesures"},
-            {"$match": {"$expr": {"$eq": [{"$dateToString": {"format": "%Y-%m-%d", "date": "$capteurs.mesures.horodatage"}}, "$$t_date"]}}}
-        ],
-        "as": "mesures_sync"
-    }},
-    {"$unwind": "$mesures_sync"},
-    {"$group": {
-        "_id": "$id_ligne",
-        "valeurs": {"$push": "$mesures_sync.capteurs.mesures.valeur"},
-        "retards": {"$push": "$retard"}
-    }},
-    # Récupérer le nom de la ligne pour le tri final
-    {"$lookup": {"from": "Lignes", "localField": "_id", "foreignField": "id_ligne", "as": "l"}},
-    {"$unwind": "$l"}
-])
-
-# Calcul de corrélation via Pandas
-list_i = []
-for doc in data_i:
-    if len(doc['valeurs']) > 1:
-        corr = pd.Series(doc['valeurs']).corr(pd.Series(doc['retards']))
-        list_i.append({"nom_ligne": doc['l']['nom_ligne'], "correlation": corr})
-
-# Tri : Alphabétique par nom_ligne
-list_i.sort(key=lambda x: x['nom_ligne'])
-
-pd.DataFrame(list_i, columns=["nom_ligne", "correlation"]).to_csv(
-    os.path.join(EXPORT_DIR, "mongo_requete_i.csv"), index=False
-)
-
-# j. Moyenne de température par ligne
-# Tri : Alphabétique par nom_ligne
-res_j = db.Arrets.aggregate([
-    {"$unwind": "$capteurs"},
-    {"$match": {"capteurs.type_capteur": "Temperature"}},
-    {"$unwind": "$capteurs.mesures"},
-    {"$group": {"_id": "$id_ligne", "avg_temp": {"$avg": "$capteurs.mesures.valeur"}}},
-    {"$lookup": {"from": "Lignes", "localField": "_id", "foreignField": "id_ligne", "as": "l"}},
-    {"$unwind": "$l"},
-    {"$project": {"nom_ligne": "$l.nom_ligne", "avg_temperature": "$avg_temp"}},
-    {"$sort": {"nom_ligne": 1}}
-])
-export_to_csv(res_j, "mongo_requete_j.csv", ["nom_ligne", "avg_temperature"])
-
-# k. Performance chauffeur (retard moyen)
-# Correction : S'assurer que le scope est identique au SQL (Vehicules -> Lignes -> Trafic existant)
-res_k = db.Vehicules.aggregate([
-    # 1. Récupérer le nom du chauffeur
-    {"$project": {
-        "id_ligne": 1,
-        "chauffeur_nom": "$chauffeur.nom",
-        "id_chauffeur": "$chauffeur.id_chauffeur"
-    }},
-    # 2. Joindre le trafic de la ligne correspondante
-    {"$lookup": {
-        "from": "Trafic",
-        "localField": "id_ligne",
-        "foreignField": "id_ligne",
-        "as": "t"
-    }},
-    # 3. Unwind : Cela agit comme un INNER JOIN. Si 't' est vide (pas de trafic), le chauffeur est exclu.
-    {"$unwind": "$t"},
-    # 4. Groupement
-    {"$group": {
-        "_id": "$id_chauffeur", 
-        "nom": {"$first": "$chauffeur_nom"},
-        "avg_retard": {"$avg": "$t.retard_minutes"}
-    }},
-    {"$project": {
-        "chauffeur_nom": "$nom", 
-        "avg_retard_minutes": "$avg_retard"
-    }},
-    {"$sort": {"chauffeur_nom": 1}}
-])
-export_to_csv(res_k, "mongo_requete_k.csv", ["chauffeur_nom", "avg_retard_minutes"])
-
-# l. % véhicules électriques par ligne de bus
-# Tri : Alphabétique par nom_ligne
-res_l = db.Lignes.aggregate([
-    {"$match": {"type": "Bus"}},
-    {"$lookup": {"from": "Vehicules", "localField": "id_ligne", "foreignField": "id_ligne", "as": "v"}},
-    {"$project": {
-        "nom_ligne": 1,
-        "taux_electrique": {
-            "$cond": [
-                {"$gt": [{"$size": "$v"}, 0]},
-                {"$divide": [
-                    {"$size": {"$filter": {"input": "$v", "cond": {"$eq": ["$$this.type_vehicule", "Electrique"]}}}},
-                    {"$size": "$v"}
-                ]},
-                0
-            ]
-        }
-    }},
-    {"$sort": {"nom_ligne": 1}}
-])
-export_to_csv(res_l, "mongo_requete_l.csv", ["nom_ligne", "taux_electrique"])
-
-# m. Classification pollution avec localisation
-# Tri : Par id_capteur
-res_m = db.Arrets.aggregate([
-    {"$unwind": "$capteurs"},
-    {"$match": {"capteurs.type_capteur": "CO2"}},
-    {"$unwind": "$capteurs.mesures"},
-    {"$project": {
-        "id_capteur": "$capteurs.id_capteur",
-        "latitude": {"$arrayElemAt": ["$capteurs.location.coordinates", 1]},
-        "longitude": {"$arrayElemAt": ["$capteurs.location.coordinates", 0]},
-        "valeur": "$capteurs.mesures.valeur",
-        "niveau_pollution": {
-            "$switch": {
-                "branches": [
-                    {"case": {"$lt": ["$capteurs.mesures.valeur", 400]}, "then": "faible"},
-                    {"case": {"$lt": ["$capteurs.mesures.valeur", 500]}, "then": "moyen"}
-                ],
-                "default": "élevé"
-            }
-        }
-    }},
-    {"$sort": {"id_capteur": 1}}
-])
-export_to_csv(res_m, "mongo_requete_m.csv", ["id_capteur", "latitude", "longitude", "valeur", "niveau_pollution"])
-
-# n. Classification des lignes par retard moyen
-# Tri : Alphabétique par nom_ligne
-res_n = db.Trafic.aggregate([
-    {"$group": {"_id": "$id_ligne", "avg_r": {"$avg": "$retard_minutes"}}},
-    {"$lookup": {"from": "Lignes", "localField": "_id", "foreignField": "id_ligne", "as": "l"}},
-    {"$unwind": "$l"},
-    {"$project": {
-        "nom_ligne": "$l.nom_ligne",
-        "classification_retard": {
-            "$switch": {
-                "branches": [
-                    {"case": {"$lt": ["$avg_r", 6.5]}, "then": "retard moyen inf a 6min30"},
-                    {"case": {"$lt": ["$avg_r", 7]}, "then": "retard moyen inf a 7min"}
-                ],
-                "default": "retard moyen sup a 7min"
-            }
-        }
-    }},
-    {"$sort": {"nom_ligne": 1}}
-])
-export_to_csv(res_n, "mongo_requete_n.csv", ["nom_ligne", "classification_retard"])
-
-client.close()
\ No newline at end of file
+    path, count = write_csv(os.path.join(EXPORT_DIR, filename), columns, iter_mongo_rows(cursor, columns), compress=args.gzip, arrow=args.arrow)
+    print(f"✅ Exporté : {os.path.basename(path)}")
+    return path, count
+
+# Résultats du parcours unique d'Arrets, calculés par le premier thread qui en a besoin
+# (un échec du parcours est relevé pour chacune des requêtes fusionnées, sans relancer le parcours)
+_fused = {}
+_fused_error = []
+_fused_lock = threading.Lock()
+
+def fused_rows(name):
+    with _fused_lock:
+        if not _fused and not _fused_error:
+            names = [q["name"] for q in queries if q["name"] in FUSED_QUERIES]
+            try:
+                _fused.update(scan_arrets(db, names, max_time_ms=args.max_time_ms or None))
+            except PyMongoError as e:
+                _fused_error.append(e)
+        if _fused_error:
+            raise _fused_error[0]
+    return _fused[name]
+
+def run_query(query):
+    """Exécute (ou relit depuis le cache / la vue) une requête, exporte son CSV et renvoie sa durée."""
+    start = time.perf_counter()
+    row = {"requete": query["name"], "lignes": None, "duree_s": 0.0, "cache": False, "erreur": "", "path": None, "key": None}
+    try:
+        if args.vues:
+            # La vue n'est recalculée que si ses données ont changé ; l'export la relit
+            mode, _ = refresh(db, query, force=args.no_cache, max_time_ms=args.max_time_ms or None)
+            _, row["lignes"] = export_to_csv(read_view(db, query, args.max_time_ms or None), query["file"], query["columns"])
+            row["cache"] = mode == "à jour"
+        else:
+            row["key"] = query_key(mongo_version(db, query["inputs"]), {**definition(query), "gzip": args.gzip, "arrow": args.arrow})
+            cached = None if args.no_cache else lookup(cache, query["name"], row["key"])
+            if cached:
+                print(f"♻️  En cache : {os.path.basename(cached['path'])}")
+                row["lignes"], row["cache"] = cached["lignes"], True
+            else:
+                if args.fused and query["name"] in FUSED_QUERIES:
+                    cursor = fused_rows(query["name"])
+                else:
+                    cursor = execute(db, query, args.max_time_ms or None)
+                row["path"], row["lignes"] = export_to_csv(cursor, query["file"], query["columns"])
+    except ExecutionTimeout:
+        # Une requête trop lente n'interrompt pas les autres
+        row["erreur"] = f"maxTimeMS ({args.max_time_ms} ms) dépassé"
+        print(f"⏱️  Requête {query['name']} interrompue : {row['erreur']}")
+    except PyMongoError as e:
+        # Idem pour toute autre erreur serveur : le cache des autres requêtes est tout de même enregistré
+        row["erreur"] = f"{type(e).__name__} : {e}"
+        print(f"❌ Requête {query['name']} en échec : {row['erreur']}")
+    row["duree_s"] = time.perf_counter() - start
+    return row
+
+# --- REQUÊTES (déclarées dans mongo_registry.py) ---
+# Une requête n'est réexécutée que si les collections qu'elle lit (dernier
+# chargement + nombre de documents) ou sa définition ont changé. Les
+# requêtes sont indépendantes : elles sont soumises en même temps au serveur.
+queries = select_queries(args.queries)
+# Base migrée avant l'ajout du résumé par ligne (requêtes d, j) : on le construit une fois
+if any(ENV_SUMMARY_COLLECTION in q["inputs"] for q in queries) and db[ENV_SUMMARY_COLLECTION].estimated_document_count() == 0:
+    print(f"Construction de {ENV_SUMMARY_COLLECTION}...")
+    build_env_summary(db)
+
+cache = load_cache(EXPORT_DIR)
+start = time.perf_counter()
+with ThreadPoolExecutor(max_workers=max(1, min(args.workers, len(queries)))) as pool:
+    timings = list(pool.map(run_query, queries))
+wall = time.perf_counter() - start
+
+# Le cache n'est mis à jour qu'ici, après l'exécution concurrente
+for t in timings:
+    key, path = t.pop("key"), t.pop("path")
+    if path:
+        store(cache, t["requete"], key, path, t["lignes"])
+save_cache(EXPORT_DIR, cache)
+
+# Temps par requête (la durée totale tend vers celle de la plus lente)
+df_timings = pd.DataFrame(timings).sort_values("duree_s", ascending=False)
+print(df_timings.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+print(f"Servies depuis le cache : {int(df_timings['cache'].sum())}/{len(df_timings)}")
+print(f"Durée totale : {wall:.3f} s (somme des requêtes : {df_timings['duree_s'].sum():.3f} s)")
+
+client.close()
+if (df_timings["erreur"] != "").any():
+    sys.exit(1)
@@ -0,0 +1,180 @@
+"""
+Vues matérialisées des requêtes a–n (collections KPI_<requête>).
+
+Chaque requête du registre (mongo_registry.py) est matérialisée dans une
+collection que les lecteurs interrogent directement au lieu de relancer
+l'agrégation complète. La collection VuesKPI garde, pour chaque vue, le
+chargement (run_id), l'empreinte de la définition, le nombre de documents
+des collections lues et le filigrane (plus grand _id de Trafic déjà pris
+en compte).
+
+Rafraîchissement :
+- complet ($out, remplacement atomique) si la vue n'existe pas, si les
+  données ont été rechargées (migration, restauration), si la définition
+  a changé ou si une collection lue autre que Trafic a changé ;
+- par partition pour les requêtes déclarées `partition: "id_ligne"` (a, c,
+  f, n) : seules les lignes qui ont reçu des relevés Trafic depuis le
+  filigrane sont recalculées puis fusionnées ($merge, whenMatched: merge) ;
+- aucun si rien n'a changé.
+
+Utilisation :
+    python requetes_mongodb/vues_kpi.py            # rafraîchit toutes les vues
+    python requetes_mongodb/vues_kpi.py a c --full # recalcul complet de a et c
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+from pymongo import MongoClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mongo_registry import definition, execute, select_queries
+from outils.result_cache import mongo_version, query_key
+
+MONGO_URI = "mongodb://localhost:27017/"
+DB_NAME = "Paris2055"
+VIEWS_META = "VuesKPI"
+PARTITIONED_INPUT = "Trafic"
+
+
+def view_name(query):
+    return f"KPI_{query['name']}"
+
+
+def read_sort(query):
+    """Tri de lecture d'une vue : dernier $sort du pipeline, ordre d'insertion pour compute."""
+    if "compute" in query:
+        return [("_id", 1)]
+    sorts = [stage["$sort"] for stage in query["pipeline"] if "$sort" in stage]
+    sort = list(sorts[-1].items()) if sorts else []
+    if "partition" in query:
+        return sort or [("_id", 1)]
+    # Vue sans partition : l'_id d'origine est conservé dans _cle, _id suit l'ordre de sortie
+    return [("_cle" if field == "_id" else field, direction) for field, direction in sort] + [("_id", 1)]
+
+
+def view_pipeline(query):
+    """
+    Pipeline sans le $sort final : l'ordre est appliqué à la lecture (read_sort).
+    Une vue partitionnée garde la clé de groupe comme _id (cible du $merge) ;
+    les autres peuvent produire plusieurs documents de même _id (m : une
+    ligne par mesure), $out leur en attribue donc un nouveau.
+    """
+    pipeline = list(query["pipeline"])
+    if pipeline and "$sort" in pipeline[-1]:
+        pipeline.pop()
+    if "partition" not in query:
+        pipeline += [{"$addFields": {"_cle": "$_id"}}, {"$project": {"_id": 0}}]
+    return pipeline
+
+
+def trafic_watermark(db):
+    last = db[PARTITIONED_INPUT].find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    return last["_id"] if last else None
+
+
+def aggregate_options(query, max_time_ms=None):
+    options = {"allowDiskUse": True, **query.get("options", {})}
+    if max_time_ms:
+        options["maxTimeMS"] = max_time_ms
+    return options
+
+
+def full_refresh(db, query, max_time_ms=None):
+    view = view_name(query)
+    if "compute" in query:
+        # Résultat calculé côté client : _id = rang, pour conserver l'ordre du calcul
+        docs = [{"_id": k, **row} for k, row in enumerate(execute(db, query, max_time_ms))]
+        if not docs:
+            db[view].drop()  # une vue absente se lit comme une vue vide
+            return
+        # Écriture dans une collection temporaire puis renommage : comme $out, les lecteurs
+        # voient l'ancienne vue ou la nouvelle, jamais une vue vide ou partielle
+        tmp = db[f"{view}_tmp"]
+        tmp.drop()  # reste d'un rafraîchissement interrompu
+        tmp.insert_many(docs)
+        tmp.rename(view, dropTarget=True)
+    else:
+        db[query["collection"]].aggregate(view_pipeline(query) + [{"$out": view}], **aggregate_options(query, max_time_ms))
+
+
+def partition_refresh(db, query, lines, max_time_ms=None):
+    """Recalcule les lignes `lines` et les fusionne dans la vue (les autres lignes ne sont pas relues)."""
+    pipeline = [{"$match": {query["partition"]: {"$in": lines}}}] + view_pipeline(query)
+    pipeline.append({"$merge": {"into": view_name(query), "on": "_id",
+                                "whenMatched": "merge", "whenNotMatched": "insert"}})
+    db[query["collection"]].aggregate(pipeline, **aggregate_options(query, max_time_ms))
+
+
+def plan_refresh(db, query, meta, version, def_key):
+    """Renvoie ("complet" | "partition" | "à jour", lignes à recalculer)."""
+    if meta is None or meta["definition"] != def_key or meta["run_id"] != version["run_id"]:
+        return "complet", []
+    old_counts, new_counts = meta["counts"], version["counts"]
+    if "partition" not in query or meta.get("watermark") is None:
+        return ("à jour", []) if old_counts == new_counts else ("complet", [])
+    others_changed = any(old_counts.get(name) != n for name, n in new_counts.items() if name != PARTITIONED_INPUT)
+    if others_changed:
+        return "complet", []
+    new_docs = {"_id": {"$gt": meta["watermark"]}}
+    added = db[PARTITIONED_INPUT].count_documents(new_docs)
+    # Suppressions dans Trafic : le filigrane ne suffit plus
+    if new_counts[PARTITIONED_INPUT] != old_counts[PARTITIONED_INPUT] + added:
+        return "complet", []
+    if added == 0:
+        return "à jour", []
+    return "partition", db[PARTITIONED_INPUT].distinct(query["partition"], new_docs)
+
+
+def refresh(db, query, force=False, max_time_ms=None):
+    """
+    Met à jour la vue d'une requête ; renvoie (mode, nombre de lignes recalculées).
+    max_time_ms : délai maximal côté serveur (maxTimeMS) du recalcul.
+    """
+    meta = db[VIEWS_META].find_one({"_id": query["name"]})
+    version = mongo_version(db, query["inputs"])
+    def_key = query_key(None, definition(query))
+    # Filigrane lu avant le calcul : un relevé inséré pendant le calcul sera repris la fois suivante
+    watermark = trafic_watermark(db) if "partition" in query else None
+    mode, lines = ("complet", []) if force else plan_refresh(db, query, meta, version, def_key)
+    if mode == "complet":
+        full_refresh(db, query, max_time_ms)
+    elif mode == "partition":
+        partition_refresh(db, query, lines, max_time_ms)
+    if mode != "à jour":
+        db[VIEWS_META].replace_one({"_id": query["name"]}, {
+            "_id": query["name"], "definition": def_key, "run_id": version["run_id"],
+            "counts": version["counts"], "watermark": watermark, "maj": datetime.now(),
+        }, upsert=True)
+    return mode, len(lines)
+
+
+def read_view(db, query, max_time_ms=None):
+    """Curseur sur la vue d'une requête, dans l'ordre de la requête d'origine."""
+    return db[view_name(query)].find({}, sort=read_sort(query), max_time_ms=max_time_ms)
+
+
+def refresh_all(db, names=None, force=False):
+    timings = []
+    for query in select_queries(names):
+        start = time.perf_counter()
+        mode, n_lines = refresh(db, query, force)
+        timings.append({"requete": query["name"], "vue": view_name(query), "mode": mode,
+                        "lignes_recalculees": n_lines, "duree_s": time.perf_counter() - start})
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rafraîchit les vues matérialisées des requêtes a–n")
+    parser.add_argument("queries", nargs="*", help="Sous-ensemble de requêtes (par défaut : toutes)")
+    parser.add_argument("--full", action="store_true", help="Recalcul complet même si les données n'ont pas changé")
+    args = parser.parse_args()
+
+    client = MongoClient(MONGO_URI)
+    for row in refresh_all(client[DB_NAME], args.queries, args.full):
+        detail = f" ({row['lignes_recalculees']} ligne(s))" if row["mode"] == "partition" else ""
+        print(f"{row['vue']:<7}: {row['mode']}{detail} en {row['duree_s']:.3f} s")
+    client.close()
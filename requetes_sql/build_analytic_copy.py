@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Copie analytique de Paris2055.sqlite avec index couvrants.
+
+La base source n'est jamais modifiée : elle est ouverte en lecture seule
+et copiée via l'API de sauvegarde SQLite, puis la copie reçoit des index
+couvrants adaptés aux jointures de sql_registry.py et un ANALYZE.
+Les plans (EXPLAIN QUERY PLAN) et durées avant/après sont enregistrés
+dans un rapport.
+
+Utilisation :
+    python requetes_sql/build_analytic_copy.py
+    python requetes_sql/requete_sql.py --db data/Paris2055_analytique.sqlite
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from math import sqrt
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sql_registry import execute, select_queries, statements
+
+SQLITE_PATH = "data/Paris2055.sqlite"
+ANALYTIC_PATH = "data/Paris2055_analytique.sqlite"
+REPORT_PATH = "requetes_sql/rapport_copie_analytique.txt"
+
+# Index couvrants : chaque requête lit ses colonnes dans l'index sans revenir à la table
+COVERING_INDEXES = {
+    # Capteur filtré par type (d, e, i, j, m) -> id_capteur / id_arret / position
+    "idx_capteur_type": "Capteur(type_capteur, id_capteur, id_arret, latitude, longitude)",
+    # Mesures d'un capteur (d, e, i, j, m) sans lire la table Mesure
+    "idx_mesure_capteur": "Mesure(id_capteur, horodatage, valeur)",
+    # Trafic par ligne (a, c, f, i, k, n)
+    "idx_trafic_ligne": "Trafic(id_ligne, horodatage, retard_minutes)",
+    # Incidents d'un trafic (c, f)
+    "idx_incident_trafic": "Incident(id_trafic, id_incident)",
+    # Horaires d'un arrêt (b)
+    "idx_horaire_arret": "Horaire(id_arret, heure_prevue, passagers_estimes)",
+    # Arrêts d'une ligne
+    "idx_arret_ligne": "Arret(id_ligne, id_arret)",
+    # Arrêts d'un quartier (e, h)
+    "idx_arretquartier_quartier": "ArretQuartier(id_quartier, id_arret)",
+    # Véhicules d'une ligne (d, k, l)
+    "idx_vehicule_ligne": "Vehicule(id_ligne, type_vehicule, id_chauffeur, id_vehicule)",
+}
+
+
+def open_readonly(path):
+    conn = sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True)
+    conn.create_function("SQRT", 1, sqrt)
+    return conn
+
+
+def build_copy(source_path, target_path):
+    """Copie la base via l'API backup, ajoute les index couvrants puis ANALYZE."""
+    if os.path.exists(target_path):
+        os.remove(target_path)
+    source = open_readonly(source_path)
+    target = sqlite3.connect(target_path)
+    print(f"Copie {source_path} → {target_path} (API backup)...")
+    source.backup(target)
+    source.close()
+
+    for name, definition in COVERING_INDEXES.items():
+        print(f"  + {name} ON {definition}")
+        target.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+    print("ANALYZE...")
+    target.execute("ANALYZE")
+    target.commit()
+    target.close()
+
+
+def explain(conn, query):
+    """Plan d'exécution SQLite (colonne detail de EXPLAIN QUERY PLAN) de chaque SELECT de la requête."""
+    return [row[3] for sql in statements(query) for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+def time_query(conn, query):
+    start = time.perf_counter()
+    list(execute(conn, query))
+    return time.perf_counter() - start
+
+
+def compare_plans(source_path, target_path, queries):
+    """Plans et durées de chaque requête sur la source puis sur la copie analytique."""
+    source = open_readonly(source_path)
+    target = open_readonly(target_path)
+    report = []
+    for q in queries:
+        report.append({
+            "name": q["name"],
+            "title": q["title"],
+            "plan_avant": explain(source, q),
+            "plan_apres": explain(target, q),
+            "duree_avant": time_query(source, q),
+            "duree_apres": time_query(target, q),
+        })
+        r = report[-1]
+        print(f"{q['name']} : {r['duree_avant']:.3f} s → {r['duree_apres']:.3f} s")
+    source.close()
+    target.close()
+    return report
+
+
+def write_report(report, path):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("=" * 60 + "\n")
+        f.write("COPIE ANALYTIQUE : PLANS ET DURÉES AVANT / APRÈS\n")
+        f.write("=" * 60 + "\n")
+        for r in report:
+            gain = r["duree_avant"] / r["duree_apres"] if r["duree_apres"] > 0 else float("inf")
+            f.write(f"\n#{r['name']} - {r['title']}\n")
+            f.write(f"Durée : {r['duree_avant']:.3f} s → {r['duree_apres']:.3f} s (x{gain:.1f})\n")
+            f.write("Plan avant :\n")
+            f.writelines(f"  {line}\n" for line in r["plan_avant"])
+            f.write("Plan après :\n")
+            f.writelines(f"  {line}\n" for line in r["plan_apres"])
+        total_avant = sum(r["duree_avant"] for r in report)
+        total_apres = sum(r["duree_apres"] for r in report)
+        f.write("\n" + "=" * 60 + "\n")
+        f.write(f"Total : {total_avant:.3f} s → {total_apres:.3f} s\n")
+    print(f"✓ Rapport écrit dans {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Construit une copie analytique indexée de la base SQLite")
+    parser.add_argument("queries", nargs="*", help="Requêtes à comparer (par défaut : toutes)")
+    parser.add_argument("--source", default=SQLITE_PATH)
+    parser.add_argument("--target", default=ANALYTIC_PATH)
+    parser.add_argument("--no-compare", action="store_true", help="Construire la copie sans mesurer les plans")
+    args = parser.parse_args()
+
+    build_copy(args.source, args.target)
+    if not args.no_compare:
+        write_report(compare_plans(args.source, args.target, select_queries(args.queries)), REPORT_PATH)
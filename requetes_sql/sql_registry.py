@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+"""
+Registre déclaratif des requêtes SQL a–n (Partie 1).
+
+Chaque entrée décrit une requête :
+- name    : lettre de la requête (a–n)
+- title   : intitulé du sujet
+- sql     : texte SQL exécuté sur Paris2055.sqlite
+- columns : colonnes du CSV exporté (même schéma que les exports MongoDB)
+- sort    : contrat de tri [(colonne, "asc"|"desc"), ...]
+- file    : nom du fichier CSV exporté
+- compute : (optionnel) fonction Python qui calcule le résultat à partir
+            des requêtes listées dans sql, au lieu d'exécuter un seul SELECT
+- summary_sql : (optionnel) même résultat lu dans ResumeTraficLigne, utilisé
+            quand les tables de synthèse sont installées (summary_tables.py)
+"""
+
+import pandas as pd
+
+from outils.correlation import combine_daily, correlation_by_line, daily_aggregates
+
+CHUNK_SIZE = 200_000
+
+# Requête i : un balayage linéaire par côté de la corrélation
+CO2_BY_LINE_DAY_SQL = """
+    SELECT Arret.id_ligne, DATE(Mesure.horodatage) AS jour, Mesure.valeur
+    FROM Mesure
+    JOIN Capteur ON Mesure.id_capteur = Capteur.id_capteur
+    JOIN Arret ON Capteur.id_arret = Arret.id_arret
+    WHERE Capteur.type_capteur = 'CO2'
+"""
+RETARD_BY_LINE_DAY_SQL = """
+    SELECT id_ligne, DATE(horodatage) AS jour, retard_minutes
+    FROM Trafic
+"""
+
+
+def read_daily(conn, sql):
+    """Lit (ligne, jour, valeur) par blocs et renvoie les agrégats par (ligne, jour)."""
+    return combine_daily(
+        daily_aggregates(chunk.iloc[:, 0], chunk.iloc[:, 1], chunk.iloc[:, 2])
+        for chunk in pd.read_sql_query(sql, conn, chunksize=CHUNK_SIZE)
+    )
+
+
+def compute_correlation(conn):
+    """Requête i : corrélation CO2 / retard par ligne à partir des agrégats journaliers."""
+    lignes = pd.read_sql_query("SELECT id_ligne, nom_ligne FROM Ligne", conn)
+    result = correlation_by_line(read_daily(conn, CO2_BY_LINE_DAY_SQL), read_daily(conn, RETARD_BY_LINE_DAY_SQL), lignes)
+    return [(nom, None if pd.isna(corr) else float(corr)) for nom, corr in result.itertuples(index=False)]
+
+
+QUERIES = [
+    #%% a - Moyenne des retards par ligne
+    # Tri : Alphabétique par nom de ligne
+    {
+        "name": "a",
+        "title": "Moyenne des retards par ligne",
+        "sql": """
+            SELECT nom_ligne, AVG(retard_minutes) AS avg_retard
+            FROM Ligne
+            LEFT JOIN Trafic ON Ligne.id_ligne = Trafic.id_ligne
+            GROUP BY Ligne.id_ligne
+            ORDER BY nom_ligne ASC
+        """,
+        "summary_sql": """
+            SELECT nom_ligne, CAST(r.somme_retards AS FLOAT) / r.nb_retards AS avg_retard
+            FROM Ligne
+            LEFT JOIN ResumeTraficLigne r ON Ligne.id_ligne = r.id_ligne
+            ORDER BY nom_ligne ASC
+        """,
+        "columns": ["nom_ligne", "avg_retard"],
+        "sort": [("nom_ligne", "asc")],
+        "file": "requete_a.csv",
+    },
+    #%% b - Nombre moyen de passagers par jour et par ligne
+    # Tri : Alphabétique par ligne, puis chronologique
+    {
+        "name": "b",
+        "title": "Nombre moyen de passagers par jour et par ligne",
+        "sql": """
+            SELECT
+                nom_ligne,
+                DATE(heure_prevue) AS jour,
+                AVG(passagers_estimes) AS avg_passagers
+            FROM Horaire
+            LEFT JOIN Arret ON Horaire.id_arret = Arret.id_arret
+            LEFT JOIN Ligne ON Arret.id_ligne = Ligne.id_ligne
+            GROUP BY Ligne.id_ligne, jour
+            ORDER BY nom_ligne ASC, jour ASC
+        """,
+        "columns": ["nom_ligne", "jour", "avg_passagers"],
+        "sort": [("nom_ligne", "asc"), ("jour", "asc")],
+        "file": "requete_b.csv",
+    },
+    #%% c - Taux d'incidents par ligne (Corrigé)
+    # Correction : Utilisation de COUNT(DISTINCT Trafic.id_trafic) pour le dénominateur
+    # afin d'éviter de compter plusieurs fois le même trajet s'il a plusieurs incidents.
+    {
+        "name": "c",
+        "title": "Taux d'incidents par ligne",
+        "sql": """
+            SELECT
+                nom_ligne,
+                CAST(COUNT(id_incident) AS FLOAT) / NULLIF(COUNT(DISTINCT Trafic.id_trafic), 0) AS incident_taux
+            FROM Ligne
+            LEFT JOIN Trafic ON Ligne.id_ligne = Trafic.id_ligne
+            LEFT JOIN Incident ON Trafic.id_trafic = Incident.id_trafic
+            GROUP BY Ligne.id_ligne
+            ORDER BY nom_ligne ASC
+        """,
+        "summary_sql": """
+            SELECT
+                nom_ligne,
+                CAST(r.nb_incidents AS FLOAT) / NULLIF(r.nb_releves, 0) AS incident_taux
+            FROM Ligne
+            LEFT JOIN ResumeTraficLigne r ON Ligne.id_ligne = r.id_ligne
+            ORDER BY nom_ligne ASC
+        """,
+        "columns": ["nom_ligne", "incident_taux"],
+        "sort": [("nom_ligne", "asc")],
+        "file": "requete_c.csv",
+    },
+    #%% d - Emissions moyennes CO2 par véhicule
+    # Tri : Par immatriculation
+    # Optimisation : la moyenne CO2 d'un véhicule est celle de sa ligne. Elle est calculée
+    # une fois par ligne (co2_ligne) au lieu de dupliquer chaque mesure pour chaque véhicule
+    # de la ligne. Les mesures des lignes sans véhicule (ou sans ligne) forment, comme avec
+    # le LEFT JOIN d'origine, un groupe à immatriculation NULL.
+    {
+        "name": "d",
+        "title": "Emissions moyennes de CO2 par véhicule",
+        "sql": """
+            WITH co2_ligne AS (
+                SELECT Ligne.id_ligne AS id_ligne, TOTAL(valeur) AS somme, COUNT(valeur) AS n
+                FROM Mesure
+                LEFT JOIN Capteur ON Mesure.id_capteur = Capteur.id_capteur
+                LEFT JOIN Arret ON Capteur.id_arret = Arret.id_arret
+                LEFT JOIN Ligne ON Arret.id_ligne = Ligne.id_ligne
+                WHERE type_capteur = 'CO2'
+                GROUP BY Ligne.id_ligne
+            )
+            SELECT immatriculation, type_vehicule, somme / n AS avg_co2
+            FROM co2_ligne
+            JOIN Vehicule ON Vehicule.id_ligne = co2_ligne.id_ligne
+            UNION ALL
+            SELECT NULL, NULL, avg_co2
+            FROM (
+                SELECT TOTAL(somme) / SUM(n) AS avg_co2, COUNT(*) AS nb_lignes
+                FROM co2_ligne
+                WHERE NOT EXISTS (SELECT 1 FROM Vehicule WHERE Vehicule.id_ligne = co2_ligne.id_ligne)
+            )
+            WHERE nb_lignes > 0
+            ORDER BY immatriculation ASC
+        """,
+        "columns": ["immatriculation", "type_vehicule", "avg_co2"],
+        "sort": [("immatriculation", "asc")],
+        "file": "requete_d.csv",
+    },
+    #%% e - Top 5 quartiers bruyants
+    # Tri : Valeur décroissante, puis nom de quartier (pour égalité)
+    {
+        "name": "e",
+        "title": "Top 5 des quartiers les plus bruyants",
+        "sql": """
+            SELECT Quartier.nom, AVG(valeur) AS avg_bruit
+            FROM Mesure
+            LEFT JOIN Capteur ON Mesure.id_capteur = Capteur.id_capteur
+            LEFT JOIN Arret ON Capteur.id_arret = Arret.id_arret
+            LEFT JOIN ArretQuartier ON Arret.id_arret = ArretQuartier.id_arret
+            LEFT JOIN Quartier ON ArretQuartier.id_quartier = Quartier.id_quartier
+            WHERE type_capteur = 'Bruit'
+            GROUP BY Quartier.id_quartier
+            ORDER BY avg_bruit DESC, Quartier.nom ASC
+            LIMIT 5
+        """,
+        "columns": ["quartier_nom", "avg_bruit"],
+        "sort": [("avg_bruit", "desc"), ("quartier_nom", "asc")],
+        "file": "requete_e.csv",
+    },
+    #%% f - Lignes sans incident mais retards > 10 min
+    # Tri : Alphabétique par nom de ligne
+    {
+        "name": "f",
+        "title": "Lignes sans incident mais avec retards > 10 min",
+        "sql": """
+            SELECT DISTINCT nom_ligne
+            FROM Ligne
+            LEFT JOIN Trafic ON Ligne.id_ligne = Trafic.id_ligne
+            LEFT JOIN Incident ON Trafic.id_trafic = Incident.id_trafic
+            WHERE retard_minutes > 10 AND id_incident IS NULL
+            ORDER BY nom_ligne ASC
+        """,
+        "summary_sql": """
+            SELECT DISTINCT nom_ligne
+            FROM Ligne
+            JOIN ResumeTraficLigne r ON Ligne.id_ligne = r.id_ligne
+            WHERE r.nb_retard_sup_10_sans_incident > 0
+            ORDER BY nom_ligne ASC
+        """,
+        "columns": ["nom_ligne"],
+        "sort": [("nom_ligne", "asc")],
+        "file": "requete_f.csv",
+    },
+    #%% g - Taux de ponctualité global
+    {
+        "name": "g",
+        "title": "Taux de ponctualité global",
+        "sql": """
+            SELECT (COUNT(CASE WHEN retard_minutes = 0 THEN 1 END) * 1.0 / COUNT(*)) AS taux_sans_retard
+            FROM Trafic
+        """,
+        "summary_sql": """
+            SELECT SUM(nb_sans_retard) * 1.0 / SUM(nb_releves) AS taux_sans_retard
+            FROM ResumeTraficLigne
+        """,
+        "columns": ["taux_sans_retard"],
+        "sort": [],
+        "file": "requete_g.csv",
+    },
+    #%% h - Nombre d'arrêts par quartier
+    # Tri : Nombre d'arrêts décroissant, puis nom quartier
+    {
+        "name": "h",
+        "title": "Nombre d'arrêts par quartier",
+        "sql": """
+            SELECT Quartier.nom, COUNT(id_arret) AS arret_count
+            FROM Quartier
+            LEFT JOIN ArretQuartier ON Quartier.id_quartier = ArretQuartier.id_quartier
+            GROUP BY Quartier.id_quartier
+            ORDER BY arret_count DESC, Quartier.nom ASC
+        """,
+        "columns": ["quartier_nom", "arret_count"],
+        "sort": [("arret_count", "desc"), ("quartier_nom", "asc")],
+        "file": "requete_h.csv",
+    },
+    #%% i - Corrélation Trafic/Pollution
+    # Tri : Alphabétique par nom de ligne
+    # Optimisation : au lieu de joindre chaque mesure CO2 à chaque relevé de trafic
+    # du même jour (mesures × relevés par ligne et par jour), chaque côté est lu en
+    # un seul balayage puis réduit en agrégats par (ligne, jour) (voir outils/correlation.py).
+    {
+        "name": "i",
+        "title": "Corrélation trafic / pollution",
+        "sql": [CO2_BY_LINE_DAY_SQL, RETARD_BY_LINE_DAY_SQL],
+        "compute": compute_correlation,
+        "columns": ["nom_ligne", "correlation"],
+        "sort": [("nom_ligne", "asc")],
+        "file": "requete_i.csv",
+    },
+    #%% j - Température moyenne par ligne
+    # Tri : Alphabétique par nom de ligne
+    {
+        "name": "j",
+        "title": "Température moyenne par ligne",
+        "sql": """
+            SELECT nom_ligne, AVG(valeur) AS avg_temperature
+            FROM Mesure
+            LEFT JOIN Capteur ON Mesure.id_capteur = Capteur.id_capteur
+            LEFT JOIN Arret ON Capteur.id_arret = Arret.id_arret
+            LEFT JOIN Ligne ON Arret.id_ligne = Ligne.id_ligne
+            WHERE type_capteur = 'Temperature'
+            GROUP BY Ligne.id_ligne
+            ORDER BY nom_ligne ASC
+        """,
+        "columns": ["nom_ligne", "avg_temperature"],
+        "sort": [("nom_ligne", "asc")],
+        "file": "requete_j.csv",
+    },
+    #%% k - Retard moyen par chauffeur (Corrigé)
+    # Correction :
+    # 1. On part de la table Vehicule (comme en Mongo) pour assurer le même périmètre.
+    # 2. On utilise INNER JOIN sur Trafic pour ne garder que les lignes ayant réellement circulé
+    #    (similaire au comportement par défaut de $unwind en Mongo qui supprime les vides).
+    {
+        "name": "k",
+        "title": "Retard moyen par chauffeur",
+        "sql": """
+            SELECT
+                Chauffeur.nom,
+                AVG(Trafic.retard_minutes) AS avg_retard_minutes
+            FROM Vehicule
+            INNER JOIN Chauffeur ON Vehicule.id_chauffeur = Chauffeur.id_chauffeur
+            INNER JOIN Ligne ON Vehicule.id_ligne = Ligne.id_ligne
+            INNER JOIN Trafic ON Ligne.id_ligne = Trafic.id_ligne
+            GROUP BY Chauffeur.id_chauffeur
+            ORDER BY Chauffeur.nom ASC
+        """,
+        "columns": ["chauffeur_nom", "avg_retard_minutes"],
+        "sort": [("chauffeur_nom", "asc")],
+        "file": "requete_k.csv",
+    },
+    #%% l - % véhicules électriques par ligne de bus
+    # Tri : Alphabétique par nom de ligne
+    {
+        "name": "l",
+        "title": "% de véhicules électriques par ligne de bus",
+        "sql": """
+            SELECT
+                Ligne.nom_ligne,
+                (COUNT(CASE WHEN Vehicule.type_vehicule = 'Electrique' THEN 1 END) * 1.0 / COUNT(*)) AS taux_electrique
+            FROM Vehicule
+            JOIN Ligne ON Vehicule.id_ligne = Ligne.id_ligne
+            WHERE Ligne.type = 'Bus'
+            GROUP BY Ligne.id_ligne
+            ORDER BY nom_ligne ASC
+        """,
+        "columns": ["nom_ligne", "taux_electrique"],
+        "sort": [("nom_ligne", "asc")],
+        "file": "requete_l.csv",
+    },
+    #%% m - Classification pollution
+    # Tri : Par ID Capteur pour cohérence
+    {
+        "name": "m",
+        "title": "Classification pollution avec localisation",
+        "sql": """
+            SELECT
+                Capteur.id_capteur,
+                Capteur.latitude,
+                Capteur.longitude,
+                Mesure.valeur,
+                CASE
+                    WHEN Mesure.valeur < 400 THEN 'faible'
+                    WHEN Mesure.valeur < 500 THEN 'moyen'
+                    ELSE 'élevé'
+                END AS niveau_pollution
+            FROM Mesure
+            JOIN Capteur ON Mesure.id_capteur = Capteur.id_capteur
+            WHERE Capteur.type_capteur = 'CO2'
+            ORDER BY Capteur.id_capteur ASC
+        """,
+        "columns": ["id_capteur", "latitude", "longitude", "valeur", "niveau_pollution"],
+        "sort": [("id_capteur", "asc")],
+        "file": "requete_m.csv",
+    },
+    #%% n - Classification retard par ligne
+    # Tri : Alphabétique par nom de ligne
+    {
+        "name": "n",
+        "title": "Classification des lignes par retard moyen",
+        "sql": """
+            SELECT nom_ligne,
+                   CASE
+                       WHEN AVG(retard_minutes) < 6.5 THEN 'retard moyen inf a 6min30'
+                       WHEN AVG(retard_minutes) < 7 THEN 'retard moyen inf a 7min'
+                       ELSE 'retard moyen sup a 7min'
+                   END AS classification_retard
+            FROM Ligne
+            LEFT JOIN Trafic ON Ligne.id_ligne = Trafic.id_ligne
+            GROUP BY Ligne.id_ligne
+            ORDER BY nom_ligne ASC
+        """,
+        "summary_sql": """
+            SELECT nom_ligne,
+                   CASE
+                       WHEN CAST(r.somme_retards AS FLOAT) / r.nb_retards < 6.5 THEN 'retard moyen inf a 6min30'
+                       WHEN CAST(r.somme_retards AS FLOAT) / r.nb_retards < 7 THEN 'retard moyen inf a 7min'
+                       ELSE 'retard moyen sup a 7min'
+                   END AS classification_retard
+            FROM Ligne
+            LEFT JOIN ResumeTraficLigne r ON Ligne.id_ligne = r.id_ligne
+            ORDER BY nom_ligne ASC
+        """,
+        "columns": ["nom_ligne", "classification_retard"],
+        "sort": [("nom_ligne", "asc")],
+        "file": "requete_n.csv",
+    },
+]
+
+QUERIES_BY_NAME = {q["name"]: q for q in QUERIES}
+
+
+def select_queries(names=None):
+    """Renvoie les entrées du registre demandées (toutes si names est vide)."""
+    if not names:
+        return list(QUERIES)
+    unknown = [n for n in names if n not in QUERIES_BY_NAME]
+    if unknown:
+        raise ValueError(f"Requête(s) inconnue(s) : {', '.join(unknown)}")
+    return [QUERIES_BY_NAME[n] for n in names]
+
+
+def statements(query, summary=False):
+    """Liste des SELECT exécutés par une entrée du registre (variante synthèse si demandée et disponible)."""
+    if summary and "summary_sql" in query:
+        return [query["summary_sql"]]
+    return query["sql"] if isinstance(query["sql"], list) else [query["sql"]]
+
+
+def execute(conn, query, summary=False):
+    """Exécute une entrée du registre et renvoie un itérable de tuples (curseur ou liste)."""
+    if "compute" in query:
+        return query["compute"](conn)
+    return conn.execute(statements(query, summary)[0])
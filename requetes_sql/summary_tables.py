@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Tables de synthèse SQLite maintenues par triggers (optionnelles).
+
+Les requêtes a, c, f, g et n parcourent tout Trafic (et Incident) pour
+calculer des moyennes et des comptages par ligne. La table
+ResumeTraficLigne garde ces agrégats par id_ligne :
+
+- nb_releves                     : relevés de trafic
+- nb_retards                     : relevés dont retard_minutes n'est pas NULL
+- somme_retards                  : somme des retard_minutes
+- nb_sans_retard                 : relevés avec retard_minutes = 0
+- nb_incidents                   : incidents rattachés aux relevés de la ligne
+- nb_retard_sup_10_sans_incident : relevés avec retard > 10 et aucun incident
+
+Des triggers INSERT / UPDATE / DELETE sur Trafic et Incident la tiennent
+à jour ; une fois installée, requete_sql.py lit quelques dizaines de
+lignes au lieu de balayer Trafic. `check` compare la table à un
+recalcul complet.
+
+Utilisation :
+    python requetes_sql/summary_tables.py install
+    python requetes_sql/summary_tables.py check
+    python requetes_sql/summary_tables.py drop
+"""
+
+import argparse
+import sqlite3
+import sys
+
+SQLITE_PATH = "data/Paris2055.sqlite"
+SUMMARY_TABLE = "ResumeTraficLigne"
+SUMMARY_COLUMNS = ["id_ligne", "nb_releves", "nb_retards", "somme_retards", "nb_sans_retard",
+                   "nb_incidents", "nb_retard_sup_10_sans_incident"]
+
+# id_ligne n'est pas une clé primaire : les relevés sans ligne (NULL) ont aussi leur
+# ligne de synthèse (la requête g compte tout Trafic), d'où les comparaisons avec IS.
+CREATE_TABLE_SQL = f"""
+    CREATE TABLE {SUMMARY_TABLE} (
+        id_ligne INTEGER,
+        nb_releves INTEGER NOT NULL DEFAULT 0,
+        nb_retards INTEGER NOT NULL DEFAULT 0,
+        somme_retards NUMERIC NOT NULL DEFAULT 0,
+        nb_sans_retard INTEGER NOT NULL DEFAULT 0,
+        nb_incidents INTEGER NOT NULL DEFAULT 0,
+        nb_retard_sup_10_sans_incident INTEGER NOT NULL DEFAULT 0
+    )
+"""
+CREATE_INDEX_SQL = f"CREATE UNIQUE INDEX idx_{SUMMARY_TABLE.lower()}_ligne ON {SUMMARY_TABLE}(id_ligne)"
+# Les triggers comptent les incidents d'un relevé à chaque écriture sur Trafic
+INCIDENT_INDEX = "idx_resume_incident_trafic"
+CREATE_INCIDENT_INDEX_SQL = f"CREATE INDEX IF NOT EXISTS {INCIDENT_INDEX} ON Incident(id_trafic)"
+
+# Recalcul complet (remplissage initial et contrôle de cohérence)
+RECOMPUTE_SQL = """
+    SELECT
+        t.id_ligne,
+        COUNT(*),
+        COUNT(t.retard_minutes),
+        IFNULL(SUM(t.retard_minutes), 0),
+        SUM(CASE WHEN t.retard_minutes = 0 THEN 1 ELSE 0 END),
+        IFNULL(SUM(i.n), 0),
+        SUM(CASE WHEN t.retard_minutes > 10 AND i.n IS NULL THEN 1 ELSE 0 END)
+    FROM Trafic t
+    LEFT JOIN (SELECT id_trafic, COUNT(*) AS n FROM Incident GROUP BY id_trafic) i ON i.id_trafic = t.id_trafic
+    GROUP BY t.id_ligne
+"""
+
+
+def _apply_trafic(row, sign):
+    """UPDATE qui ajoute (sign = +) ou retire (sign = -) le relevé `row` (NEW ou OLD) de sa ligne."""
+    incidents = f"(SELECT COUNT(*) FROM Incident WHERE id_trafic = {row}.id_trafic)"
+    return f"""
+        UPDATE {SUMMARY_TABLE} SET
+            nb_releves = nb_releves {sign} 1,
+            nb_retards = nb_retards {sign} (CASE WHEN {row}.retard_minutes IS NULL THEN 0 ELSE 1 END),
+            somme_retards = somme_retards {sign} IFNULL({row}.retard_minutes, 0),
+            nb_sans_retard = nb_sans_retard {sign} (CASE WHEN {row}.retard_minutes = 0 THEN 1 ELSE 0 END),
+            nb_incidents = nb_incidents {sign} {incidents},
+            nb_retard_sup_10_sans_incident = nb_retard_sup_10_sans_incident
+                {sign} (CASE WHEN {row}.retard_minutes > 10 AND {incidents} = 0 THEN 1 ELSE 0 END)
+        WHERE id_ligne IS {row}.id_ligne;"""
+
+
+def _ensure_row(row):
+    return f"""
+        INSERT INTO {SUMMARY_TABLE} (id_ligne)
+        SELECT {row}.id_ligne WHERE NOT EXISTS (SELECT 1 FROM {SUMMARY_TABLE} WHERE id_ligne IS {row}.id_ligne);"""
+
+
+def _drop_empty_row(row):
+    return f"""
+        DELETE FROM {SUMMARY_TABLE} WHERE id_ligne IS {row}.id_ligne AND nb_releves = 0;"""
+
+
+def _apply_incident(row, sign, remaining):
+    """
+    UPDATE qui ajoute ou retire l'incident `row` sur la ligne de son relevé.
+    `remaining` : nombre d'incidents du relevé (après l'opération) pour lequel
+    le relevé entre ou sort de la catégorie « retard > 10 sans incident ».
+    """
+    trafic = f"FROM Trafic WHERE id_trafic = {row}.id_trafic"
+    flip = "-" if sign == "+" else "+"
+    return f"""
+        UPDATE {SUMMARY_TABLE} SET
+            nb_incidents = nb_incidents {sign} 1,
+            nb_retard_sup_10_sans_incident = nb_retard_sup_10_sans_incident
+                {flip} (CASE WHEN (SELECT retard_minutes {trafic}) > 10
+                         AND (SELECT COUNT(*) FROM Incident WHERE id_trafic = {row}.id_trafic) = {remaining}
+                    THEN 1 ELSE 0 END)
+        WHERE EXISTS (SELECT 1 {trafic}) AND id_ligne IS (SELECT id_ligne {trafic});"""
+
+
+TRIGGERS = {
+    "trg_resume_trafic_insert": f"""
+        CREATE TRIGGER trg_resume_trafic_insert AFTER INSERT ON Trafic BEGIN
+            {_ensure_row("NEW")}
+            {_apply_trafic("NEW", "+")}
+        END""",
+    "trg_resume_trafic_delete": f"""
+        CREATE TRIGGER trg_resume_trafic_delete AFTER DELETE ON Trafic BEGIN
+            {_apply_trafic("OLD", "-")}
+            {_drop_empty_row("OLD")}
+        END""",
+    "trg_resume_trafic_update": f"""
+        CREATE TRIGGER trg_resume_trafic_update AFTER UPDATE OF id_trafic, id_ligne, retard_minutes ON Trafic BEGIN
+            {_apply_trafic("OLD", "-")}
+            {_drop_empty_row("OLD")}
+            {_ensure_row("NEW")}
+            {_apply_trafic("NEW", "+")}
+        END""",
+    # Premier incident d'un relevé : il sort de « retard > 10 sans incident »
+    "trg_resume_incident_insert": f"""
+        CREATE TRIGGER trg_resume_incident_insert AFTER INSERT ON Incident BEGIN
+            {_apply_incident("NEW", "+", 1)}
+        END""",
+    # Dernier incident supprimé : il y revient
+    "trg_resume_incident_delete": f"""
+        CREATE TRIGGER trg_resume_incident_delete AFTER DELETE ON Incident BEGIN
+            {_apply_incident("OLD", "-", 0)}
+        END""",
+    "trg_resume_incident_update": f"""
+        CREATE TRIGGER trg_resume_incident_update AFTER UPDATE OF id_trafic ON Incident
+        WHEN OLD.id_trafic IS NOT NEW.id_trafic BEGIN
+            {_apply_incident("OLD", "-", 0)}
+            {_apply_incident("NEW", "+", 1)}
+        END""",
+}
+
+
+def has_summary_tables(conn):
+    """True si la table de synthèse et tous ses triggers sont installés."""
+    names = {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")}
+    return SUMMARY_TABLE in names and set(TRIGGERS) <= names
+
+
+def drop(conn):
+    with conn:
+        for name in TRIGGERS:
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.execute(f"DROP TABLE IF EXISTS {SUMMARY_TABLE}")
+        conn.execute(f"DROP INDEX IF EXISTS {INCIDENT_INDEX}")
+
+
+def install(conn):
+    """(Ré)crée la table de synthèse, la remplit par un recalcul complet et pose les triggers."""
+    drop(conn)
+    with conn:
+        conn.execute(CREATE_TABLE_SQL)
+        conn.execute(CREATE_INDEX_SQL)
+        conn.execute(CREATE_INCIDENT_INDEX_SQL)
+        conn.execute(f"INSERT INTO {SUMMARY_TABLE} ({', '.join(SUMMARY_COLUMNS)}) {RECOMPUTE_SQL}")
+        for sql in TRIGGERS.values():
+            conn.execute(sql)
+    return conn.execute(f"SELECT COUNT(*) FROM {SUMMARY_TABLE}").fetchone()[0]
+
+
+def check(conn):
+    """Lignes de synthèse qui diffèrent d'un recalcul complet : (manquantes ou fausses, en trop)."""
+    stored = f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM {SUMMARY_TABLE}"
+    missing = conn.execute(f"{RECOMPUTE_SQL} EXCEPT {stored}").fetchall()
+    extra = conn.execute(f"{stored} EXCEPT {RECOMPUTE_SQL}").fetchall()
+    return missing, extra
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tables de synthèse SQLite maintenues par triggers")
+    parser.add_argument("action", choices=["install", "check", "drop"])
+    parser.add_argument("--db", default=SQLITE_PATH)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    if args.action == "install":
+        print(f"✓ {SUMMARY_TABLE} installée ({install(conn)} ligne(s)) et {len(TRIGGERS)} triggers posés")
+    elif args.action == "drop":
+        drop(conn)
+        print(f"✓ {SUMMARY_TABLE} et ses triggers supprimés")
+    else:
+        if not has_summary_tables(conn):
+            print(f"⚠️ {SUMMARY_TABLE} n'est pas installée (action install)")
+            sys.exit(1)
+        missing, extra = check(conn)
+        for row in missing:
+            print(f"  attendu : {row}")
+        for row in extra:
+            print(f"  stocké  : {row}")
+        if missing or extra:
+            print(f"⚠️ {len(missing) + len(extra)} écart(s) avec le recalcul complet")
+            sys.exit(1)
+        print(f"✓ {SUMMARY_TABLE} cohérente avec Trafic et Incident")
+    conn.close()
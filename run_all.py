@@ -1,6 +1,5 @@
 import subprocess
 import sys
-import time
 import signal
 import os
 
@@ -19,8 +18,6 @@ if __name__ == "__main__":
     main_app = subprocess.Popen([sys.executable, "main.py"])
     processes.append(main_app)
     
-    time.sleep(2)
-    
     print("📊 Démarrage du dashboard (port 8051)...")
     dashboard_app = subprocess.Popen([sys.executable, "dashboard/dashboard.py"])
     processes.append(dashboard_app)